@@ -0,0 +1,137 @@
+"""
+Batch tracking and trajectory reconstruction
+
+This script (re)processes a whole directory of recordings. Every folder <name> under the root directory that contains
+<name>_cam1.avi (or the manifest <name>_cam1_manifest.json of a segmented recording) is tracked with the VideoTracker
+(headless) and reconstructed with the TrajectoryReconstructor. The folders are processed in parallel by a process pool.
+
+Main Workflow:
+- The box and the initial ROI are read from <name>/<name>_tracking.json, or from the --config file for all folders.
+- Folders whose _locations and _Trajectory tables (CSV, or NPZ/Parquet with --format) are newer than the recording and the config are skipped (unless
+  --force is given).
+- A summary table (folder, status, number of frames, tracking and reconstruction time, error) is printed and saved to
+  batch_summary.csv in the root directory.
+
+Usage:
+    python batch.py <root_dir> [--config tracking.json] [--workers 4] [--force] [--format npz]
+
+Dependencies:
+- VideoTracker (from TrackerClassV3.py), TrajectoryReconstructor (from TrajectoryClassV5.py).
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from include.TableClass import find_table
+from include.TrackerClassV3 import VideoTracker, load_tracking_config
+from include.TrajectoryClassV5 import TrajectoryReconstructor
+
+SUMMARY_COLUMNS = ["folder", "status", "frames", "tracking_s", "reconstruction_s", "error"]
+
+def find_recordings(root_dir):
+    # Every <name>/<name>_cam1.avi (or segmented <name>/<name>_cam1_manifest.json) under the root directory
+    recordings = []
+    for folder, _, files in os.walk(root_dir):
+        name = os.path.basename(folder)
+        for video_name in (f"{name}_cam1.avi", f"{name}_cam1_manifest.json"):
+            if video_name in files:
+                recordings.append(os.path.join(folder, video_name))
+                break
+    return sorted(recordings)
+
+def recording_config(video_path, default_config):
+    folder = os.path.dirname(video_path)
+    config_file = os.path.join(folder, f"{os.path.basename(folder)}_tracking.json")
+    return config_file if os.path.exists(config_file) else default_config
+
+def output_files(video_path):
+    # The locations and trajectory tables (in any format), None if one is missing
+    folder = os.path.dirname(video_path)
+    name = os.path.basename(folder)
+    return [find_table(os.path.join(folder, f"{name}_cam1_locations")), find_table(os.path.join(folder, f"{name}_Trajectory"))]
+
+def is_up_to_date(video_path, config_file):
+    outputs = output_files(video_path)
+    if None in outputs:
+        return False
+    inputs = [video_path] + ([config_file] if config_file else [])
+    return min(os.path.getmtime(path) for path in outputs) >= max(os.path.getmtime(path) for path in inputs)
+
+def process_recording(video_path, config_file, table_format="csv"):
+    # Runs in a worker process: track (headless) and reconstruct one recording
+    result = dict.fromkeys(SUMMARY_COLUMNS, "")
+    result["folder"] = os.path.dirname(video_path)
+    try:
+        if config_file is None:
+            raise ValueError("No tracking config (box and ROI) found.")
+        box, roi = load_tracking_config(config_file)
+
+        start = time.perf_counter()
+        # The progress of the workers is not printed, the batch summary reports the result of every recording
+        tracker = VideoTracker(video_path, headless=True, progress_callback=lambda frame, total, fps: None,
+                               table_format=table_format)
+        tracker.track_and_save(box=box, roi=roi)
+        result["tracking_s"] = f"{time.perf_counter() - start:.2f}"
+
+        start = time.perf_counter()
+        reconstructor = TrajectoryReconstructor(tracker.locations_filename, table_format=table_format)
+        reconstructor.reconstruct()
+        result["reconstruction_s"] = f"{time.perf_counter() - start:.2f}"
+
+        result["frames"] = len(reconstructor.timestamps)
+        result["status"] = "done"
+    except Exception as error:
+        result["status"] = "failed"
+        result["error"] = f"{type(error).__name__}: {error}"
+    return result
+
+def run_batch(root_dir, default_config=None, workers=None, force=False, table_format="csv"):
+    recordings = find_recordings(root_dir)
+    print(f"[INFO] Found {len(recordings)} recordings under {root_dir}")
+
+    results = []
+    jobs = []
+    for video_path in recordings:
+        config_file = recording_config(video_path, default_config)
+        if not force and is_up_to_date(video_path, config_file):
+            skipped = dict.fromkeys(SUMMARY_COLUMNS, "")
+            skipped.update(folder=os.path.dirname(video_path), status="up to date")
+            results.append(skipped)
+        else:
+            jobs.append((video_path, config_file))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_recording, video_path, config_file, table_format) for video_path, config_file in jobs]
+        for future in futures:
+            result = future.result()
+            print(f"[INFO] {result['folder']}: {result['status']} {result['error']}")
+            results.append(result)
+
+    results.sort(key=lambda row: row["folder"])
+    summary_file = os.path.join(root_dir, "batch_summary.csv")
+    with open(summary_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    # Print the summary table
+    widths = {column: max([len(column)] + [len(str(row[column])) for row in results]) for column in SUMMARY_COLUMNS}
+    print("  ".join(column.ljust(widths[column]) for column in SUMMARY_COLUMNS))
+    for row in results:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in SUMMARY_COLUMNS))
+    print(f"[INFO] Summary saved to {summary_file}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track and reconstruct every recording under a directory.")
+    parser.add_argument("root_dir", help="Directory with the <name>/<name>_cam1.avi recording folders")
+    parser.add_argument("--config", help="JSON file with the box and ROI, used for folders without <name>_tracking.json")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="Also process folders whose outputs are up to date")
+    parser.add_argument("--format", default="csv", choices=["csv", "npz", "parquet"], help="Format of the output tables")
+    args = parser.parse_args()
+
+    run_batch(args.root_dir, default_config=args.config, workers=args.workers, force=args.force, table_format=args.format)
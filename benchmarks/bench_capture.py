@@ -0,0 +1,136 @@
+"""
+Load test of the capture path of the recorder at 30, 60 and 120 fps, without a camera
+
+Feeds the frames of a SyntheticSource (see FrameSourceClass.py, JPEG payloads like an MJPG camera, delivered at the
+frame rate) through the path that the capture thread of the recorder (DualCameraApp._capture_loop) takes during a
+recording, headless (no Tk, no preview):
+- xvid: every payload is decoded on the capture thread and queued for the AsyncVideoWriter (XVID cv2.VideoWriter).
+- mjpg: the payloads are queued as they arrive for the AsyncVideoWriter (MjpgAviWriter passthrough).
+Both write the frame log sidecar (FrameLogWriter), with --live the frames are also tracked by a LiveTracker.
+
+For every frame rate and mode it reports the frames per second that reached the video, the frames the capture loop
+missed because it was too slow (a camera would have overwritten them, visible as gaps in the frame log), the frames
+the writer dropped (queue full), its maximum queue depth, the busy share of the capture loop and the time needed to
+write the queued frames after the last one (close). Every run is a spawned process (see bench_pipeline.py), the
+results are written to a JSON file.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_capture [--fps 30 60 120] [--seconds 10] [--modes xvid mjpg] [--live] [--output bench_capture.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+
+from benchmarks.bench_pipeline import environment, run_isolated
+from include.FrameLogClass import FrameLogWriter, frame_log_path
+from include.FrameSourceClass import SyntheticSource
+from include.LiveTrackerClass import LiveTracker
+from include.MjpgWriterClass import MjpgAviWriter
+from include.WriterClass import AsyncVideoWriter
+
+MODES = ["xvid", "mjpg"]
+
+def case_capture(output_dir, mode, fps, size, seconds, live, queue_size):
+    # Runs in a spawned process, the JPEG payloads of the source are encoded before the clock starts
+    source = SyntheticSource(size, fps=fps, n_frames=int(round(seconds * fps)), payloads=True)
+    name = f"capture_{mode}_{fps:g}"
+    video_file = os.path.join(output_dir, f"{name}_cam1.avi")
+    frame_log = FrameLogWriter(frame_log_path(output_dir, name), nominal_fps=fps)
+    if mode == "mjpg":
+        writer = AsyncVideoWriter(MjpgAviWriter(video_file, fps, size), None, queue_size=queue_size,
+                                  max_payload_bytes=size[0] * size[1], frame_log=frame_log)
+    else:
+        writer = AsyncVideoWriter(cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*'XVID'), fps, size),
+                                  (size[1], size[0], 3), queue_size=queue_size, frame_log=frame_log)
+    live_tracker = None
+    if live:
+        live_tracker = LiveTracker(output_dir, f"{name}_cam1", source.frames.initial_roi(), box=source.frames.box)
+        live_tracker.start()
+    writer.start()
+
+    # The capture loop of the recorder while recording
+    capture_seq = 0
+    frames_recorded = 0
+    busy = 0.0
+    start = time.perf_counter()
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+        capture_ns = time.perf_counter_ns()
+        pos_msec = source.get(cv2.CAP_PROP_POS_MSEC)
+        busy_start = time.perf_counter()
+        capture_seq += 1
+        record_frame = cv2.imdecode(frame, cv2.IMREAD_COLOR) if mode == "xvid" else frame
+        if writer.push(record_frame, (capture_seq, capture_ns, pos_msec)):
+            if live_tracker is not None:
+                live_tracker.push(record_frame, frames_recorded, capture_ns)
+            frames_recorded += 1
+        busy += time.perf_counter() - busy_start
+    elapsed = time.perf_counter() - start
+
+    closing = time.perf_counter()
+    writer.close()
+    close_seconds = time.perf_counter() - closing
+    stats = writer.stats()
+    result = {"fps": frames_recorded / elapsed, "target_fps": fps, "frames_due": source.n_frames,
+              "frames_read": source.frames_delivered, "frames_missed": source.frames_skipped,
+              "frames_dropped": stats["frames_dropped"], "frames_written": stats["frames_written"],
+              "max_queue_depth": stats["max_queue_depth"], "frame_log_gaps": frame_log.dropped,
+              "capture_busy_percent": 100 * busy / elapsed, "close_seconds": close_seconds,
+              "file_mb": os.path.getsize(video_file) / 2**20}
+    if live_tracker is not None:
+        live_tracker.close()
+        status = live_tracker.status()
+        result["live_tracked"] = status["frames_tracked"]
+        result["live_dropped"] = status["frames_dropped"]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the capture, write and live tracking path of the recorder without a camera.")
+    parser.add_argument("--fps", type=float, nargs="+", default=[30, 60, 120], help="Frame rates of the synthetic source")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of every run")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1080], metavar=("W", "H"), help="Frame size of the source")
+    parser.add_argument("--live", action="store_true", help="Also track the frames with a LiveTracker")
+    parser.add_argument("--queue-size", type=int, default=32, help="Frame buffers of the AsyncVideoWriter (writer_queue_size of the recorder)")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per case, the fastest run is reported")
+    parser.add_argument("--workdir", default=None, help="Directory for the recorded files (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the recorded files")
+    parser.add_argument("--output", default="bench_capture.json", help="Results file (JSON)")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the writer and live tracker")
+    args = parser.parse_args()
+
+    size = tuple(args.size)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_capture_")
+    os.makedirs(workdir, exist_ok=True)
+    results = {"environment": environment(), "settings": {"seconds": args.seconds, "size": list(size), "live": args.live,
+                                                          "queue_size": args.queue_size, "repeats": args.repeats}, "cases": []}
+    print(f"{'case':<20}  {'recorded fps':>12}  {'missed':>7}  {'dropped':>7}  {'max queue':>9}  {'busy':>6}  {'close s':>7}")
+    try:
+        for mode in args.modes:
+            for fps in args.fps:
+                result = run_isolated(case_capture, workdir, mode, fps, size, args.seconds, args.live, args.queue_size,
+                                      repeats=args.repeats, verbose=args.verbose)
+                result["name"] = f"capture[{mode}, {fps:g} fps]"
+                results["cases"].append(result)
+                live = f"  live dropped {result['live_dropped']}" if "live_dropped" in result else ""
+                print(f"{result['name']:<20}  {result['fps']:12.1f}  {result['frames_missed']:>7}  {result['frames_dropped']:>7}  "
+                      f"{result['max_queue_depth']:>4}/{args.queue_size:<4}  {result['capture_busy_percent']:5.1f}%  "
+                      f"{result['close_seconds']:7.2f}{live}")
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Benchmark of the recording and analysis pipeline on synthetic videos
+
+Generates synthetic recordings (a moving dark blob on a bright box, like the UMR in the container) with the files the
+recorder writes next to a video (the frames of the synthetic source of the recorder, see FrameSourceClass.py): <name>_cam1.avi, <name>_timestamps.csv and <name>_cam1_box.csv (plus a tracking
+config <name>_tracking.json with the box and the initial ROI). No camera is needed. Then it measures:
+- track_and_save: VideoTracker.track_and_save, headless, on the annotated, lean and predict (Kalman) paths, including
+  the decoding of the video and writing the locations table. The tracked positions are compared with the known
+  positions of the blob (mean and max error in pixels). A case whose max error exceeds --max-error-px, or that lost
+  the blob, is marked as failed: its timing is not compared and the benchmark exits with status 1.
+- update_roi_center: VideoTracker.update_roi_center (and update_roi_center_lean) alone, on frames decoded beforehand.
+- reconstruct: TrajectoryReconstructor loading a synthetic locations table and reconstruct() on it (which also writes
+  the trajectory table), for several table lengths.
+- video_writer: cv2.VideoWriter.write throughput (XVID and MJPG) on frames that are already in memory.
+
+Every case runs in its own spawned process (repeats times, the fastest run is reported), so the peak memory (peak
+resident set size of that process, and its growth during the case) belongs to that case only and earlier cases do not
+warm the caches of later ones. The results, with the commit and the versions of Python, OpenCV and NumPy, are written
+to a JSON file. --compare prints the speed of every case against an earlier results file, to find regressions between
+commits.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline [--frames 300] [--size 1920 1080] [--output bench_pipeline.json] [--compare old.json]
+    python -m benchmarks.bench_pipeline --cases track_and_save video_writer --workdir /tmp/bench --keep
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import resource  # Not available on Windows, the peak memory is then not reported
+except ImportError:
+    resource = None
+
+from include.FrameSourceClass import SyntheticFrames
+from include.TableClass import read_table, write_table
+from include.TrackerClassV3 import LOCATION_COLUMNS, VideoTracker
+from include.TrajectoryClassV5 import TrajectoryReconstructor
+
+CASES = ["track_and_save", "update_roi_center", "reconstruct", "video_writer"]
+
+def peak_rss_mb():
+    # On Linux the high water mark of this process image (ru_maxrss would include the parent that spawned it)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def generate_recording(output_dir, name, size, n_frames, fps, codec="XVID", seed=0):
+    # The files of a recording as the recorder and the tracker name them
+    # The frames of the synthetic source of the recorder (see FrameSourceClass.py)
+    frames = SyntheticFrames(size, fps, seed)
+    buffer = np.empty_like(frames.background)
+    video_file = os.path.join(output_dir, f"{name}_cam1.avi")
+    writer = cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*codec), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write {video_file} with the {codec} codec")
+    for index in range(n_frames):
+        writer.write(frames.frame(index, buffer))
+    writer.release()
+
+    # Capture times with a small jitter, like a real camera
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(n_frames) / fps + rng.uniform(-0.001, 0.001, n_frames)
+    timestamps[0] = 0.0
+    write_table(os.path.join(output_dir, f"{name}_timestamps"), {"Frame": np.arange(n_frames), "Timestamp (s)": timestamps})
+    write_table(os.path.join(output_dir, f"{name}_cam1_box"),
+                {column: [value] for column, value in zip(["X", "Y", "Width", "Height"], frames.box)})
+    with open(os.path.join(output_dir, f"{name}_tracking.json"), "w") as f:
+        json.dump({"box": list(frames.box), "roi": list(frames.initial_roi())}, f)
+    x, y, _ = frames.path(n_frames)
+    np.save(os.path.join(output_dir, f"{name}_truth.npy"), np.column_stack((x, y)))
+    return video_file
+
+def generate_locations(output_dir, name, n_rows, size, fps, seed=0):
+    # A locations table (and box table) of n_rows frames, without a video
+    frames = SyntheticFrames(size, fps, seed)
+    box = frames.box
+    x, y, angle = frames.path(n_rows)
+    rng = np.random.default_rng(seed)
+    columns = dict(zip(LOCATION_COLUMNS, [np.arange(n_rows), np.arange(n_rows) / fps, x + rng.normal(0, 0.2, n_rows),
+                                          y + rng.normal(0, 0.2, n_rows), angle - 90, np.full(n_rows, 565.0), np.ones(n_rows)]))
+    locations_file = write_table(os.path.join(output_dir, f"{name}_cam1_locations"), columns)
+    write_table(os.path.join(output_dir, f"{name}_cam1_box"), {column: [value] for column, value in zip(["X", "Y", "Width", "Height"], box)})
+    return locations_file
+
+# The cases, each runs in a spawned process
+
+def case_track_and_save(video_file, path):
+    base = video_file[:-len("_cam1.avi")]
+    with open(f"{base}_tracking.json") as f:
+        config = json.load(f)
+    for suffix in ("_cam1_tracking_state.json", "_cam1_locations.partial"):
+        if os.path.exists(base + suffix):
+            os.remove(base + suffix)
+
+    tracker = VideoTracker(video_file, headless=True, lean=path != "annotated", predict=path == "predict",
+                           progress_callback=lambda frame, total, fps: None)
+    start = time.perf_counter()
+    tracker.track_and_save(box=config["box"], roi=config["roi"], resume=False)
+    elapsed = time.perf_counter() - start
+
+    # Error of the tracked positions against the drawn positions (frames in which the blob was found)
+    locations = read_table(tracker.locations_filename)
+    truth = np.load(f"{base}_truth.npy")
+    found = np.asarray(locations["confidence"], dtype=float) > 0
+    errors = np.hypot(np.asarray(locations["X"], dtype=float) - truth[:, 0], np.asarray(locations["Y"], dtype=float) - truth[:, 1])[found]
+    frames = len(locations["Frame"])
+    return {"frames": frames, "seconds": elapsed, "fps": frames / elapsed, "frames_lost": tracker.frames_lost,
+            "mean_error_px": float(errors.mean()) if errors.size else None,
+            "max_error_px": float(errors.max()) if errors.size else None}
+
+def case_update_roi_center(video_file, method, max_frames):
+    base = video_file[:-len("_cam1.avi")]
+    with open(f"{base}_tracking.json") as f:
+        roi = tuple(json.load(f)["roi"])
+
+    tracker = VideoTracker(video_file, headless=True, lean=method == "lean")
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = tracker.cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    tracker.cap.release()
+
+    # Only the update of the ROI is timed, the frames are already decoded
+    start = time.perf_counter()
+    if method == "lean":
+        for frame in frames:
+            roi = tracker.update_roi_center_lean(frame, roi)
+    else:
+        for frame in frames:
+            frame, roi = tracker.update_roi_center(frame, roi)
+    elapsed = time.perf_counter() - start
+    return {"frames": len(frames), "seconds": elapsed, "fps": len(frames) / elapsed, "frames_lost": tracker.frames_lost,
+            "frames_in_memory_mb": sum(frame.nbytes for frame in frames) / 2**20}
+
+def case_reconstruct(locations_file):
+    start = time.perf_counter()
+    reconstructor = TrajectoryReconstructor(locations_file)
+    loaded = time.perf_counter()
+    reconstructor.reconstruct()
+    elapsed = time.perf_counter() - loaded
+    frames = len(reconstructor.timestamps)
+    return {"frames": frames, "load_seconds": loaded - start, "seconds": elapsed, "fps": frames / elapsed}
+
+def case_video_writer(output_dir, codec, size, n_frames, fps):
+    # A short loop of distinct frames is written over and over, generating the frames is not timed
+    synthetic = SyntheticFrames(size, fps)
+    frames = [synthetic.frame(index) for index in range(min(n_frames, 30))]
+    output_file = os.path.join(output_dir, f"writer_{codec}.avi")
+    writer = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*codec), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write {output_file} with the {codec} codec")
+    start = time.perf_counter()
+    for index in range(n_frames):
+        writer.write(frames[index % len(frames)])
+    writer.release()
+    elapsed = time.perf_counter() - start
+    file_mb = os.path.getsize(output_file) / 2**20
+    os.remove(output_file)
+    return {"frames": n_frames, "seconds": elapsed, "fps": n_frames / elapsed,
+            "input_mb_per_s": n_frames * frames[0].nbytes / 2**20 / elapsed, "file_mb": file_mb}
+
+def _measured(case, args, verbose):
+    # Runs in the spawned process: the peak memory before the case is the memory of the interpreter and the imports
+    baseline = peak_rss_mb()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output) if not verbose else contextlib.nullcontext():
+        result = case(*args)
+    peak = peak_rss_mb()
+    result["peak_rss_mb"] = peak
+    result["rss_growth_mb"] = None if peak is None else peak - baseline
+    return result
+
+def run_isolated(case, *args, repeats=1, verbose=False):
+    # Best of repeats runs (each in a new process), with the highest peak memory of all runs
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for _ in range(repeats):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(_measured, case, args, verbose).result())
+    best = max(results, key=lambda result: result["fps"])
+    if best["peak_rss_mb"] is not None:
+        best["peak_rss_mb"] = max(result["peak_rss_mb"] for result in results)
+        best["rss_growth_mb"] = max(result["rss_growth_mb"] for result in results)
+    best["repeats"] = repeats
+    best["fps_runs"] = [result["fps"] for result in results]
+    return best
+
+def environment():
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repository, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repository,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {"commit": commit, "dirty": dirty, "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "opencv": cv2.__version__, "numpy": np.__version__, "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "opencv_threads": cv2.getNumThreads()}
+
+def compare(results, previous_file):
+    with open(previous_file) as f:
+        previous_results = json.load(f)
+    previous = {case["name"]: case for case in previous_results["cases"]}
+    print(f"\nCompared with {previous_file} (commit {previous_results['environment']['commit']}):")
+    print(f"{'case':<36}  {'fps':>10}  {'before':>10}  {'ratio':>6}")
+    for case in results["cases"]:
+        old = previous.get(case["name"])
+        if case.get("failed") or (old is not None and old.get("failed")):
+            print(f"{case['name']:<36}  FAILED ({case.get('failed') or 'failed in ' + previous_file}), not compared")
+            continue
+        if old is None or "fps" not in old or "fps" not in case:
+            continue
+        print(f"{case['name']:<36}  {case['fps']:10.1f}  {old['fps']:10.1f}  {case['fps'] / old['fps']:5.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracker, reconstructor and video writer on synthetic recordings.")
+    parser.add_argument("--cases", nargs="+", default=CASES, choices=CASES)
+    parser.add_argument("--frames", type=int, default=300, help="Frames of the synthetic recording")
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1080], metavar=("W", "H"), help="Frame size of the recording")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--roi-frames", type=int, default=100, help="Frames decoded into memory for the update_roi_center case")
+    parser.add_argument("--codec", default="XVID", help="Codec of the synthetic recording (XVID like the recorder, or MJPG)")
+    parser.add_argument("--reconstruct-sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Rows of the locations tables")
+    parser.add_argument("--writer-codecs", nargs="+", default=["XVID", "MJPG"])
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case, the fastest run is reported")
+    parser.add_argument("--workdir", default=None, help="Directory for the synthetic files (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic files")
+    parser.add_argument("--output", default="bench_pipeline.json", help="Results file (JSON)")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare with")
+    parser.add_argument("--max-error-px", type=float, default=2.0, help="Tracking cases with a larger max error (or lost frames) fail")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the tracker and reconstructor")
+    args = parser.parse_args()
+
+    size = tuple(args.size)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.makedirs(workdir, exist_ok=True)
+    results = {"environment": environment(), "settings": {"frames": args.frames, "size": list(size), "fps": args.fps,
+                                                          "codec": args.codec, "repeats": args.repeats}, "cases": []}
+
+    def record(name, result):
+        result["name"] = name
+        results["cases"].append(result)
+        memory = "" if result["peak_rss_mb"] is None else f"  peak {result['peak_rss_mb']:7.0f} MB (+{result['rss_growth_mb']:.0f} MB)"
+        error = f"  error {result['mean_error_px']:.2f} px (max {result['max_error_px']:.2f})" if result.get("mean_error_px") is not None else ""
+
+        # A broken tracker must not pass as a (fast) timing
+        if result.get("frames_lost"):
+            result["failed"] = f"{result['frames_lost']} frames lost"
+        elif "max_error_px" in result and (result["max_error_px"] is None or result["max_error_px"] > args.max_error_px):
+            result["failed"] = f"max error above {args.max_error_px} px"
+        failed = f"  FAILED ({result['failed']})" if result.get("failed") else ""
+        print(f"{name:<36}  {result['fps']:10.1f} fps{memory}{error}{failed}")
+
+    try:
+        video_file = None
+        if {"track_and_save", "update_roi_center"} & set(args.cases):
+            start = time.perf_counter()
+            video_file = generate_recording(workdir, "synthetic", size, args.frames, args.fps, args.codec)
+            print(f"[INFO] Generated {video_file} ({args.frames} frames, {size[0]}x{size[1]}) in {time.perf_counter() - start:.1f} s")
+
+        if "track_and_save" in args.cases:
+            for path in ("annotated", "lean", "predict"):
+                record(f"track_and_save[{path}]", run_isolated(case_track_and_save, video_file, path, repeats=args.repeats,
+                                                                        verbose=args.verbose))
+
+        if "update_roi_center" in args.cases:
+            for method in ("annotated", "lean"):
+                name = "update_roi_center" if method == "annotated" else "update_roi_center_lean"
+                record(name, run_isolated(case_update_roi_center, video_file, method, min(args.frames, args.roi_frames),
+                                          repeats=args.repeats, verbose=args.verbose))
+
+        if "reconstruct" in args.cases:
+            for n_rows in args.reconstruct_sizes:
+                locations_file = generate_locations(workdir, f"table{n_rows}", n_rows, size, args.fps)
+                record(f"reconstruct[{n_rows}]", run_isolated(case_reconstruct, locations_file, repeats=args.repeats,
+                                                                       verbose=args.verbose))
+
+        if "video_writer" in args.cases:
+            for codec in args.writer_codecs:
+                record(f"video_writer[{codec}]", run_isolated(case_video_writer, workdir, codec, size, args.frames, args.fps,
+                                                              repeats=args.repeats, verbose=args.verbose))
+    finally:
+        if args.workdir is None and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif args.keep:
+            print(f"[INFO] Synthetic files kept in {workdir}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Results saved to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    failed = [case["name"] for case in results["cases"] if case.get("failed")]
+    if failed:
+        raise SystemExit(f"[WARNING] Failed cases: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
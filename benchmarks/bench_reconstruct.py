@@ -0,0 +1,87 @@
+"""
+Benchmark of the trajectory reconstruction
+
+Compares the per-sample Python loop that TrajectoryReconstructor.reconstruct() used before with the batched
+pinhole_reconstruct(), on synthetic trajectories of up to millions of samples, and one call on many stacked
+trajectories (with per-frame depths) against one call per trajectory. The results of both paths are checked to be equal.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_reconstruct [--sizes 10000 100000 1000000 5000000] [--loop-max 1000000] [--stacked 1000] [--stacked-samples 10000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from include.TrajectoryClassV5 import pinhole_reconstruct
+
+CAMERA_MATRIX = np.array([[1397.9, 0, 953.6590],
+                          [0, 1403.0, 555.1515],
+                          [0, 0, 1]], dtype=np.float64)
+
+def loop_reconstruct(x_px, y_px, depth_m, camera_matrix):
+    # The per-sample loop of the original reconstruct(), as the reference
+    fx, fy = camera_matrix[0, 0], camera_matrix[1, 1]
+    cx, cy = camera_matrix[0, 2], camera_matrix[1, 2]
+    X_3d = np.zeros_like(x_px, dtype=np.float64)
+    Y_3d = np.zeros_like(x_px, dtype=np.float64)
+    Z_3d = np.zeros_like(x_px, dtype=np.float64)
+    for i, value in enumerate(x_px):
+        X_3d[i] = (x_px[i] - cx) * depth_m[i] / fx
+        Y_3d[i] = (y_px[i] - cy) * depth_m[i] / fy
+        Z_3d[i] = depth_m[i]
+    X_3d -= X_3d[0]
+    Y_3d -= Y_3d[0]
+    Z_3d -= Z_3d[0]
+    return np.vstack((X_3d, Y_3d, Z_3d)) * 1000
+
+def synthetic_trajectory(n_samples, rng):
+    # Random walk in pixels with a slowly varying depth
+    x_px = 960 + np.cumsum(rng.normal(0, 0.5, n_samples))
+    y_px = 540 + np.cumsum(rng.normal(0, 0.5, n_samples))
+    depth_m = 0.25 + 0.01 * np.sin(np.linspace(0, 20, n_samples))
+    return x_px, y_px, depth_m
+
+def best_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loop and the batched trajectory reconstruction.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--loop-max", type=int, default=1_000_000, help="Largest size that is also run with the loop")
+    parser.add_argument("--stacked", type=int, default=1000, help="Number of stacked trajectories")
+    parser.add_argument("--stacked-samples", type=int, default=10_000, help="Samples per stacked trajectory")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'samples':>10}  {'loop (s)':>10}  {'batched (s)':>11}  {'speedup':>8}  {'Msamples/s':>10}")
+    for n_samples in args.sizes:
+        x_px, y_px, depth_m = synthetic_trajectory(n_samples, rng)
+        batched_s, batched = best_time(lambda: pinhole_reconstruct(x_px, y_px, depth_m, CAMERA_MATRIX), args.repeats)
+        if n_samples <= args.loop_max:
+            loop_s, reference = best_time(lambda: loop_reconstruct(x_px, y_px, depth_m, CAMERA_MATRIX), 1)
+            np.testing.assert_allclose(batched, reference, rtol=1e-9, atol=1e-9)
+            loop_text, speedup_text = f"{loop_s:10.3f}", f"{loop_s / batched_s:7.0f}x"
+        else:
+            loop_text, speedup_text = f"{'-':>10}", f"{'-':>8}"
+        print(f"{n_samples:>10}  {loop_text}  {batched_s:11.4f}  {speedup_text}  {n_samples / batched_s / 1e6:10.1f}")
+
+    # Many trajectories: one call on the stacked arrays against one call per trajectory
+    if args.stacked:
+        trajectories = [synthetic_trajectory(args.stacked_samples, rng) for _ in range(args.stacked)]
+        x_px, y_px, depth_m = (np.stack(arrays) for arrays in zip(*trajectories))
+        stacked_s, stacked = best_time(lambda: pinhole_reconstruct(x_px, y_px, depth_m, CAMERA_MATRIX), args.repeats)
+        separate_s, separate = best_time(lambda: [pinhole_reconstruct(*trajectory, CAMERA_MATRIX) for trajectory in trajectories], args.repeats)
+        np.testing.assert_allclose(stacked, np.stack(separate))
+        print(f"{args.stacked} stacked trajectories of {args.stacked_samples} samples: {stacked_s:.3f} s in one call, "
+              f"{separate_s:.3f} s in {args.stacked} calls ({x_px.size / stacked_s / 1e6:.1f} Msamples/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+CameraCalibrator Class
+
+Python replacement of cameraCalibration/mainCameraCalibration.m: calibrates camera 1 from the checkerboard images in
+cameraCalibration/Cam2Bottom and saves the intrinsics (camera matrix and distortion coefficients, OpenCV convention)
+to a versioned JSON file that the TrajectoryReconstructor loads. After a focus change, take new checkerboard images
+and run this script again; no MATLAB and no copy-paste of matrices is needed.
+
+Main Workflow:
+- The checkerboard corners are detected in every image (cv2.findChessboardCorners with sub-pixel refinement, or
+  cv2.findChessboardCornersSB for the images where that fails) by a process pool.
+- Every detection (also a failed one) is stored in a corner cache (corners_cache.json in the image folder) with the
+  size and modification time of the image and the board size. Images that are already in the cache are not detected
+  again, so adding a few images to the folder only costs the detection of those images.
+- cv2.calibrateCamera is run on all images in which the board was found, with the world points of the board
+  (square_size_mm, 9.2 mm like in the MATLAB script) and the camera model of the MATLAB script (two radial
+  distortion coefficients, no tangential distortion).
+- The intrinsics, the image size, the RMS and per-image reprojection errors and the images used are saved to the
+  intrinsics file (INTRINSICS_VERSION), by default cameraCalibration/cam1_intrinsics.json.
+
+Methods:
+- __init__(image_dir, board_size, square_size_mm, cache_file, workers): Sets up the calibrator for an image folder.
+- detect(): Detects the corners in all new or changed images (in parallel) and returns {image name: corners or None}.
+- calibrate(): Detects the corners and calibrates the camera, returns the calibration result (dict).
+- save_intrinsics(result, path): Saves a calibration result to the versioned intrinsics file.
+
+Functions:
+- detect_corners(image_path, board_size): Detects the inner corners of the checkerboard in one image.
+- load_intrinsics(path): Loads (camera_matrix, dist_coeffs, intrinsics) from an intrinsics file.
+
+Usage:
+    python -m include.CalibrationClass [cameraCalibration/Cam2Bottom] [--board 9 6] [--square 9.2] [--workers 4]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+INTRINSICS_VERSION = 1
+CALIBRATION_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cameraCalibration")
+DEFAULT_IMAGE_DIR = os.path.join(CALIBRATION_DIR, "Cam2Bottom")
+DEFAULT_INTRINSICS_FILE = os.path.join(CALIBRATION_DIR, "cam1_intrinsics.json")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def detect_corners(image_path, board_size):
+    # Runs in a worker process: inner corners (N x 2, sub-pixel) of the checkerboard, or None if it is not found.
+    # The classic detector is fast on clean images, the (slower) sector based detector finds the harder ones.
+    gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise IOError(f"Cannot read {image_path}")
+    image_size = (gray.shape[1], gray.shape[0])
+    board_size = tuple(board_size)
+
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
+    found, corners = cv2.findChessboardCorners(gray, board_size, flags=flags)
+    if found:
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+    else:
+        flags = cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_EXHAUSTIVE + cv2.CALIB_CB_ACCURACY
+        found, corners = cv2.findChessboardCornersSB(gray, board_size, flags=flags)
+    return (corners.reshape(-1, 2) if found else None), image_size
+
+def load_intrinsics(path=DEFAULT_INTRINSICS_FILE):
+    with open(path) as f:
+        intrinsics = json.load(f)
+    if intrinsics.get("version") != INTRINSICS_VERSION:
+        raise ValueError(f"Unsupported intrinsics file version {intrinsics.get('version')} in {path}")
+    camera_matrix = np.array(intrinsics["camera_matrix"], dtype=np.float64)
+    dist_coeffs = np.array(intrinsics["dist_coeffs"], dtype=np.float64)
+    return camera_matrix, dist_coeffs, intrinsics
+
+class CameraCalibrator:
+    def __init__(self, image_dir=DEFAULT_IMAGE_DIR, board_size=(9, 6), square_size_mm=9.2, cache_file=None, workers=None):
+        self.image_dir = image_dir
+        self.board_size = tuple(int(v) for v in board_size)  # Inner corners per row and per column
+        self.square_size_mm = square_size_mm
+        self.cache_file = cache_file or os.path.join(image_dir, "corners_cache.json")
+        self.workers = workers
+
+    def _image_names(self):
+        return sorted(name for name in os.listdir(self.image_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+    def _image_key(self, name):
+        # An image is detected again when it changed on disk or the board size changed
+        stat = os.stat(os.path.join(self.image_dir, name))
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "board_size": list(self.board_size)}
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        with open(self.cache_file) as f:
+            return json.load(f)
+
+    def _save_cache(self, cache):
+        # Written to a temporary file first, an interrupted run never leaves a broken cache
+        temporary_file = self.cache_file + ".tmp"
+        with open(temporary_file, "w") as f:
+            json.dump(cache, f)
+        os.replace(temporary_file, self.cache_file)
+
+    def detect(self):
+        names = self._image_names()
+        cache = self._load_cache()
+        keys = {name: self._image_key(name) for name in names}
+        new_names = [name for name in names if cache.get(name, {}).get("key") != keys[name]]
+        print(f"[INFO] {len(names)} calibration images, {len(names) - len(new_names)} cached, detecting {len(new_names)}")
+
+        if new_names:
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                paths = [os.path.join(self.image_dir, name) for name in new_names]
+                results = pool.map(detect_corners, paths, [self.board_size] * len(paths))
+                for name, (corners, image_size) in zip(new_names, results):
+                    cache[name] = {"key": keys[name], "image_size": list(image_size),
+                                   "corners": None if corners is None else corners.tolist()}
+            print(f"[INFO] Corner detection took {time.perf_counter() - start:.1f} s")
+
+        # Forget images that were removed from the folder
+        cache = {name: cache[name] for name in names}
+        self._save_cache(cache)
+        self.image_sizes = {name: tuple(cache[name]["image_size"]) for name in names}
+        return {name: None if cache[name]["corners"] is None else np.array(cache[name]["corners"], dtype=np.float32)
+                for name in names}
+
+    def calibrate(self):
+        detections = self.detect()
+        used = [name for name, corners in detections.items() if corners is not None]
+        skipped = [name for name, corners in detections.items() if corners is None]
+        for name in skipped:
+            print(f"[WARNING] No checkerboard found in {name}")
+        if len(used) < 3:
+            raise RuntimeError(f"The checkerboard was found in {len(used)} images, at least 3 are needed.")
+
+        image_sizes = {self.image_sizes[name] for name in used}
+        if len(image_sizes) > 1:
+            raise RuntimeError(f"The calibration images have different sizes: {sorted(image_sizes)}")
+        image_size = image_sizes.pop()
+
+        # World points of the inner corners on the (flat) board, in mm
+        columns, rows = self.board_size
+        world_points = np.zeros((rows * columns, 3), dtype=np.float32)
+        world_points[:, :2] = np.mgrid[0:columns, 0:rows].T.reshape(-1, 2) * self.square_size_mm
+        object_points = [world_points] * len(used)
+        image_points = [detections[name].reshape(-1, 1, 2) for name in used]
+
+        # Same camera model as the MATLAB script: two radial coefficients, no tangential distortion
+        flags = cv2.CALIB_ZERO_TANGENT_DIST + cv2.CALIB_FIX_K3
+        rms, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(object_points, image_points, image_size,
+                                                                            None, None, flags=flags)
+
+        # Reprojection error per image (RMS over the corners, in pixels)
+        errors = {}
+        for name, points, rvec, tvec in zip(used, image_points, rvecs, tvecs):
+            projected, _ = cv2.projectPoints(world_points, rvec, tvec, camera_matrix, dist_coeffs)
+            errors[name] = float(np.sqrt(np.mean(np.sum((projected - points) ** 2, axis=2))))
+        print(f"[INFO] Calibrated on {len(used)} images, RMS reprojection error {rms:.3f} px")
+
+        return {"camera_matrix": camera_matrix, "dist_coeffs": dist_coeffs.reshape(-1), "image_size": image_size,
+                "rms_px": float(rms), "reprojection_errors_px": errors, "images_used": used, "images_skipped": skipped}
+
+    def save_intrinsics(self, result, path=DEFAULT_INTRINSICS_FILE):
+        intrinsics = {
+            "version": INTRINSICS_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "image_dir": os.path.relpath(self.image_dir, os.path.dirname(os.path.abspath(path))),
+            "board_size": list(self.board_size),
+            "square_size_mm": self.square_size_mm,
+            "image_size": list(result["image_size"]),
+            "camera_matrix": result["camera_matrix"].tolist(),
+            "dist_coeffs": result["dist_coeffs"].tolist(),  # k1, k2, p1, p2, k3 (OpenCV order)
+            "rms_px": result["rms_px"],
+            "reprojection_errors_px": result["reprojection_errors_px"],
+            "images_used": result["images_used"],
+            "images_skipped": result["images_skipped"],
+        }
+        temporary_file = path + ".tmp"
+        with open(temporary_file, "w") as f:
+            json.dump(intrinsics, f, indent=2)
+        os.replace(temporary_file, path)
+        print(f"[INFO] Intrinsics saved to {path}")
+        return path
+
+# Used when this class is run seperately
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate camera 1 from checkerboard images.")
+    parser.add_argument("image_dir", nargs="?", default=DEFAULT_IMAGE_DIR, help="Folder with the checkerboard images")
+    parser.add_argument("--board", type=int, nargs=2, default=(9, 6), metavar=("COLUMNS", "ROWS"),
+                        help="Inner corners of the checkerboard (squares minus one) per row and per column")
+    parser.add_argument("--square", type=float, default=9.2, help="Size of a checkerboard square in mm")
+    parser.add_argument("--output", default=DEFAULT_INTRINSICS_FILE, help="Intrinsics file to write")
+    parser.add_argument("--workers", type=int, default=None, help="Number of detection processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    calibrator = CameraCalibrator(args.image_dir, board_size=args.board, square_size_mm=args.square, workers=args.workers)
+    calibrator.save_intrinsics(calibrator.calibrate(), args.output)
@@ -0,0 +1,123 @@
+"""
+TrackingCheckpoint Class
+
+Makes a tracking run of the VideoTracker resumable. Next to the outputs of the tracker two files are kept:
+- <name>_tracking_state.json: the box and the initial ROI of the run (so they never have to be selected by hand
+  again), the tracker settings, the last checkpoint (the next frame to track and the ROI at that frame) and whether
+  the run completed.
+- <name>_locations.partial: the rows tracked so far, as raw float64 records (one record per row, all columns), so a
+  file that was cut off by a crash can still be read up to the last complete record.
+
+Main Workflow:
+- saved_selection() returns the box and the initial ROI of an interrupted run of the same video, used when no box or
+  ROI is given. After a completed run the box and ROI are selected again (the selection may have been wrong).
+- resume_point(box, roi) returns (frame, roi, rows) of the last checkpoint of an interrupted run with the same box,
+  initial ROI and settings, or None if the run has to start at frame 0.
+- begin(box, roi, rows) starts (or continues) the run: the state file is written and the partial file is truncated
+  to the rows before the checkpoint.
+- add(row) collects a tracked row, save(next_frame, roi) appends the collected rows to the partial file, syncs it to
+  disk and then replaces the state file (atomically), so the checkpoint never points past the rows on disk.
+- finish() marks the run as completed and removes the partial file (the locations table then holds all rows),
+  close() keeps both files for a later resume.
+
+Methods:
+- __init__(output_dir, base_name, video_name, settings, n_columns): Loads the state of an earlier run of this video (if any).
+- saved_selection(): Returns (box, roi) of an interrupted run, or (None, None).
+- resume_point(box, roi): Returns (frame, roi, rows) to continue an interrupted run, or None.
+- begin(box, roi, rows): Writes the state and opens the partial file for the run.
+- add(row): Collects a tracked row for the next checkpoint.
+- save(next_frame, roi): Writes a checkpoint.
+- close(): Closes the partial file, the run can be resumed later.
+- finish(): Marks the run as completed and removes the partial file.
+"""
+
+import json
+import os
+
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+class TrackingCheckpoint:
+    def __init__(self, output_dir, base_name, video_name, settings, n_columns):
+        self.state_file = os.path.join(output_dir, f"{base_name}_tracking_state.json")
+        self.partial_file = os.path.join(output_dir, f"{base_name}_locations.partial")
+        self.video_name = video_name
+        self.settings = settings
+        self.n_columns = n_columns
+        self._file = None
+        self._pending = []
+
+        # Only the state of the same video and checkpoint version is used
+        self.state = None
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                state = json.load(f)
+            if state.get("version") == CHECKPOINT_VERSION and state.get("video") == video_name:
+                self.state = state
+
+    def saved_selection(self):
+        if self.state is None or self.state["complete"]:
+            return None, None
+        return tuple(self.state["box"]), tuple(self.state["roi"])
+
+    def resume_point(self, box, roi):
+        state = self.state
+        if state is None or state["complete"] or state["checkpoint"] is None or not os.path.exists(self.partial_file):
+            return None
+        if tuple(state["box"]) != tuple(box) or tuple(state["roi"]) != tuple(roi) or state["settings"] != self.settings:
+            print("[WARNING] The box, ROI or tracker settings changed since the interrupted run, tracking from frame 0")
+            return None
+
+        # Complete records only, and only the rows before the checkpoint (later rows are tracked again)
+        data = np.fromfile(self.partial_file, dtype=np.float64)
+        records = data[:len(data) - len(data) % self.n_columns].reshape(-1, self.n_columns)
+        frame = int(state["checkpoint"]["frame"])
+        records = records[records[:, 0] < frame]
+        rows = [(int(record[0]),) + tuple(record[1:].tolist()) for record in records]
+        return frame, tuple(state["checkpoint"]["roi"]), rows
+
+    def begin(self, box, roi, rows=()):
+        self.state = {"version": CHECKPOINT_VERSION, "video": self.video_name, "box": [int(v) for v in box],
+                      "roi": [int(v) for v in roi], "settings": self.settings, "checkpoint": None, "complete": False}
+        self._write_state()
+
+        # The partial file holds exactly the rows of the run so far
+        self._file = open(self.partial_file, "wb")
+        self._pending = list(rows)
+        self._write_pending()
+
+    def add(self, row):
+        self._pending.append(row)
+
+    def _write_pending(self):
+        if self._pending:
+            np.array(self._pending, dtype=np.float64).reshape(-1, self.n_columns).tofile(self._file)
+            self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_state(self):
+        # Written to a temporary file first, an interrupted run never leaves a broken state file
+        temporary_file = self.state_file + ".tmp"
+        with open(temporary_file, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temporary_file, self.state_file)
+
+    def save(self, next_frame, roi):
+        # The rows first, then the state that points to them
+        self._write_pending()
+        self.state["checkpoint"] = {"frame": int(next_frame), "roi": [int(v) for v in roi]}
+        self._write_state()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        self.close()
+        if os.path.exists(self.partial_file):
+            os.remove(self.partial_file)
+        self.state["complete"] = True
+        self._write_state()
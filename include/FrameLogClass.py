@@ -0,0 +1,132 @@
+"""
+FrameLog Classes
+
+Per-frame metadata of a recording, stored in a compact binary sidecar file (<name>_frames.bin) that is written while
+recording (streaming, in small blocks), so the metadata never has to be kept in memory.
+
+Every record describes one frame in the video file (in file order) and holds:
+- frame:      index of the frame in the video file.
+- capture_ns: time.perf_counter_ns() taken directly after the frame was read from the camera (monotonic clock).
+- pos_msec:   CAP_PROP_POS_MSEC reported by the camera backend for this frame (0 if the backend has none).
+- gap:        number of frames that were missed directly before this frame, either dropped by the recorder (e.g. a
+              full writer queue) or skipped by the camera (derived from the backend timestamps).
+
+File layout: a 16 byte header (magic b"UMRFLOG", version, record size) followed by the records (FRAME_LOG_DTYPE,
+little endian). A file that was cut off by a crash can still be read up to the last complete record.
+
+Classes/functions:
+- FrameLogWriter(path, nominal_fps, block_size, last_capture_seq, last_pos_msec): append(capture_seq, capture_ns,
+  pos_msec) adds a frame, close() flushes the file. last_capture_seq/last_pos_msec continue the gap detection of a
+  previous log (e.g. the previous segment of a segmented recording).
+- read_frame_log(path): Returns the records as a numpy structured array.
+- frame_log_timestamps(records): Returns the capture times in seconds, relative to the first frame.
+- frame_log_path(output_dir, base_name): Returns the path of the sidecar of a recording.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+FRAME_LOG_MAGIC = b"UMRFLOG"
+FRAME_LOG_VERSION = 1
+FRAME_LOG_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("capture_ns", "<i8"),
+    ("pos_msec", "<f8"),
+    ("gap", "<u4"),
+])
+HEADER_FORMAT = "<7sBII"  # magic, version, record size, reserved
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+def frame_log_path(output_dir, base_name):
+    return os.path.join(output_dir, f"{base_name}_frames.bin")
+
+class FrameLogWriter:
+    def __init__(self, path, nominal_fps=30, block_size=256, last_capture_seq=None, last_pos_msec=None):
+        self.path = path
+        self.nominal_period_ms = 1000.0 / nominal_fps if nominal_fps else None
+        self.frames = 0
+        self.dropped = 0
+        self.first_capture_ns = None
+        self.last_capture_ns = None
+        self._last_seq = last_capture_seq
+        self._last_pos_msec = last_pos_msec
+
+        # Records are collected in a small preallocated block and written when the block is full
+        self._block = np.zeros(block_size, dtype=FRAME_LOG_DTYPE)
+        self._block_fill = 0
+
+        self._file = open(path, "wb")
+        self._file.write(struct.pack(HEADER_FORMAT, FRAME_LOG_MAGIC, FRAME_LOG_VERSION, FRAME_LOG_DTYPE.itemsize, 0))
+
+    def append(self, capture_seq, capture_ns, pos_msec):
+        # Frames missed by the recorder (capture sequence numbers that never reached the file)
+        gap = 0
+        if self._last_seq is not None:
+            gap = max(capture_seq - self._last_seq - 1, 0)
+
+        # Frames missed by the camera, visible as a jump in the backend timestamps
+        if self.nominal_period_ms and pos_msec > 0 and self._last_pos_msec:
+            camera_gap = int(round((pos_msec - self._last_pos_msec) / self.nominal_period_ms)) - 1
+            gap = max(gap, camera_gap)
+
+        record = self._block[self._block_fill]
+        record["frame"] = self.frames
+        record["capture_ns"] = capture_ns
+        record["pos_msec"] = pos_msec
+        record["gap"] = gap
+        self._block_fill += 1
+        if self._block_fill == len(self._block):
+            self.flush()
+
+        if self.first_capture_ns is None:
+            self.first_capture_ns = capture_ns
+        self.last_capture_ns = capture_ns
+        self._last_seq = capture_seq
+        self._last_pos_msec = pos_msec
+        self.frames += 1
+        self.dropped += gap
+
+    @property
+    def last_capture_seq(self):
+        return self._last_seq
+
+    @property
+    def last_pos_msec(self):
+        return self._last_pos_msec
+
+    def measured_fps(self):
+        # Frame rate from the capture times of the first and the last frame
+        if self.frames < 2 or self.last_capture_ns == self.first_capture_ns:
+            return None
+        return (self.frames - 1) / ((self.last_capture_ns - self.first_capture_ns) / 1e9)
+
+    def flush(self):
+        if self._block_fill:
+            self._file.write(self._block[:self._block_fill].tobytes())
+            self._block_fill = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+def read_frame_log(path):
+    with open(path, "rb") as f:
+        magic, version, record_size, _ = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+        if magic != FRAME_LOG_MAGIC or record_size != FRAME_LOG_DTYPE.itemsize:
+            raise IOError(f"Not a frame log file (or unsupported version {version}): {path}")
+        data = f.read()
+
+    # Ignore an incomplete last record (e.g. after a crash)
+    n_records = len(data) // record_size
+    return np.frombuffer(data[:n_records * record_size], dtype=FRAME_LOG_DTYPE)
+
+def frame_log_timestamps(records):
+    if len(records) == 0:
+        return np.zeros(0, dtype=np.float64)
+    capture_ns = records["capture_ns"]
+    return (capture_ns - capture_ns[0]).astype(np.float64) / 1e9
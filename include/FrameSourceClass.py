@@ -0,0 +1,323 @@
+"""
+Frame sources
+
+The recorder (DualCameraApp) reads its frames from a frame source instead of a hard-coded cv2.VideoCapture, so the
+capture, write, preview and live tracking pipeline can also be run (and load tested at 30, 60 or 120 fps) without a
+camera, e.g. on Linux analysis machines. Every source behaves like cv2.VideoCapture (read/get/set/isOpened/release,
+like the SegmentedVideoCapture) and has a frame_size (width, height) and an fps.
+
+- CameraSource: the camera with the settings of the recorder (1920x1080, 30 fps, MJPG compression, no autofocus and,
+  if the backend can, the undecoded JPEG payloads). The default backend is DirectShow on Windows (CAP_DSHOW, best for
+  the Logitech C920) and the default backend of OpenCV elsewhere.
+- ReplaySource: replays a recorded video (or the manifest of a segmented recording) at the original capture times
+  from its frame log sidecar (<name>_frames.bin), or its <name>_timestamps table, or the frame rate of the file.
+- SyntheticSource: generates a dark blob moving on a bright box (the UMR in the container, see SyntheticFrames) at
+  any frame rate and frame size, endless or for n_frames.
+
+The replay and synthetic sources deliver their frames like a camera: read() waits until the frame is due (at speed
+times real time for a replay). A reader that falls behind by more than a frame misses the frames that were due in the
+meantime (drop_late=True, counted in frames_skipped), like a camera overwrites frames that are not read in time.
+CAP_PROP_POS_MSEC is the capture time of the delivered frame, so the frame log of the recorder sees the jump and
+records the gap. With payloads=True the frames are delivered as JPEG payloads (one row of bytes, like an MJPG camera
+in raw mode), the synthetic source encodes a cycle of frames once beforehand, the replay encodes every frame.
+
+Classes/functions:
+- CameraSource(index, api, frame_size, fps, payloads): Opens and configures the camera.
+- ReplaySource(video_path, fps, loop, drop_late, payloads): Replays a recording at its capture times (or faster or
+  slower, at the average frame rate fps).
+- SyntheticSource(frame_size, fps, n_frames, drop_late, payloads, payload_cycle, seed): Generates frames of a moving blob.
+- SyntheticFrames(size, fps, seed): Draws the frames of the synthetic source (also used by the benchmarks): frame(index),
+  position(index), path(n_frames) and initial_roi().
+- open_frame_source(source, fps, frame_size, payloads): Opens "camera", "camera:<index>", "synthetic" or a video file
+  (command line option --source of the recorder and main.py).
+"""
+
+import abc
+import os
+import platform
+import re
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from include.FrameLogClass import frame_log_timestamps
+    from include.SegmentClass import SegmentedVideoCapture, load_recording_frame_log
+    from include.TableClass import find_table, read_table
+except ImportError:  # When this file is run directly from the include folder
+    from FrameLogClass import frame_log_timestamps
+    from SegmentClass import SegmentedVideoCapture, load_recording_frame_log
+    from TableClass import find_table, read_table
+
+# Found to be the best API for using with logitech C920 in Windows, other platforms use the default backend of OpenCV
+DEFAULT_CAMERA_API = cv2.CAP_DSHOW if platform.system() == "Windows" else cv2.CAP_ANY
+
+BOX_MARGIN = 0.05     # Share of the frame around the synthetic box
+ROI_SIZE = 160        # Initial ROI around the synthetic blob (pixels at 1080p, scaled with the frame height)
+BLOB_AXES = (18, 10)  # Half axes of the synthetic blob (pixels at 1080p, scaled with the frame height)
+
+class CameraSource:
+    def __init__(self, index=0, api=DEFAULT_CAMERA_API, frame_size=(1920, 1080), fps=30, payloads=True):
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.fps = fps
+        self.cap = cv2.VideoCapture(index, api)
+
+        # Camera resolution and framerate
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_size[0])
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_size[1])
+        self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+        # Camera compression technique --> If turned off the FPS will be really low (around 5 fps)
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+
+        #Turns off the autofocus
+        self.cap.set(cv2.CAP_PROP_AUTOFOCUS, 0)
+
+        # Ask the backend for the undecoded JPEG payloads (V4L2/MSMF use CAP_PROP_FORMAT=-1, DSHOW uses CONVERT_RGB=0).
+        # Whether this worked is checked per frame, backends that ignore it simply keep delivering BGR frames.
+        if payloads:
+            self.cap.set(cv2.CAP_PROP_FORMAT, -1)
+            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.cap.set(prop_id, value)
+
+    def release(self):
+        self.cap.release()
+
+class _PacedSource(abc.ABC):
+    # Common part of the replay and synthetic sources: delivers frame i at offset_ns(i) after the first read
+    def __init__(self, frame_size, fps, n_frames, speed=1.0, drop_late=True):
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.fps = fps
+        self.n_frames = n_frames  # None: endless
+        self.speed = speed
+        self.drop_late = drop_late
+        self.frames_delivered = 0
+        self.frames_skipped = 0
+        self._next_index = 0
+        self._start_ns = None
+        self._position_ms = 0.0
+        self._opened = True
+
+    def _offset_ns(self, index):
+        return int(round(index * 1e9 / self.fps))
+
+    @abc.abstractmethod
+    def _frame(self, index):
+        """Returns frame index (BGR image, or JPEG payload in payload mode) or None if it cannot be read."""
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        index = self._next_index
+        if not self._opened or (self.n_frames is not None and index >= self.n_frames):
+            return False, None
+        if self._start_ns is None:
+            self._start_ns = time.perf_counter_ns() - int(self._offset_ns(index) / self.speed)
+
+        # Wait until the frame is due, or skip the frames that were due while the reader was busy
+        now = time.perf_counter_ns()
+        due = self._start_ns + self._offset_ns(index) / self.speed
+        if now < due:
+            time.sleep((due - now) / 1e9)
+        elif self.drop_late:
+            while ((self.n_frames is None or index + 1 < self.n_frames)
+                   and self._start_ns + self._offset_ns(index + 1) / self.speed <= now):
+                index += 1
+                self.frames_skipped += 1
+
+        frame = self._frame(index)
+        if frame is None:
+            return False, None
+        self._position_ms = self._offset_ns(index) / self.speed / 1e6
+        self._next_index = index + 1
+        self.frames_delivered += 1
+        return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frame_size[0])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frame_size[1])
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop_id == cv2.CAP_PROP_POS_MSEC:
+            return self._position_ms
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._next_index)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.n_frames) if self.n_frames is not None else -1.0
+        return 0.0
+
+    def set(self, prop_id, value):
+        # Camera settings (focus, exposure, ...) do not apply
+        return False
+
+    def release(self):
+        self._opened = False
+
+def _as_payload(frame, jpeg_params):
+    # JPEG payload as a single row of bytes, like a camera in raw MJPG mode
+    ok, payload = cv2.imencode(".jpg", frame, jpeg_params)
+    return payload.reshape(1, -1) if ok else None
+
+class ReplaySource(_PacedSource):
+    def __init__(self, video_path, fps=None, loop=False, drop_late=True, payloads=False, jpeg_quality=90):
+        if video_path.endswith("_manifest.json"):
+            self.cap = SegmentedVideoCapture(video_path)
+        else:
+            self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open the video file {video_path}.")
+        self.video_path = video_path
+        self.loop = loop
+        self.payloads = payloads
+        self._jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        n_file_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        # The capture times of the recording: frame log sidecar, timestamps table or the frame rate of the file
+        output_dir = os.path.dirname(video_path)
+        base_name = re.sub(r'_cam\d(\.avi|_manifest\.json)$', '', os.path.basename(video_path))
+        records = load_recording_frame_log(output_dir, base_name)
+        timestamp_file = find_table(os.path.join(output_dir, f"{base_name}_timestamps"))
+        if records is not None:
+            times = frame_log_timestamps(records)
+            print(f"[INFO] Replaying {video_path} at the capture times of its frame log")
+        elif timestamp_file is not None:
+            times = np.asarray(read_table(timestamp_file)["Timestamp (s)"], dtype=float)
+            print(f"[INFO] Replaying {video_path} at the times of {timestamp_file}")
+        else:
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+            times = np.arange(n_file_frames) / fps
+            print(f"[WARNING] No frame log or timestamps for {video_path}, replaying at {fps:.1f} fps")
+        if n_file_frames > 0:
+            times = times[:n_file_frames]
+        self._times_ns = np.round((times - times[0]) * 1e9).astype(np.int64)
+        self._file_frames = len(self._times_ns)
+        self.recorded_fps = (self._file_frames - 1) / (self._times_ns[-1] / 1e9) if self._file_frames > 1 and self._times_ns[-1] > 0 else 30.0
+
+        # A loop continues one frame period after the last frame
+        self._loop_ns = int(self._times_ns[-1] + 1e9 / self.recorded_fps)
+        self._file_position = 0
+
+        # With fps the recording is replayed faster or slower, the intervals between the frames keep their proportions
+        speed = fps / self.recorded_fps if fps else 1.0
+        super().__init__(frame_size, self.recorded_fps * speed, None if loop else self._file_frames, speed, drop_late)
+
+    def _offset_ns(self, index):
+        loops, file_index = divmod(index, self._file_frames)
+        return int(loops * self._loop_ns + self._times_ns[file_index])
+
+    def _frame(self, index):
+        # Skipped frames are grabbed (not decoded), the file is rewound at the start of every loop
+        file_index = index % self._file_frames
+        if file_index < self._file_position:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self._file_position = 0
+        while self._file_position < file_index:
+            if isinstance(self.cap, SegmentedVideoCapture):
+                self.cap.read()
+            else:
+                self.cap.grab()
+            self._file_position += 1
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self._file_position += 1
+        return _as_payload(frame, self._jpeg_params) if self.payloads else frame
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+class SyntheticFrames:
+    # Frames of a dark blob moving on a bright box, with a fixed noise pattern (for the codec and Otsu)
+    def __init__(self, size, fps=30, seed=0):
+        width, height = size
+        self.size = (int(width), int(height))
+        self.fps = fps
+        self.box = (int(width * BOX_MARGIN), int(height * BOX_MARGIN), int(width * (1 - 2 * BOX_MARGIN)), int(height * (1 - 2 * BOX_MARGIN)))
+
+        # The blob and the ROI keep their size relative to the box (and the motion per frame), at any frame size
+        scale = height / 1080
+        self.blob_axes = (BLOB_AXES[0] * scale, BLOB_AXES[1] * scale)
+        self.roi_size = max(int(round(ROI_SIZE * scale)), 16)
+        rng = np.random.default_rng(seed)
+        background = np.full((height, width), 90, dtype=np.int16)
+        bx, by, bw, bh = self.box
+        background[by:by+bh, bx:bx+bw] = 215
+        background += rng.integers(-8, 9, (height, width), dtype=np.int16)
+        self.background = cv2.cvtColor(np.clip(background, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+    def _path_at(self, t):
+        # Lissajous path through the box, at most about 15 pixels per frame at 1080p and 30 fps
+        bx, by, bw, bh = self.box
+        x = bx + bw / 2 + 0.35 * bw * np.sin(2 * np.pi * t / 12)
+        y = by + bh / 2 + 0.30 * bh * np.sin(2 * np.pi * t / 8 + 0.5)
+        angle = (20 * t) % 180
+        return x, y, angle
+
+    def path(self, n_frames):
+        return self._path_at(np.arange(n_frames) / self.fps)
+
+    def position(self, index):
+        return self._path_at(index / self.fps)
+
+    def frame(self, index, out=None):
+        # The blob is drawn with 4 fractional bits, so its centre is the exact sub-pixel position of path()
+        if out is None:
+            out = self.background.copy()
+        else:
+            np.copyto(out, self.background)
+        x, y, angle = self.position(index)
+        center = (int(round(x * 16)), int(round(y * 16)))
+        axes = (int(round(self.blob_axes[0] * 16)), int(round(self.blob_axes[1] * 16)))
+        cv2.ellipse(out, center, axes, float(angle), 0, 360, (25, 25, 25), -1, cv2.LINE_AA, 4)
+        return out
+
+    def initial_roi(self):
+        x, y, _ = self.position(0)
+        return (int(x) - self.roi_size // 2, int(y) - self.roi_size // 2, self.roi_size, self.roi_size)
+
+class SyntheticSource(_PacedSource):
+    def __init__(self, frame_size=(1920, 1080), fps=30, n_frames=None, drop_late=True, payloads=False, payload_cycle=None,
+                 jpeg_quality=90, seed=0):
+        super().__init__(frame_size, fps, n_frames, 1.0, drop_late)
+        self.frames = SyntheticFrames(self.frame_size, fps, seed)
+        self.payloads = payloads
+
+        # Encoding 1080p JPEGs costs more than a frame at 120 fps, so a cycle of payloads (2 s) is encoded beforehand
+        self._payloads = None
+        if payloads:
+            jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+            n_payloads = payload_cycle or int(round(2 * fps))
+            self._payloads = [_as_payload(self.frames.frame(index), jpeg_params) for index in range(n_payloads)]
+
+    def _frame(self, index):
+        if self._payloads is not None:
+            return self._payloads[index % len(self._payloads)]
+        return self.frames.frame(index)
+
+def open_frame_source(source="camera", fps=None, frame_size=None, payloads=None):
+    # "camera" or "camera:<index>", "synthetic", or the path of a recorded video (or manifest) to replay
+    frame_size = frame_size or (1920, 1080)
+    if source == "camera" or source.startswith("camera:"):
+        index = int(source.split(":")[1]) if ":" in source else 0
+        return CameraSource(index, frame_size=frame_size, fps=fps or 30, payloads=True if payloads is None else payloads)
+    if source == "synthetic":
+        return SyntheticSource(frame_size, fps=fps or 30, payloads=True if payloads is None else payloads)
+    # A replay keeps the pace of the recording, fps only changes its speed
+    return ReplaySource(source, fps=fps, payloads=bool(payloads))
@@ -0,0 +1,187 @@
+"""
+LiveTracker Class
+
+This class tracks the UMR while the recording is in progress, on the frames that the capture thread already has in
+memory, so the recorded video does not have to be decoded a second time by the VideoTracker after the recording.
+It uses the lean tracking path of the VideoTracker (or the Kalman search window with predict=True) on a worker
+thread and streams the results to the locations table while recording, so the recorder shows immediately whether an
+experiment worked and a crash of the recorder still leaves the locations of the frames tracked so far.
+
+Main Workflow:
+- The box and the initial ROI are selected in the recorder before the recording starts (see DualCameraApp).
+- start(prefill, first_capture_ns) writes the box table, opens the locations CSV and starts the worker thread. The
+  frames of the pre-trigger buffer (prefill) are tracked first, like the AsyncVideoWriter writes them first.
+- The capture thread calls push(frame, frame_number, capture_ns) for every frame that the video writer accepted, with
+  the index of that frame in the video. It never blocks: if the worker is behind and the queue is full, the frame is
+  not tracked (and counted as dropped), the recording itself is not affected. The locations table then has no row for
+  that frame, so the recorder only uses the live results of a recording without dropped frames.
+- The worker decodes MJPG payloads, tracks the ROI and appends a row (same columns as the VideoTracker, the time is
+  the capture time relative to the first recorded frame, like the frame log) to the CSV, flushed every
+  flush_interval seconds. It also keeps the latest position and a smoothed velocity (pixels/second) for the GUI.
+  With the profiler of the recorder (see ProfilerClass.py) the stages of the worker are measured as live.decode,
+  live.track (with the tracker.* stages inside it) and live.write.
+- close() tracks the frames that are still queued and writes the final locations table (in table_format), the typed
+  copy (.npy) and the metadata, with the same names as the VideoTracker, so the TrajectoryReconstructor can use them
+  directly.
+
+Methods:
+- __init__(output_dir, base_name, roi, box, table_format, predict, queue_size, flush_interval, undistorter, profiler): Sets up
+  the tracker for one recording (base_name is the name of the video without extension, e.g. <name>_cam1).
+- start(prefill, first_capture_ns): Writes the box table, opens the locations CSV and starts the worker thread.
+- push(frame, frame_number, capture_ns): Queues a recorded frame (BGR or JPEG payload) for tracking, returns False if it was dropped.
+- status(): Returns the latest position, the velocity and the counters (for the GUI).
+- close(): Tracks the remaining frames, stops the worker thread and writes the final locations files.
+"""
+
+import csv
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from include.TrackerClassV3 import LOCATION_COLUMNS, VideoTracker
+    from include.TableClass import table_path
+except ImportError:  # When this file is run directly from the include folder
+    from TrackerClassV3 import LOCATION_COLUMNS, VideoTracker
+    from TableClass import table_path
+
+class LiveTracker(VideoTracker):
+    def __init__(self, output_dir, base_name, roi, box=None, table_format="csv", predict=False, queue_size=64,
+                 flush_interval=1.0, undistorter=None, profiler=None):
+        # VideoTracker.__init__ is not called: there is no video file to open and no timestamps table to load, the
+        # frames and their capture times come from the capture thread
+        self.headless = True
+        self.write_video = False
+        self.output_dir = output_dir
+        self.base_name = base_name
+        self.table_format = table_format
+        self.locations_filename = table_path(os.path.join(output_dir, f"{base_name}_locations"), table_format)
+        self.stream_filename = table_path(self.locations_filename, "csv")  # Only CSV can be appended while recording
+        self.npy_filename = os.path.join(output_dir, f"{base_name}_locations.npy")
+        self._init_tracking_state(lean=True, predict=predict, undistorter=undistorter, profiler=profiler)
+
+        self.box = tuple(int(v) for v in box) if box is not None else None
+        self.roi = tuple(int(v) for v in roi)
+        self.flush_interval = flush_interval
+
+        # Frames waiting for the worker: (frame_number, frame, capture_ns), None stops the worker
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._first_capture_ns = None
+        self._stream_file = None
+        self._stream_writer = None
+
+        # Results: rows are only changed by the worker, the latest values for the GUI are guarded by _status_lock
+        self.rows = []
+        self.frames_dropped = 0
+        self._status_lock = threading.Lock()
+        self._latest = None
+        self._velocity = (0.0, 0.0)
+        self._last_found = None  # (time, X, Y) of the last frame in which the blob was found
+
+    def start(self, prefill=None, first_capture_ns=None):
+        if self.box is not None:
+            self.select_and_save_box(self.box)
+        self._first_capture_ns = first_capture_ns
+        self._stream_file = open(self.stream_filename, "w", newline="")
+        self._stream_writer = csv.writer(self._stream_file)
+        self._stream_writer.writerow(LOCATION_COLUMNS)
+        self._thread = threading.Thread(target=self._track_loop, args=(prefill,), name="LiveTrackerThread", daemon=True)
+        self._thread.start()
+
+    def push(self, frame, frame_number, capture_ns):
+        try:
+            self._queue.put_nowait((frame_number, frame, capture_ns))
+        except queue.Full:
+            # The worker is behind: skip this frame instead of blocking the capture thread
+            self.frames_dropped += 1
+            return False
+        return True
+
+    def _track_loop(self, prefill):
+        # The pre-trigger frames are the first frames of the video, the live frames wait in the queue
+        last_flush = time.perf_counter()
+        if prefill is not None:
+            for frame_number, (frame, metadata) in enumerate(prefill):
+                self._track(frame_number, frame, metadata[1])
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._track(*item)
+            if time.perf_counter() - last_flush >= self.flush_interval:
+                self._stream_file.flush()
+                last_flush = time.perf_counter()
+
+    def _track(self, frame_number, frame, capture_ns):
+        # MJPG payloads are decoded here, on the worker thread
+        profiler = self.profiler
+        t = profiler.start()
+        if frame.ndim == 1 or frame.shape[0] == 1:
+            frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+            if frame is None:
+                return
+            t = profiler.lap("live.decode", t)
+        if self._first_capture_ns is None:
+            self._first_capture_ns = capture_ns
+
+        _, self.roi = self._update_roi(frame, self.roi)
+        center_x, center_y, angle, area, confidence = self.roi_measurement(self.roi)
+        t = profiler.lap("live.track", t)
+        time_seconds = (capture_ns - self._first_capture_ns) / 1e9
+        row = (frame_number, time_seconds, center_x, center_y, angle, area, confidence)
+        self.rows.append(row)
+        self._stream_writer.writerow(row)
+        profiler.stop("live.write", t)
+
+        # Velocity between the last two frames in which the blob was found, smoothed for a readable display
+        velocity = self._velocity
+        if self.measurement is not None:
+            if self._last_found is not None and time_seconds > self._last_found[0]:
+                dt = time_seconds - self._last_found[0]
+                raw_velocity = ((center_x - self._last_found[1]) / dt, (center_y - self._last_found[2]) / dt)
+                velocity = tuple(0.7 * old + 0.3 * new for old, new in zip(self._velocity, raw_velocity))
+            self._last_found = (time_seconds, center_x, center_y)
+        with self._status_lock:
+            self._latest = row
+            self._velocity = velocity
+
+    def status(self):
+        with self._status_lock:
+            latest = self._latest
+            velocity = self._velocity
+        return {
+            "frame": None if latest is None else latest[0],
+            "x": None if latest is None else latest[2],
+            "y": None if latest is None else latest[3],
+            "found": latest is not None and latest[6] > 0,
+            "velocity": velocity,
+            "speed": float(np.hypot(*velocity)),
+            "frames_tracked": len(self.rows),
+            "frames_lost": self.frames_lost,
+            "frames_dropped": self.frames_dropped,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def close(self):
+        # The sentinel is queued after the last frame, so every pushed frame is tracked before the thread stops
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._stream_file is not None:
+            self._stream_file.close()
+            self._stream_file = None
+
+        # The final table (in the chosen format, the streamed CSV is simply rewritten), its typed copy and metadata
+        self.write_locations(self.rows)
+
+        print(f"[INFO] Live tracking: {len(self.rows)} frames tracked, {self.frames_lost} lost, "
+              f"{self.frames_dropped} not tracked (worker behind)")
+        print(f"Tracking data saved to {self.locations_filename}")
+        return self.locations_filename
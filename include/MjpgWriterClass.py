@@ -0,0 +1,183 @@
+"""
+MjpgAviWriter Class
+
+This class writes JPEG payloads, exactly as they are delivered by a camera running in MJPG mode, into an MJPG AVI
+file without decoding or re-encoding them. The resulting file is a standard (OpenDML) AVI that can be opened with
+cv2.VideoCapture, so the VideoTracker works on it the same way as on the XVID recordings.
+
+Main Workflow:
+- The header is written with placeholder values when the file is opened.
+- Every call to write(payload) appends the JPEG bytes as a '00dc' chunk and remembers where it was written.
+- When a RIFF chunk grows over the size limit (1 GB by default) a new 'AVIX' RIFF chunk is started, so recordings are
+  not limited to the 4 GB of a plain AVI file.
+- On release() the indexes are written and the header is patched with the real frame count and frame rate.
+
+Methods:
+- __init__(filename, fps, frame_size, riff_size_limit): Opens the file and writes the (placeholder) header.
+- isOpened(): Returns True while the file is open, like cv2.VideoWriter.
+- write(payload): Appends one JPEG payload (bytes or uint8 array) as a video frame.
+- set(prop_id, value): Supports cv2.CAP_PROP_FPS, the new frame rate is written to the header on release().
+- release(): Writes the indexes, patches the header and closes the file.
+"""
+
+import struct
+
+import cv2
+import numpy as np
+
+AVIF_HASINDEX = 0x10
+AVIF_ISINTERLEAVED = 0x100
+AVIIF_KEYFRAME = 0x10
+AVI_INDEX_OF_INDEXES = 0x00
+AVI_INDEX_OF_CHUNKS = 0x01
+SUPER_INDEX_ENTRIES = 256  # Reserved entries in the super index, one per RIFF chunk (256 GB with the default limit)
+
+class MjpgAviWriter:
+    def __init__(self, filename, fps, frame_size, riff_size_limit=1 << 30):
+        self.filename = filename
+        self.fps = float(fps)
+        self.width, self.height = frame_size
+        self.riff_size_limit = riff_size_limit
+
+        self.total_frames = 0
+        self.first_riff_frames = 0
+        self.max_payload = 0
+
+        # Index bookkeeping: idx1 only covers the first RIFF chunk, the OpenDML indexes cover all of them
+        self._idx1 = []            # (offset relative to 'movi', size) for the first RIFF chunk
+        self._chunk_index = []     # (absolute data offset, size) for the current RIFF chunk
+        self._super_index = []     # (absolute offset of ix00 chunk, ix00 chunk size, frames) per RIFF chunk
+
+        self._file = open(filename, "wb")
+        self._write_riff_header()
+
+    def isOpened(self):
+        return self._file is not None
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_FPS and value > 0:
+            self.fps = float(value)
+            return True
+        return False
+
+    def write(self, payload):
+        if isinstance(payload, np.ndarray):
+            payload = payload.reshape(-1)
+        size = len(payload)
+
+        if self._chunk_index and self._file.tell() - self._riff_start + size + 8 > self.riff_size_limit:
+            self._close_riff()
+            self._open_avix()
+
+        f = self._file
+        f.write(b"00dc" + struct.pack("<I", size))
+        data_offset = f.tell()
+        f.write(payload)
+        if size % 2:
+            f.write(b"\x00")  # RIFF chunks are word aligned
+
+        self._chunk_index.append((data_offset, size))
+        if self._riff_number == 0:
+            self._idx1.append((data_offset - 8 - self._movi_start, size))
+            self.first_riff_frames += 1
+        self.total_frames += 1
+        self.max_payload = max(self.max_payload, size)
+
+    def release(self):
+        if self._file is None:
+            return
+        self._close_riff()
+
+        # Patch the header with the final frame count, frame rate and super index
+        self._file.seek(self._hdrl_start)
+        self._file.write(self._build_hdrl())
+        self._file.close()
+        self._file = None
+
+    # === File layout helpers ===
+    def _write_riff_header(self):
+        f = self._file
+        self._riff_number = 0
+        self._riff_start = 0
+        f.write(b"RIFF" + struct.pack("<I", 0) + b"AVI ")
+        self._hdrl_start = f.tell()
+        f.write(self._build_hdrl())
+        self._open_movi()
+
+    def _open_avix(self):
+        f = self._file
+        self._riff_number += 1
+        self._riff_start = f.tell()
+        f.write(b"RIFF" + struct.pack("<I", 0) + b"AVIX")
+        self._open_movi()
+
+    def _open_movi(self):
+        f = self._file
+        self._movi_list_start = f.tell()
+        f.write(b"LIST" + struct.pack("<I", 0) + b"movi")
+        self._movi_start = self._movi_list_start + 8  # Position of the 'movi' fourcc, idx1 offsets are relative to it
+        self._chunk_index = []
+
+    def _close_riff(self):
+        f = self._file
+
+        # Standard index of this RIFF chunk ('ix00'), stored at the end of the movi list
+        if len(self._super_index) >= SUPER_INDEX_ENTRIES:
+            raise IOError(f"Recording exceeds {SUPER_INDEX_ENTRIES} RIFF chunks, use a larger riff_size_limit.")
+        base_offset = self._movi_start
+        ix_start = f.tell()
+        ix_size = 24 + 8 * len(self._chunk_index)
+        f.write(b"ix00" + struct.pack("<I", ix_size))
+        f.write(struct.pack("<HBBI4sQI", 2, 0, AVI_INDEX_OF_CHUNKS, len(self._chunk_index), b"00dc", base_offset, 0))
+        f.write(b"".join(struct.pack("<II", offset - base_offset, size) for offset, size in self._chunk_index))
+        self._super_index.append((ix_start, ix_size + 8, len(self._chunk_index)))
+
+        # Close the movi list
+        movi_end = f.tell()
+        self._patch_size(self._movi_list_start, movi_end)
+
+        # The first RIFF chunk also gets a legacy idx1 index for players without OpenDML support
+        if self._riff_number == 0:
+            f.write(b"idx1" + struct.pack("<I", 16 * len(self._idx1)))
+            f.write(b"".join(struct.pack("<4sIII", b"00dc", AVIIF_KEYFRAME, offset, size) for offset, size in self._idx1))
+
+        self._patch_size(self._riff_start, f.tell())
+        f.seek(0, 2)
+
+    def _patch_size(self, chunk_start, chunk_end):
+        f = self._file
+        f.seek(chunk_start + 4)
+        f.write(struct.pack("<I", chunk_end - chunk_start - 8))
+        f.seek(chunk_end)
+
+    def _build_hdrl(self):
+        # Frame rate as a rational number, precise enough for measured (non integer) frame rates
+        rate, scale = int(round(self.fps * 1000)), 1000
+        usec_per_frame = int(round(1e6 / self.fps)) if self.fps > 0 else 0
+        suggested_buffer = self.max_payload + 8
+
+        avih = struct.pack("<14I", usec_per_frame, int(suggested_buffer * self.fps), 0,
+                           AVIF_HASINDEX | AVIF_ISINTERLEAVED, self.first_riff_frames, 0, 1,
+                           suggested_buffer, self.width, self.height, 0, 0, 0, 0)
+        strh = struct.pack("<4s4sIHHIIIIIIIIhhhh", b"vids", b"MJPG", 0, 0, 0, 0, scale, rate, 0,
+                           self.total_frames, suggested_buffer, 0xFFFFFFFF, 0, 0, 0, self.width, self.height)
+        strf = struct.pack("<IiiHH4sIiiII", 40, self.width, self.height, 1, 24, b"MJPG",
+                           self.width * self.height * 3, 0, 0, 0, 0)
+
+        entries = list(self._super_index) + [(0, 0, 0)] * (SUPER_INDEX_ENTRIES - len(self._super_index))
+        indx = struct.pack("<HBBI4s3I", 4, 0, AVI_INDEX_OF_INDEXES, len(self._super_index), b"00dc", 0, 0, 0)
+        indx += b"".join(struct.pack("<QII", offset, size, duration) for offset, size, duration in entries)
+
+        dmlh = struct.pack("<I", self.total_frames) + bytes(244)
+
+        strl = (self._chunk(b"strh", strh) + self._chunk(b"strf", strf) + self._chunk(b"indx", indx))
+        hdrl = (self._chunk(b"avih", avih) + self._list(b"strl", strl) + self._list(b"odml", self._chunk(b"dmlh", dmlh)))
+        return self._list(b"hdrl", hdrl)
+
+    @staticmethod
+    def _chunk(fourcc, data):
+        return fourcc + struct.pack("<I", len(data)) + data
+
+    @staticmethod
+    def _list(list_type, data):
+        return b"LIST" + struct.pack("<I", len(data) + 4) + list_type + data
@@ -0,0 +1,282 @@
+"""
+MultiObjectTracker Class
+
+This class tracks several UMRs (a swarm) in one pass over the video. It extends the VideoTracker, so the video,
+timestamps, box selection and output names are the same; only the tracking loop handles N ROIs instead of one.
+
+Main Workflow:
+- The box and one ROI per UMR are selected (cv2.selectROIs, press ENTER after every ROI and ESC when done) or given.
+- Every frame is decoded once and converted to grayscale once, into a reusable full-frame buffer. Every ROI is
+  thresholded (Otsu) on its own crop of that buffer and its blobs (connected components of at least min_blob_fraction
+  of the largest blob in the ROI) are collected as candidates. Blobs found by several overlapping ROIs are merged.
+- The candidates are assigned to the objects per frame by solving the assignment problem (Hungarian algorithm) on
+  the distance between the current object positions and the candidate centroids. Assignments further away than
+  max_distance_px are rejected, so a UMR that is not found keeps its ROI (and is counted as lost) instead of
+  jumping onto a neighbour.
+- Every ROI is re-centred on its assigned blob, keeping its size.
+- With undistort=True the whole frame is undistorted before the grayscale conversion (the ROIs share that frame).
+- The results (sub-pixel centroid, orientation, area and confidence from the blob moments, like the VideoTracker) are
+  saved to one long-format _locations table with an Object column (one row per frame and object), which the
+  TrajectoryReconstructor splits with its object_id argument, and to the typed copy _locations.npy.
+
+Methods:
+- __init__(video_path, max_distance_px, min_blob_fraction, ...): Initializes the tracker (other arguments as for the VideoTracker).
+- select_rois(rois): Lets the user select one ROI per UMR in the first frame (or uses the given ROIs).
+- update_rois(frame, rois): Finds the candidate blobs, assigns them to the objects and returns the updated ROIs.
+- track_and_save(box, rois): Tracks all objects and saves the long-format locations file.
+
+Functions:
+- solve_assignment(cost): Minimum cost assignment of the rows to the columns of a cost matrix.
+- load_multi_tracking_config(path): Loads the box and the ROIs from a JSON file ({"box": [...], "rois": [[...], ...]}).
+
+Usage (headless):
+    python -m include.MultiTrackerClass <video.avi> --config swarm.json --headless
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from include.TrackerClassV3 import LOCATION_COLUMNS, VideoTracker, blob_measurement
+except ImportError:  # When this file is run directly from the include folder
+    from TrackerClassV3 import LOCATION_COLUMNS, VideoTracker, blob_measurement
+
+# Long-format locations: the columns of the VideoTracker with the object ID after the frame number
+MULTI_LOCATION_COLUMNS = LOCATION_COLUMNS[:1] + ["Object"] + LOCATION_COLUMNS[1:]
+MULTI_LOCATIONS_DTYPE = np.dtype([("frame", "<u4"), ("object", "<u2"), ("time", "<f8"), ("x", "<f4"), ("y", "<f4"),
+                                  ("angle", "<f4"), ("area", "<f4"), ("confidence", "<f4")])
+
+def solve_assignment(cost):
+    # Hungarian algorithm (potentials, O(n^2 m)) for n rows <= m columns, returns the column of every row.
+    # A wide matrix is used as it is, a tall matrix is solved transposed.
+    cost = np.asarray(cost, dtype=np.float64)
+    n_rows, n_cols = cost.shape
+    if n_rows == 0 or n_cols == 0:
+        return np.full(n_rows, -1, dtype=int)
+    if n_rows > n_cols:
+        col_of_row = np.full(n_rows, -1, dtype=int)
+        row_of_col = solve_assignment(cost.T)
+        col_of_row[row_of_col] = np.arange(n_cols)
+        return col_of_row
+
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    row_of = np.zeros(n_cols + 1, dtype=int)  # 1-based row assigned to every column, 0 = free
+    way = np.zeros(n_cols + 1, dtype=int)
+    for row in range(1, n_rows + 1):
+        row_of[0] = row
+        col = 0
+        min_slack = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        while row_of[col] != 0:
+            used[col] = True
+            current_row = row_of[col]
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            free = ~used[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = col
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_col = 1 + int(np.argmin(candidates))
+            delta = candidates[next_col - 1]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            min_slack[1:][free] -= delta
+            col = next_col
+        while col:
+            previous_col = way[col]
+            row_of[col] = row_of[previous_col]
+            col = previous_col
+
+    col_of_row = np.full(n_rows, -1, dtype=int)
+    for col in range(1, n_cols + 1):
+        if row_of[col]:
+            col_of_row[row_of[col] - 1] = col - 1
+    return col_of_row
+
+def load_multi_tracking_config(path):
+    # Box and initial ROIs (one per UMR) for headless tracking
+    with open(path) as f:
+        config = json.load(f)
+    box = tuple(int(v) for v in config["box"]) if config.get("box") is not None else None
+    rois = [tuple(int(v) for v in roi) for roi in config["rois"]] if config.get("rois") is not None else None
+    return box, rois
+
+class MultiObjectTracker(VideoTracker):
+    def __init__(self, video_path, max_distance_px=None, min_blob_fraction=0.25, **kwargs):
+        super().__init__(video_path, **kwargs)
+        self._remap_rois = False  # All ROIs share one grayscale frame, so with undistort=True the whole frame is undistorted
+        self.max_distance_px = max_distance_px  # Default: the largest ROI side
+        self.min_blob_fraction = min_blob_fraction
+        self._gray_frame = None
+        self.lost_per_object = None
+        self.measurements = []  # Measurement (or None if lost) of every object in the last frame
+
+    def select_rois(self, rois=None):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        ret, frame = self.read_frame()
+        if not ret:
+            print("Cannot read from the video.")
+            self.cap.release()
+            self._destroy_windows()
+            raise RuntimeError("Video reading error.")
+
+        if rois is None:
+            if self.headless:
+                raise ValueError("The initial ROIs are required in headless mode.")
+            print("Select one ROI per UMR (ENTER after every ROI, ESC when done)")
+            rois = cv2.selectROIs("Select the ROIs", frame, fromCenter=False, showCrosshair=True)
+            cv2.destroyWindow("Select the ROIs")
+        rois = [tuple(int(v) for v in roi) for roi in rois]
+        if not rois:
+            raise ValueError("No ROIs selected.")
+        return frame, rois
+
+    def _candidates(self, rois):
+        # Blobs in every ROI of the shared grayscale frame, in frame coordinates: (x, y, angle, area, confidence)
+        candidates = []
+        for x, y, w, h in rois:
+            gray_roi = self._gray_frame[y:y+h, x:x+w]
+            _, threshold = cv2.threshold(gray_roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+            n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(threshold, connectivity=8, ltype=cv2.CV_32S)
+            if n_labels < 2:
+                continue
+            areas = stats[1:, cv2.CC_STAT_AREA]
+            keep = np.flatnonzero(areas >= self.min_blob_fraction * areas.max())
+            for label in keep + 1:
+                bx, by, bw, bh = stats[label, :4]
+                blob_mask = np.equal(labels[by:by+bh, bx:bx+bw], label).view(np.uint8)
+                center_x, center_y, angle, area = blob_measurement(cv2.moments(blob_mask, binaryImage=True), x + bx, y + by)
+                candidates.append((center_x, center_y, angle, area, area / areas.sum()))
+
+        # The same blob seen by overlapping ROIs is one candidate
+        merged = []
+        for candidate in sorted(candidates, key=lambda c: -c[3]):
+            if all(np.hypot(candidate[0] - m[0], candidate[1] - m[1]) > 2.0 for m in merged):
+                merged.append(candidate)
+        return np.array(merged, dtype=np.float64).reshape(-1, 5)
+
+    def update_rois(self, frame, rois):
+        height, width = frame.shape[:2]
+
+        # Clip the ROIs to the frame
+        clipped = []
+        for x, y, w, h in rois:
+            clipped.append((x, y, min(w, width - x), min(h, height - y)))
+
+        # One grayscale conversion per frame, shared by all ROIs
+        if self._gray_frame is None or self._gray_frame.shape != (height, width):
+            self._gray_frame = np.empty((height, width), dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray_frame)
+        candidates = self._candidates(clipped)
+
+        # Assign the candidates to the objects on the distance to the current object position (ROI centre)
+        centers = np.array([(x + w / 2, y + h / 2) for x, y, w, h in clipped], dtype=np.float64)
+        max_distance = self.max_distance_px or max(max(w, h) for _, _, w, h in clipped)
+        assignment = np.full(len(clipped), -1, dtype=int)
+        if len(candidates):
+            cost = np.hypot(centers[:, None, 0] - candidates[None, :, 0], centers[:, None, 1] - candidates[None, :, 1])
+            assignment = solve_assignment(cost)
+            rows = np.flatnonzero(assignment >= 0)
+            rejected = rows[cost[rows, assignment[rows]] > max_distance]
+            assignment[rejected] = -1
+
+        new_rois = []
+        self.measurements = [None if j < 0 else tuple(float(v) for v in candidates[j]) for j in assignment]
+        for i, (x, y, w, h) in enumerate(clipped):
+            if assignment[i] < 0:
+                self.lost_per_object[i] += 1
+                new_rois.append((x, y, w, h))
+                continue
+            center_x_, center_y_ = int(candidates[assignment[i], 0]), int(candidates[assignment[i], 1])
+            new_x = min(max(center_x_ - w // 2, 0), width - w)
+            new_y = min(max(center_y_ - h // 2, 0), height - h)
+            new_rois.append((new_x, new_y, w, h))
+
+        # Draw the ROIs with their object ID for the annotated path
+        if not self.lean:
+            for i, (x, y, w, h) in enumerate(new_rois):
+                color = (0, 0, 255) if assignment[i] >= 0 else (0, 165, 255)
+                cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+                cv2.putText(frame, str(i), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        return frame, new_rois
+
+    def track_and_save(self, box=None, rois=None):
+        # Manually select the box and the ROIs (or use the given ones)
+        self.select_and_save_box(box)
+        frame, rois = self.select_rois(rois)
+        self.lost_per_object = [0] * len(rois)
+
+        # Start tracking at the first frame, the frame used for the selection is tracked as well
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        if self.write_video and not self.lean:
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            self.out_video = cv2.VideoWriter(self.output_video_filename, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+
+        written = []
+        frame_number = 0
+        start_time = time.perf_counter()
+        while True:
+            ret, frame = self.read_frame()
+            if not ret:
+                break
+
+            if frame_number < len(self.timestamps):
+                time_seconds = self.timestamps[frame_number]
+            else:
+                raise IndexError(f"No timestamp for frame {frame_number}")
+
+            # Update all ROIs from one decoded frame and keep one row per object
+            frame, rois = self.update_rois(frame, rois)
+            for object_id, roi in enumerate(rois):
+                self.measurement = self.measurements[object_id]
+                written.append((frame_number, object_id, time_seconds) + tuple(self.roi_measurement(roi)))
+
+            if self.out_video is not None:
+                self.out_video.write(frame)
+
+            if not self.headless and not self.lean:
+                cv2.imshow("Tracking", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+            frame_number += 1
+            if frame_number % self.progress_interval == 0:
+                self._report_progress(frame_number, start_time)
+
+        self.write_locations(written, MULTI_LOCATION_COLUMNS, MULTI_LOCATIONS_DTYPE)
+        self._report_progress(frame_number, start_time)
+        print(f"Tracking throughput ({len(rois)} objects): {self.tracking_fps:.1f} fps")
+        for object_id, lost in enumerate(self.lost_per_object):
+            if lost:
+                print(f"[WARNING] Object {object_id} was not found in {lost} frames")
+        self.cap.release()
+        self._destroy_windows()
+        print(f"Tracking data saved to {self.locations_filename}")
+        if self.out_video is not None:
+            self.out_video.release()
+            print(f"Tracking video saved to {self.output_video_filename}")
+
+# Used when this class is run seperately
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track several UMRs in a recorded video in one pass.")
+    parser.add_argument("video", help="Recorded video (<name>_cam1.avi) or manifest of a segmented recording")
+    parser.add_argument("--config", help="JSON file with the box and the initial ROIs")
+    parser.add_argument("--headless", action="store_true", help="Do not open any window")
+    parser.add_argument("--lean", action="store_true", help="Measurement only: no annotation, display or _tracking.avi")
+    parser.add_argument("--write-video", action="store_true", help="Write the annotated _tracking.avi while tracking")
+    parser.add_argument("--max-distance", type=float, default=None, help="Largest accepted jump per frame in pixels")
+    parser.add_argument("--format", default="csv", choices=["csv", "npz", "parquet"], help="Format of the box and locations tables")
+    parser.add_argument("--undistort", action="store_true", help="Remove the lens distortion before thresholding")
+    args = parser.parse_args()
+
+    box, rois = load_multi_tracking_config(args.config) if args.config else (None, None)
+    tracker = MultiObjectTracker(args.video, max_distance_px=args.max_distance, headless=args.headless,
+                                 lean=args.lean, write_video=args.write_video, table_format=args.format,
+                                 undistort=args.undistort)
+    tracker.track_and_save(box=box, rois=rois)
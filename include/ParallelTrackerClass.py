@@ -0,0 +1,118 @@
+"""
+ParallelVideoTracker Class
+
+This class tracks a single (long) video with several processes. The video is split into frame ranges (chunks), every
+chunk is tracked by a VideoTracker in its own process and the results are stitched into the single _locations table.
+
+Main Workflow:
+- The box and the initial ROI are selected (or given) once, like for the VideoTracker.
+- Chunk 0 starts from the initial ROI. Every other chunk is seeded by the keyframe detector of the VideoTracker
+  (largest dark blob inside the box at the first frame of the chunk), with the size of the initial ROI.
+- Every chunk also tracks the first frame of the next chunk. While stitching, this overlap frame is compared with the
+  first frame of the next chunk (the ROI handoff). If the positions differ more than handoff_tolerance_px (or the
+  detector found nothing), the next chunk is tracked again, serially, starting from the ROI of the previous chunk.
+- The chunks never write video, so every worker tracks on the lean (measurement only) path, or on the predicted
+  search window with predict=True. The lean path measures the blob like the annotated path of the serial VideoTracker,
+  so the positions, areas and confidences do not depend on the number of workers.
+- With undistort=True every worker undistorts its ROIs with the remap tables that the main tracker computed (and
+  cached on disk) for the box and ROI selection, so the tables are computed only once.
+- The stitched rows are saved to the _locations table with the timestamps of the recording.
+
+Methods:
+- __init__(video_path, n_workers, n_chunks, handoff_tolerance_px, headless, table_format, undistort, intrinsics_file, predict): Sets up the tracker that owns the output files.
+- track_and_save(box, roi): Tracks all chunks in parallel, verifies the handoffs and saves the locations.
+
+Note: the parallel tracker does not write the annotated _tracking.avi and does not support ROI re-selection.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    from include.TrackerClassV3 import VideoTracker
+except ImportError:  # When this file is run directly from the include folder
+    from TrackerClassV3 import VideoTracker
+
+def _track_chunk(video_path, start_frame, stop_frame, roi, box, roi_size, undistort=False, intrinsics_file=None, predict=False):
+    # Runs in a worker process (lean path, nothing is drawn). Without a ROI the chunk is seeded by the keyframe detector.
+    tracker = VideoTracker(video_path, headless=True, lean=True, predict=predict, undistort=undistort,
+                           intrinsics_file=intrinsics_file)
+    if roi is None:
+        tracker.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        ret, frame = tracker.cap.read()
+        if ret and tracker.undistorter is not None:
+            frame = tracker.undistorter.undistort(frame)  # The box is in undistorted coordinates
+        roi = tracker.detect_roi(frame, box, roi_size) if ret else None
+        if roi is None:
+            tracker.cap.release()
+            return None
+    rows = tracker.track_range(start_frame, stop_frame, roi)
+    tracker.cap.release()
+    return rows
+
+class ParallelVideoTracker:
+    def __init__(self, video_path, n_workers=None, n_chunks=None, handoff_tolerance_px=None, headless=True, table_format="csv",
+                 undistort=False, intrinsics_file=None, predict=False):
+        self.video_path = video_path
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.n_chunks = n_chunks or self.n_workers
+        self.handoff_tolerance_px = handoff_tolerance_px
+        self.undistort = undistort
+        self.intrinsics_file = intrinsics_file
+        self.predict = predict
+
+        # This tracker owns the output files and the timestamps, the workers create their own
+        self.tracker = VideoTracker(video_path, headless=headless, table_format=table_format, undistort=undistort,
+                                    intrinsics_file=intrinsics_file)
+        self.locations_filename = self.tracker.locations_filename
+
+    def track_and_save(self, box=None, roi=None):
+        box = self.tracker.select_and_save_box(box)
+        _, roi = self.tracker.select_roi(roi)
+        roi_size = (roi[2], roi[3])
+        tolerance = self.handoff_tolerance_px or max(roi_size) / 4
+
+        # Split the video in chunks, every chunk (except the last) also tracks the first frame of the next one
+        total_frames = int(self.tracker.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        bounds = np.linspace(0, total_frames, self.n_chunks + 1).astype(int)
+        chunks = [(int(bounds[i]), int(bounds[i + 1])) for i in range(self.n_chunks) if bounds[i + 1] > bounds[i]]
+        print(f"[INFO] Tracking {total_frames} frames in {len(chunks)} chunks with {self.n_workers} processes")
+
+        with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+            futures = []
+            for i, (start_frame, stop_frame) in enumerate(chunks):
+                last_chunk = i == len(chunks) - 1
+                futures.append(pool.submit(_track_chunk, self.video_path, start_frame,
+                                           None if last_chunk else stop_frame + 1,
+                                           roi if i == 0 else None, box, roi_size, self.undistort, self.intrinsics_file,
+                                           self.predict))
+            results = [future.result() for future in futures]
+
+        # Stitch the chunks, verifying the ROI handoff at every chunk boundary
+        rows = []
+        overlap_row = None
+        for i, (start_frame, stop_frame) in enumerate(chunks):
+            last_chunk = i == len(chunks) - 1
+            chunk_rows = results[i]
+            if i > 0:
+                if overlap_row is None:
+                    raise RuntimeError(f"Chunk {i - 1} ended before frame {start_frame}, cannot hand over the ROI.")
+                if not chunk_rows or self._handoff_distance(overlap_row, chunk_rows[0]) > tolerance:
+                    print(f"[WARNING] ROI handoff failed at frame {start_frame}, re-tracking chunk {i} from the previous chunk")
+                    chunk_rows = _track_chunk(self.video_path, start_frame, None if last_chunk else stop_frame + 1,
+                                              overlap_row[-1], box, roi_size, self.undistort, self.intrinsics_file,
+                                              self.predict)
+
+            rows.extend(row[:-1] for row in chunk_rows if last_chunk or row[0] < stop_frame)
+            overlap_row = next((row for row in chunk_rows if row[0] == stop_frame), None)
+
+        self.tracker.cap.release()
+        self.tracker.save_locations(rows)
+        return rows
+
+    @staticmethod
+    def _handoff_distance(row_a, row_b):
+        return float(np.hypot(row_a[1] - row_b[1], row_a[2] - row_b[2]))
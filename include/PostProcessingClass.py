@@ -0,0 +1,145 @@
+"""
+PostProcessingQueue Class
+
+Runs the analysis of finished recordings (tracking, trajectory reconstruction, trajectory plot and the annotated
+video) as jobs in background worker processes, so the recorder GUI stays responsive and the camera keeps being read.
+The next recording can be started while earlier recordings are still being analysed.
+
+Main Workflow:
+- The recorder (main.py) calls submit() when a recording is done, with the box and the initial ROI (selected in the
+  GUI) or with the locations table of the live tracking (then the video is not tracked again).
+- A job runs in a worker process (spawned, not forked, the recorder process has a camera and Tk): headless lean
+  tracking with the VideoTracker, reconstruction with the TrajectoryReconstructor, the trajectory plot saved as
+  <name>_Trajectory.png (no window is opened by a worker) and optionally the annotated video (TrackingRenderer).
+- The workers report the stage and the tracking progress of their job through a queue. The GUI calls poll() from its
+  own update loop (no extra thread), which reads these messages and the state of the jobs, and shows status_lines().
+- shutdown() waits for the queued and running jobs when the recorder is closed.
+
+Methods:
+- __init__(workers, render): Starts the worker pool (workers processes, jobs are run in submission order).
+- submit(video_path, locations_file, box, roi, table_format): Queues a job for a recording, returns the job.
+- poll(): Updates the state of all jobs (queued, running, done, failed) and their last progress message.
+- status_lines(max_jobs): Returns one line of text per job (the most recent jobs), for the GUI.
+- shutdown(wait): Stops the worker pool.
+
+Functions:
+- run_post_processing(job_id, video_path, locations_file, box, roi, table_format, render): The job itself, runs in a worker process.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from include.TrackerClassV3 import VideoTracker
+    from include.TrajectoryClassV5 import TrajectoryReconstructor
+    from include.RenderClass import TrackingRenderer
+except ImportError:  # When this file is run directly from the include folder
+    from TrackerClassV3 import VideoTracker
+    from TrajectoryClassV5 import TrajectoryReconstructor
+    from RenderClass import TrackingRenderer
+
+_progress_queue = None  # Set in every worker process by _init_worker
+
+def _init_worker(progress_queue):
+    # Worker processes never open windows, matplotlib draws into images only
+    global _progress_queue
+    _progress_queue = progress_queue
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+
+def _report(job_id, message):
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, message))
+
+def run_post_processing(job_id, video_path, locations_file=None, box=None, roi=None, table_format="csv", render=True):
+    # Runs in a worker process
+    if locations_file is None:
+        _report(job_id, "tracking")
+        tracker = VideoTracker(video_path, headless=True, lean=True, table_format=table_format,
+                               progress_callback=lambda frame, total, fps: _report(job_id, f"tracking {frame}/{total} ({fps:.0f} fps)"))
+        tracker.track_and_save(box=box, roi=roi)
+        locations_file = tracker.locations_filename
+
+    _report(job_id, "reconstructing")
+    reconstructor = TrajectoryReconstructor(locations_file, table_format=table_format)
+    reconstructor.reconstruct()
+    plot_file = os.path.splitext(reconstructor.output_file)[0] + ".png"
+    reconstructor.plot_trajectory(save_path=plot_file, show=False)
+
+    rendered_file = None
+    if render:
+        _report(job_id, "rendering the tracking video")
+        rendered_file = TrackingRenderer(video_path, locations_file).render()
+    return {"locations": locations_file, "trajectory": reconstructor.output_file, "plot": plot_file,
+            "video": rendered_file, "frames": len(reconstructor.timestamps)}
+
+class PostProcessingQueue:
+    def __init__(self, workers=1, render=True):
+        self.workers = workers
+        self.render = render
+
+        # Spawned workers: a forked copy of the recorder would inherit the camera, the Tk state and held locks
+        context = multiprocessing.get_context("spawn")
+        self._progress_queue = context.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                         initargs=(self._progress_queue,))
+        self.jobs = []  # One dict per job: id, name, status, message, submitted, finished, result, future
+
+    def submit(self, video_path, locations_file=None, box=None, roi=None, table_format="csv"):
+        if locations_file is None and (box is None or roi is None):
+            raise ValueError("A post-processing job needs the box and ROI, or the locations table of the live tracking.")
+        job_id = len(self.jobs)
+        future = self._pool.submit(run_post_processing, job_id, video_path, locations_file, box, roi, table_format,
+                                   self.render)
+        job = {"id": job_id, "name": os.path.basename(video_path), "status": "queued", "message": "",
+               "submitted": time.time(), "finished": None, "result": None, "future": future}
+        self.jobs.append(job)
+        print(f"[INFO] Post-processing job {job_id} queued for {video_path}")
+        return job
+
+    def poll(self):
+        # Progress messages of the workers (only the last one per job is kept)
+        while True:
+            try:
+                job_id, message = self._progress_queue.get_nowait()
+            except Exception:  # queue.Empty, the multiprocessing queue raises the same class
+                break
+            # The first message of a job means a worker started it (future.running() is also True for the
+            # jobs that the pool already handed to its call queue)
+            job = self.jobs[job_id]
+            job["message"] = message
+            if job["status"] == "queued":
+                job["status"] = "running"
+
+        for job in self.jobs:
+            if job["status"] in ("done", "failed"):
+                continue
+            future = job["future"]
+            if future.done():
+                job["finished"] = time.time()
+                error = future.exception()
+                if error is None:
+                    job["status"] = "done"
+                    job["result"] = future.result()
+                    job["message"] = f"{job['result']['frames']} frames, plot: {os.path.basename(job['result']['plot'])}"
+                    print(f"[INFO] Post-processing job {job['id']} done: {job['result']['trajectory']}")
+                else:
+                    job["status"] = "failed"
+                    job["message"] = f"{type(error).__name__}: {error}"
+                    print(f"[WARNING] Post-processing job {job['id']} failed: {job['message']}")
+        return self.jobs
+
+    def status_lines(self, max_jobs=5):
+        lines = []
+        for job in self.jobs[-max_jobs:]:
+            end = job["finished"] or time.time()
+            lines.append(f"Job {job['id']} {job['name']}: {job['status']} ({end - job['submitted']:.0f} s) {job['message']}")
+        return lines
+
+    def shutdown(self, wait=True):
+        pending = sum(job["status"] in ("queued", "running") for job in self.poll())
+        if wait and pending:
+            print(f"[INFO] Waiting for {pending} post-processing jobs to finish")
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,62 @@
+"""
+PretriggerBuffer Class
+
+Circular buffer with the last N seconds of camera frames, kept while the recorder is not recording. When a recording
+is started the buffered frames are written first, so the recording starts N seconds before the button was pressed.
+
+Only the JPEG payloads of an MJPG camera (raw mode) are stored, as they are, which keeps the memory bounded. Decoded
+BGR frames are not buffered: JPEG encoding a 1080p frame on the capture thread costs about as much as a frame period
+at 30 fps. Every entry keeps the capture metadata (capture sequence number, capture time and backend timestamp) of
+its frame, so the flushed frames end up in the frame log with their real capture times.
+
+Methods:
+- __init__(seconds, max_megabytes): Creates an empty buffer, seconds=0 disables it.
+- add(frame, metadata): Adds a JPEG payload (other frames are ignored, returns False) and drops the frames that are too old or do not fit.
+- drain(): Returns all buffered (payload, metadata) entries (oldest first) and empties the buffer.
+- memory_bytes / duration_s / n_frames: Current memory use, time span and number of frames in the buffer.
+"""
+
+import collections
+
+class PretriggerBuffer:
+    def __init__(self, seconds=5.0, max_megabytes=200):
+        self.seconds = seconds
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self._entries = collections.deque()
+        self.memory_bytes = 0
+
+    @property
+    def enabled(self):
+        return self.seconds > 0 and self.max_bytes > 0
+
+    @property
+    def n_frames(self):
+        return len(self._entries)
+
+    @property
+    def duration_s(self):
+        if len(self._entries) < 2:
+            return 0.0
+        return (self._entries[-1][1][1] - self._entries[0][1][1]) / 1e9
+
+    def add(self, frame, metadata):
+        # Only camera payloads are stored (copied, the camera may reuse its buffer), BGR frames are not encoded here
+        if not self.enabled or not (frame.ndim == 1 or frame.shape[0] == 1):
+            return False
+        payload = frame.reshape(-1).copy()
+
+        self._entries.append((payload, metadata))
+        self.memory_bytes += payload.nbytes
+
+        # Drop the oldest frames until the buffer covers at most the configured time and memory
+        newest_ns = metadata[1]
+        while self._entries and (newest_ns - self._entries[0][1][1] > self.seconds * 1e9 or self.memory_bytes > self.max_bytes):
+            old_payload, _ = self._entries.popleft()
+            self.memory_bytes -= old_payload.nbytes
+        return True
+
+    def drain(self):
+        entries = list(self._entries)
+        self._entries.clear()
+        self.memory_bytes = 0
+        return entries
@@ -0,0 +1,105 @@
+"""
+PreviewPipeline Class
+
+This class renders the camera preview of the recorder GUI at a configurable display rate and resolution. All the
+buffers that are needed to show a frame (the resized BGR frame, the RGBA frame and the Tk PhotoImage) are allocated
+once and reused for every frame, so the preview does not allocate new arrays or PhotoImages while recording.
+
+Main Workflow:
+- The recorder asks due() whether a new preview frame should be shown, this limits the preview to display_fps
+  (and to the lower recording_display_fps while recording, so the preview does not compete with the recording).
+- render(frame) resizes the frame into the preallocated display buffer, converts it to RGBA in place and pastes it
+  into the PhotoImage that is shown by the Tk label (PIL only shares memory with RGBA buffers, not with RGB ones).
+- MJPG payloads are decoded directly at a reduced resolution (1/2, 1/4 or 1/8) if the display is small enough.
+- With an undistorter (see UndistortClass.py) the resized frame is undistorted with remap tables for the display size,
+  so the undistortion only costs a remap of the (smaller) preview image, not of the full camera frame.
+- With an enabled StageProfiler (see ProfilerClass.py) the stages of render() are measured: preview.decode,
+  preview.resize, preview.undistort, preview.cvtColor and preview.paste.
+
+Methods:
+- __init__(label, display_size, display_fps, recording_display_fps, frame_size, profiler): Preallocates the display buffers and PhotoImage.
+- period_ms(recording): Returns the interval (ms) between two preview updates.
+- due(recording): Returns True if it is time to show a new frame.
+- set_undistorter(undistorter): Undistorts the preview with the given (full frame) undistorter, None turns it off.
+- render(frame): Shows a BGR frame or an undecoded JPEG payload in the label.
+"""
+
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+try:
+    from include.ProfilerClass import StageProfiler
+except ImportError:  # When this file is run directly from the include folder
+    from ProfilerClass import StageProfiler
+
+# JPEG can be decoded at 1/2, 1/4 and 1/8 of the resolution for (almost) free
+REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+class PreviewPipeline:
+    def __init__(self, label, display_size=(1344, 756), display_fps=30, recording_display_fps=10, frame_size=(1920, 1080),
+                 profiler=None):
+        self.label = label
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        self.display_size = tuple(display_size)
+        self.display_fps = display_fps
+        self.recording_display_fps = recording_display_fps
+        self.frame_size = tuple(frame_size)
+        self._last_render = 0.0
+
+        # Preallocated display buffers, reused for every frame
+        width, height = self.display_size
+        self._bgr_buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self._undistorted_buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self.undistorter = None  # Undistorter for the display size, None shows the frames as captured
+        self._rgba_buffer = np.empty((height, width, 4), dtype=np.uint8)
+        self._image = Image.frombuffer("RGBA", self.display_size, self._rgba_buffer, "raw", "RGBA", 0, 1)
+        self._photo = ImageTk.PhotoImage(image=self._image)
+        self.label.config(image=self._photo)
+        self.label.imgtk = self._photo  # Keep a reference, otherwise Tk shows an empty image
+
+        # Largest reduced JPEG decode that still delivers at least the display resolution
+        self._decode_flag = cv2.IMREAD_COLOR
+        for factor, flag in REDUCED_DECODE_FLAGS:
+            if self.frame_size[0] // factor >= width and self.frame_size[1] // factor >= height:
+                self._decode_flag = flag
+                break
+
+    def period_ms(self, recording=False):
+        fps = self.recording_display_fps if recording else self.display_fps
+        return max(1, int(1000 / fps))
+
+    def due(self, recording=False):
+        return (time.perf_counter() - self._last_render) * 1000 >= self.period_ms(recording)
+
+    def set_undistorter(self, undistorter):
+        # The remap tables are made for the display size once, not for the camera frames
+        self.undistorter = undistorter.scaled(self.display_size) if undistorter is not None else None
+
+    def render(self, frame):
+        # Undecoded MJPG payloads are decoded here, at a reduced resolution if possible
+        profiler = self.profiler
+        t = profiler.start()
+        if frame.ndim == 1 or frame.shape[0] == 1:
+            frame = cv2.imdecode(frame, self._decode_flag)
+            if frame is None:
+                return False
+            t = profiler.lap("preview.decode", t)
+
+        # Resize, undistort and convert into the preallocated buffers
+        if frame.shape[1] != self.display_size[0] or frame.shape[0] != self.display_size[1]:
+            frame = cv2.resize(frame, self.display_size, dst=self._bgr_buffer, interpolation=cv2.INTER_LINEAR)
+            t = profiler.lap("preview.resize", t)
+        if self.undistorter is not None:
+            frame = self.undistorter.undistort(frame, dst=self._undistorted_buffer)
+            t = profiler.lap("preview.undistort", t)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=self._rgba_buffer)
+        t = profiler.lap("preview.cvtColor", t)
+
+        # The image shares its memory with the RGBA buffer, paste() copies it into the existing Tk image
+        self._photo.paste(self._image)
+        profiler.stop("preview.paste", t)
+        self._last_render = time.perf_counter()
+        return True
@@ -0,0 +1,272 @@
+"""
+StageProfiler Class
+
+Measures where the time of a frame goes, per stage of the hot paths (camera read, decode, cvtColor, Otsu threshold,
+findContours/connected components, annotation, VideoWriter.write, imshow, ...). The recorder (DualCameraApp, its
+AsyncVideoWriter and LiveTracker), the VideoTracker and the TrajectoryReconstructor take a profiler and time their
+stages with it. The profiler is disabled by default: a disabled profiler only returns 0 from start()/lap() and ignores
+the stop, so the instrumented code costs a few attribute look-ups per stage. Tune the rig on these measurements.
+
+For every stage a latency histogram is kept (bins of 1/8 of a power of two, so every bin spans at most 12.5% of its
+value and the whole range of nanoseconds to hours fits in a fixed list) with the exact count, total, minimum and
+maximum. With trace=True every measurement is also kept as an event (up to max_trace_events) for the Chrome trace,
+which shows the stages of every thread on a timeline (chrome://tracing or https://ui.perfetto.dev).
+
+Main Workflow:
+- Create StageProfiler(enabled=True, trace=True) and pass it to the recorder, tracker or reconstructor (profiler=...).
+- Hot paths time consecutive stages with one clock read per stage:
+      t = profiler.start()
+      ...; t = profiler.lap("tracker.cvtColor", t)
+      ...; t = profiler.lap("tracker.threshold", t)
+  stop(stage, start) ends a stage without starting the next one, stage(name) is a context manager for code that
+  is not per frame.
+- summary() returns the statistics per stage (count, total, mean, p50, p90, p99, min, max, share of the wall time),
+  format_summary() formats them as a table. save(base_path) writes <base_path>_profile.csv (the summary, as a table
+  of TableClass.py) and <base_path>_trace.json (Chrome trace), print_summary() prints the table.
+- Stages are named <component>.<stage>. Stages can be nested (e.g. tracker.frame contains tracker.read), so the shares
+  of all stages do not add up to 100%. Stages of different threads can together exceed 100%.
+
+Methods:
+- __init__(enabled, trace, max_trace_events): Creates a profiler (disabled by default).
+- enable(trace)/disable(): Turns the measurements on or off.
+- reset(): Removes all measurements.
+- start(): Returns the start time of a stage (0 if disabled).
+- lap(stage, start): Ends a stage and returns the start time of the next one.
+- stop(stage, start): Ends a stage.
+- record(stage, start_ns, duration_ns): Adds a measurement.
+- stage(name): Context manager that times its block.
+- summary(): Returns a list with the statistics of every stage, slowest (total time) first.
+- format_summary(): Returns the summary as a text table.
+- print_summary(): Prints the summary table.
+- save_summary(path, table_format): Writes the summary table.
+- save_chrome_trace(path): Writes the trace events as Chrome trace JSON.
+- save(base_path, table_format): Writes the summary table and the Chrome trace.
+
+Functions:
+- histogram_bin(duration_ns): Returns the histogram bin of a duration.
+- bin_edges(index): Returns the lower and upper edge (ns) of a histogram bin.
+
+Usage (overhead of the profiler itself):
+    python -m include.ProfilerClass
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    from include.TableClass import write_table
+except ImportError:  # When this file is run directly from the include folder
+    from TableClass import write_table
+
+SUB_BINS = 8  # Bins per power of two
+HISTOGRAM_BINS = SUB_BINS * 64  # Enough for any duration below 2**63 ns
+
+def histogram_bin(duration_ns):
+    # Durations below 8 ns get their own bin, above that the 3 bits after the leading bit select 1 of 8 sub bins
+    if duration_ns < SUB_BINS:
+        return max(int(duration_ns), 0)
+    shift = duration_ns.bit_length() - 4
+    return shift * SUB_BINS + (duration_ns >> shift)
+
+def bin_edges(index):
+    if index < SUB_BINS:
+        return index, index + 1
+    shift, mantissa = divmod(index, SUB_BINS)
+    return (SUB_BINS + mantissa) << (shift - 1), (SUB_BINS + mantissa + 1) << (shift - 1)
+
+class _StageStats:
+    __slots__ = ("count", "total_ns", "min_ns", "max_ns", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.histogram = [0] * HISTOGRAM_BINS
+
+    def percentile_ns(self, fraction):
+        # Middle of the bin that holds the percentile, limited to the measured minimum and maximum
+        rank = fraction * self.count
+        cumulative = 0
+        for index, count in enumerate(self.histogram):
+            cumulative += count
+            if count and cumulative >= rank:
+                lower, upper = bin_edges(index)
+                return min(max((lower + upper) / 2, self.min_ns), self.max_ns)
+        return self.max_ns
+
+class _StageContext:
+    __slots__ = ("profiler", "name", "start_ns")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.stop(self.name, self.start_ns)
+        return False
+
+_DISABLED_STAGE = contextlib.nullcontext()
+
+class StageProfiler:
+    def __init__(self, enabled=False, trace=False, max_trace_events=1_000_000):
+        self.max_trace_events = max_trace_events
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.trace = False
+        self.reset()
+        if enabled:
+            self.enable(trace)
+
+    def enable(self, trace=None):
+        if trace is not None:
+            self.trace = trace
+        if self._enabled_at is None:
+            self._enabled_at = time.perf_counter_ns()
+        self.enabled = True
+
+    def disable(self):
+        # The time while disabled is not part of the wall time of the summary
+        if self._enabled_at is not None:
+            self._wall_ns += time.perf_counter_ns() - self._enabled_at
+            self._enabled_at = None
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.events = []  # (stage, start_ns, duration_ns, thread id)
+            self.events_dropped = 0
+            self.thread_names = {}
+            self._wall_ns = 0
+            self._enabled_at = time.perf_counter_ns() if self.enabled else None
+
+    def start(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def lap(self, stage, start):
+        # A disabled profiler returns 0, so a stage that started while disabled is never recorded
+        if start:
+            now = time.perf_counter_ns()
+            self.record(stage, start, now - start)
+            return now
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def stop(self, stage, start):
+        if start:
+            self.record(stage, start, time.perf_counter_ns() - start)
+
+    def record(self, stage, start_ns, duration_ns):
+        thread_id = threading.get_ident()
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = _StageStats()
+            stats.count += 1
+            stats.total_ns += duration_ns
+            if stats.min_ns is None or duration_ns < stats.min_ns:
+                stats.min_ns = duration_ns
+            if duration_ns > stats.max_ns:
+                stats.max_ns = duration_ns
+            stats.histogram[histogram_bin(duration_ns)] += 1
+
+            if self.trace:
+                if len(self.events) < self.max_trace_events:
+                    self.events.append((stage, start_ns, duration_ns, thread_id))
+                    if thread_id not in self.thread_names:
+                        self.thread_names[thread_id] = threading.current_thread().name
+                else:
+                    self.events_dropped += 1
+
+    def stage(self, name):
+        return _StageContext(self, name) if self.enabled else _DISABLED_STAGE
+
+    def wall_ns(self):
+        return self._wall_ns + (time.perf_counter_ns() - self._enabled_at if self._enabled_at is not None else 0)
+
+    def summary(self):
+        wall_ns = self.wall_ns()
+        with self._lock:
+            stages = list(self.stages.items())
+        rows = []
+        for name, stats in sorted(stages, key=lambda item: item[1].total_ns, reverse=True):
+            rows.append({
+                "stage": name,
+                "count": stats.count,
+                "total_ms": stats.total_ns / 1e6,
+                "mean_us": stats.total_ns / stats.count / 1e3,
+                "p50_us": stats.percentile_ns(0.50) / 1e3,
+                "p90_us": stats.percentile_ns(0.90) / 1e3,
+                "p99_us": stats.percentile_ns(0.99) / 1e3,
+                "min_us": stats.min_ns / 1e3,
+                "max_us": stats.max_ns / 1e3,
+                "share_percent": 100 * stats.total_ns / wall_ns if wall_ns > 0 else 0.0,
+            })
+        return rows
+
+    def format_summary(self):
+        rows = self.summary()
+        if not rows:
+            return "No stages were measured (is the profiler enabled?)"
+        width = max(len("stage"), max(len(row["stage"]) for row in rows))
+        lines = [f"{'stage':<{width}}  {'count':>8}  {'total ms':>10}  {'mean us':>9}  {'p50 us':>9}  {'p90 us':>9}  "
+                 f"{'p99 us':>9}  {'max us':>10}  {'share':>6}"]
+        for row in rows:
+            lines.append(f"{row['stage']:<{width}}  {row['count']:>8}  {row['total_ms']:>10.1f}  {row['mean_us']:>9.1f}  "
+                         f"{row['p50_us']:>9.1f}  {row['p90_us']:>9.1f}  {row['p99_us']:>9.1f}  {row['max_us']:>10.1f}  "
+                         f"{row['share_percent']:>5.1f}%")
+        lines.append(f"Wall time {self.wall_ns() / 1e9:.2f} s (shares of nested stages and of other threads overlap)")
+        if self.events_dropped:
+            lines.append(f"[WARNING] {self.events_dropped} trace events were dropped (max_trace_events={self.max_trace_events})")
+        return "\n".join(lines)
+
+    def print_summary(self):
+        print(self.format_summary())
+
+    def save_summary(self, path, table_format="csv"):
+        rows = self.summary()
+        columns = ["stage", "count", "total_ms", "mean_us", "p50_us", "p90_us", "p99_us", "min_us", "max_us", "share_percent"]
+        return write_table(path, {column: [row[column] for row in rows] for column in columns}, table_format)
+
+    def save_chrome_trace(self, path):
+        # Complete events ("X") in microseconds, relative to the first event, one row per thread
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        origin_ns = min((event[1] for event in events), default=0)
+        pid = os.getpid()
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}}
+                        for thread_id, name in thread_names.items()]
+        for stage, start_ns, duration_ns, thread_id in events:
+            trace_events.append({"name": stage, "cat": stage.split(".")[0], "ph": "X", "pid": pid, "tid": thread_id,
+                                 "ts": (start_ns - origin_ns) / 1e3, "dur": duration_ns / 1e3})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def save(self, base_path, table_format="csv"):
+        summary_file = self.save_summary(f"{base_path}_profile", table_format)
+        print(f"[INFO] Profile summary saved to {summary_file}")
+        if self.trace:
+            trace_file = self.save_chrome_trace(f"{base_path}_trace.json")
+            print(f"[INFO] Chrome trace saved to {trace_file} (open in chrome://tracing or https://ui.perfetto.dev)")
+        return summary_file
+
+# Used when this class is run seperately: the cost of the instrumentation itself
+if __name__ == "__main__":
+    n_stages = 1_000_000
+    for label, profiler in (("disabled", StageProfiler()), ("enabled", StageProfiler(enabled=True)),
+                            ("enabled + trace", StageProfiler(enabled=True, trace=True))):
+        start = time.perf_counter()
+        t = profiler.start()
+        for _ in range(n_stages):
+            t = profiler.lap("stage", t)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>16}: {elapsed / n_stages * 1e9:6.0f} ns per stage")
@@ -10,14 +10,64 @@ to start/stop recording, adjust the camera focus, and save the recorded video fi
 recorded files are saved in AVI format, and the filenames are generated dynamically based 
 on user input.
 
+Two recording modes are available:
+- "xvid": every frame is decoded and re-encoded to XVID (small files, costs CPU).
+- "mjpg": MJPG passthrough, the JPEG payloads of the camera are stored as they arrive in an MJPG AVI
+  (no decode/re-encode, larger files). Only the frames that the preview shows are decoded.
+If the camera backend does not deliver the raw JPEG payloads, the recorder falls back to "xvid".
+
+The metadata of every recorded frame (monotonic capture time, backend timestamp, frame index and dropped-frame gaps)
+is streamed to a binary sidecar <name>_frames.bin (see FrameLogClass.py), which is used by the tracker and the
+trajectory reconstruction. A <name>_timestamps table (CSV, or NPZ/Parquet with table_format, see TableClass.py) is
+still exported from it for other scripts.
+
+With segment_seconds and/or segment_megabytes the recording rolls over to a new file (<name>_cam1_segNNN.avi, each
+with its own sidecar) and a manifest <name>_cam1_manifest.json lists the segments (see SegmentClass.py). The
+manifest is then passed to the recording done callback and can be opened by the VideoTracker as one stream.
+
+In "mjpg" mode the last pretrigger_seconds of payloads are kept in a pre-trigger buffer while not recording (limited
+to pretrigger_megabytes, see PretriggerClass.py). They are written at the start of the next recording with their
+original capture times. The buffer is not used in "xvid" mode: the encoder would have to catch up on seconds of
+frames while the live frames overflow its queue, and encoding every idle frame to JPEG would load the capture thread.
+The GUI says so while "xvid" is selected, and a warning is printed when a recording starts without the buffer.
+
+If the camera is calibrated (intrinsics file of CalibrationClass.py), the preview can be undistorted with the
+"Undistort preview" check box. Only the resized preview is remapped (cached remap tables, see UndistortClass.py), the
+recording itself is never undistorted.
+
+With "Live tracking" checked (and a box and ROI selected with "Select box and ROI"), the recorded frames are also
+tracked during the recording by a LiveTracker (see LiveTrackerClass.py) on its own thread. The position and velocity
+are shown in the GUI and the <name>_cam1_locations table is written while recording, so the recording done callback
+can skip the VideoTracker (live_locations_file is set after the recording). If the live tracker fell behind and did
+not track every frame, live_locations_file stays None and the recording is tracked again (with live_box and live_roi).
+
+Finished recordings are analysed by a PostProcessingQueue (see PostProcessingClass.py) in background processes, the
+recording done callback only submits a job (app.post_processing.submit). The state of the jobs is shown in the
+window, and a new recording can be started while earlier recordings are analysed.
+
+With an enabled StageProfiler (profiler=..., see ProfilerClass.py, python main.py --profile) the time of every stage is
+measured on every thread: the capture thread (capture.read, capture.decode, capture.pretrigger, capture.writer_push,
+capture.live_push, capture.frame), the writer thread (writer.write), the live tracker (live.*, tracker.*) and the Tk
+thread (preview.*, gui.labels, gui.jobs, gui.update_frame). The measurements start again with every recording and are
+printed and saved when it stops (<name>_profile.csv and <name>_trace.json, a Chrome trace).
+
+The frames are read from a frame source (frame_source=..., see FrameSourceClass.py), by default the camera. A recording
+can be replayed at its original capture times, or synthetic frames can be generated at any frame rate (e.g. to load test
+the capture, writer and live tracking at 60 or 120 fps without a camera: python main.py --source synthetic --fps 120).
+The frame size and frame rate of the recordings follow the source.
+
 Methods:
-- __init__(window): Initializes the application window, sets up the GUI components, and initializes cameras.
+- __init__(window, writer_queue_size, record_mode, preview_size, preview_fps, recording_preview_fps, segment_seconds, segment_megabytes, pretrigger_seconds, pretrigger_megabytes, table_format, undistort_preview, intrinsics_file, live_tracking, post_processing_workers, profiler, frame_source): Initializes the application window, sets up the GUI components, and initializes cameras (or the given frame source).
 - set_focus1(val): Sets the focus of camera 1 based on the slider value.
 - set_focus2(val): Sets the focus of camera 2 based on the slider value.
 - set_recording_done_callback(callback): Sets a callback function to be called when the recording is finished.
+- toggle_undistort_preview(): Turns the undistortion of the preview on or off (check box).
+- select_live_tracking_roi(): Lets the user select the box and the UMR ROI in the latest frame for the live tracking.
 - toggle_recording(): Starts or stops the recording process.
-- update_frame(): Continuously updates the frames from both cameras in the GUI.
-- on_closing(): Releases the video capture objects and destroys the window when the application is closed.
+- _on_record_mode_change(): Turns the pre-trigger buffer on ("mjpg") or off ("xvid", the buffer is emptied).
+- _capture_loop(): Runs on a dedicated thread, reads the camera as fast as it delivers and hands the frames to the recorder.
+- update_frame(): Shows the latest captured frame (at the preview rate) and the writer statistics in the GUI (Tk thread only, never blocks the capture).
+- on_closing(): Releases the video capture objects and destroys the window when the application is closed (after that it waits for the post-processing jobs).
 
 Author: Stijn Kolkman (s.y.kolkman@student.utwente.nl)
 Date: April 2025
@@ -26,46 +76,115 @@ Date: April 2025
 import cv2
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
 import time
 import numpy as np 
 import os
 import subprocess 
-import csv
-
-cap_api = cv2.CAP_DSHOW  # Found to be the best API for using with logitech C920 in Windows. Other options are also possible
+import threading
+
+try:
+    from include.WriterClass import AsyncVideoWriter
+    from include.MjpgWriterClass import MjpgAviWriter
+    from include.PreviewClass import PreviewPipeline
+    from include.FrameLogClass import FrameLogWriter, frame_log_path, frame_log_timestamps
+    from include.SegmentClass import SegmentedVideoWriter, load_recording_frame_log
+    from include.PretriggerClass import PretriggerBuffer
+    from include.TableClass import write_table
+    from include.CalibrationClass import DEFAULT_INTRINSICS_FILE
+    from include.UndistortClass import load_undistorter
+    from include.LiveTrackerClass import LiveTracker
+    from include.PostProcessingClass import PostProcessingQueue
+    from include.ProfilerClass import StageProfiler
+    from include.FrameSourceClass import CameraSource, DEFAULT_CAMERA_API, open_frame_source
+except ImportError:  # When this file is run directly from the include folder
+    from WriterClass import AsyncVideoWriter
+    from MjpgWriterClass import MjpgAviWriter
+    from PreviewClass import PreviewPipeline
+    from FrameLogClass import FrameLogWriter, frame_log_path, frame_log_timestamps
+    from SegmentClass import SegmentedVideoWriter, load_recording_frame_log
+    from PretriggerClass import PretriggerBuffer
+    from TableClass import write_table
+    from CalibrationClass import DEFAULT_INTRINSICS_FILE
+    from UndistortClass import load_undistorter
+    from LiveTrackerClass import LiveTracker
+    from PostProcessingClass import PostProcessingQueue
+    from ProfilerClass import StageProfiler
+    from FrameSourceClass import CameraSource, DEFAULT_CAMERA_API, open_frame_source
+
+cap_api = DEFAULT_CAMERA_API  # CAP_DSHOW on Windows (best for the logitech C920), the default backend of OpenCV elsewhere
 
 class DualCameraApp:
-    def __init__(self, window):
+    def __init__(self, window, writer_queue_size=32, record_mode="xvid", preview_size=(1344, 756), preview_fps=30, recording_preview_fps=10,
+                 segment_seconds=None, segment_megabytes=None, pretrigger_seconds=5.0, pretrigger_megabytes=200,
+                 table_format="csv", undistort_preview=False, intrinsics_file=None, live_tracking=False,
+                 post_processing_workers=1, profiler=None, frame_source=None):
         self.window = window
+        self.table_format = table_format  # Format of the exported timestamps table (csv, npz or parquet)
         self.window.title("Dual Camera Recorder")
         self.recording = False
         self.recorded_file_names = None 
         self.N_frames_cam1 = 0
         self.record_start_time = None
+        self._first_capture_ns = None
+        self._last_capture_ns = None
+        self._capture_seq = 0
         # keep a handle for the after() call
         self._after_id = None
 
+        # Capture thread state. The camera is read on its own thread so recording never waits for Tk to repaint.
+        # _record_lock guards the writer/recording state, _frame_lock guards the latest frame handed to the preview
+        # and _cap_lock serialises access to the VideoCapture object (reads vs. focus changes from the GUI).
+        self._record_lock = threading.Lock()
+        self._frame_lock = threading.Lock()
+        self._cap_lock = threading.Lock()
+        self._latest_frame = None
+        self._latest_frame_id = 0
+        self._shown_frame_id = 0
+        self._capture_running = False
+        self._capture_thread = None
+
+        # Frames are encoded by a background writer fed by a bounded queue of preallocated frames
+        self.writer_queue_size = writer_queue_size
+        self.writer1 = None
+
+        # Recording mode ("xvid" or "mjpg" passthrough) and the mode that is used by the running recording
+        self.record_mode = tk.StringVar(value=record_mode)
+        self._active_record_mode = None
+        self._pretrigger_active = record_mode == "mjpg"  # Read by the capture thread (a Tk variable is not thread safe)
+        self.record_mode.trace_add("write", self._on_record_mode_change)
+
+        # Segmented recording: roll over to a new file after this many seconds/megabytes (None = one file)
+        self.segment_seconds = segment_seconds
+        self.segment_megabytes = segment_megabytes
+
+        # Live tracking during the recording, with the box and ROI selected before the recording starts
+        self.live_tracking = tk.BooleanVar(value=live_tracking)
+        self.live_box = None
+        self.live_roi = None
+        self.live_tracker1 = None
+        self.live_locations_file = None
+
+        # Time per stage on all threads of the recorder, a disabled profiler costs almost nothing
+        self.profiler = profiler if profiler is not None else StageProfiler()
+
+        # Background analysis of the finished recordings (the worker processes start with the first job)
+        self.post_processing = PostProcessingQueue(workers=post_processing_workers)
+        self._jobs_text = ""
+
+        # Pre-trigger buffer with the last seconds of frames before the recording starts (pretrigger_seconds=0 disables it)
+        self.pretrigger1 = PretriggerBuffer(seconds=pretrigger_seconds, max_megabytes=pretrigger_megabytes)
+
+        # Here the camera is defined. Camera's can have different numbers on different computers, so change the number if needed.
+        # Any other frame source (a replayed recording or synthetic frames, see FrameSourceClass.py) can be passed instead.
+        self.cap1 = frame_source if frame_source is not None else CameraSource(0, cap_api, frame_size=(1920, 1080), fps=30)
+
+        # Frame size and frame rate of the source and of the recordings
+        self.frame_width, self.frame_height = self.cap1.frame_size
+        self.capture_fps = self.cap1.fps
+
         # Define the size of the GUI
         self.window.geometry("1920x1080")
 
-        # Here the camera's are defined. Camera's can have different numbers on different computers, so change the number if needed (default is cap1 = 1, cap2 = 0)
-        self.cap1 = cv2.VideoCapture(0, cap_api)
-
-        # Camera resolution
-        self.cap1.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-        self.cap1.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-
-        # Camera framerate
-        self.cap1.set(cv2.CAP_PROP_FPS, 30)
-
-        # Camera compression technique --> If turned off the FPS will be really low (around 5 fps)
-        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-        self.cap1.set(cv2.CAP_PROP_FOURCC, fourcc)
-
-        #Turns off the autofocus 
-        self.cap1.set(cv2.CAP_PROP_AUTOFOCUS, 0)
-
         # === GUI components ===
         # Label to display the text "File name:"
         self.filename_label = tk.Label(window, text="File name:")
@@ -84,6 +203,21 @@ class DualCameraApp:
         self.video_label1 = tk.Label(self.frame_container)
         self.video_label1.pack(side="left", padx=10)
 
+        # Preview with its own (lower) display rate and resolution, it reuses the same buffers for every frame
+        self.preview1 = PreviewPipeline(self.video_label1, display_size=preview_size, display_fps=preview_fps,
+                                        recording_display_fps=recording_preview_fps,
+                                        frame_size=(self.frame_width, self.frame_height), profiler=self.profiler)
+
+        # Check box to undistort the preview, only if the camera is calibrated
+        self.intrinsics_file = intrinsics_file or DEFAULT_INTRINSICS_FILE
+        self.undistort_preview = tk.BooleanVar(value=False)
+        if os.path.exists(self.intrinsics_file):
+            tk.Checkbutton(window, text="Undistort preview", variable=self.undistort_preview,
+                           command=self.toggle_undistort_preview).pack()
+            if undistort_preview:
+                self.undistort_preview.set(True)
+                self.toggle_undistort_preview()
+
         # Label and slider for adjusting the focus of the first camera
         self.focus_label1 = tk.Label(window, text="Focus Camera 1")
         self.focus_label1.pack()
@@ -97,6 +231,18 @@ class DualCameraApp:
         self.focus_value_label1 = tk.Label(window, text=f"Focus Camera 1 Value: {self.focus_slider1.get()}")
         self.focus_value_label1.pack()
 
+        # Radio buttons to choose between re-encoding to XVID and storing the MJPG payloads as they arrive
+        self.record_mode_frame = tk.Frame(window)
+        self.record_mode_frame.pack()
+        tk.Radiobutton(self.record_mode_frame, text="XVID (re-encode)", variable=self.record_mode, value="xvid").pack(side="left")
+        tk.Radiobutton(self.record_mode_frame, text="MJPG passthrough (pre-trigger)", variable=self.record_mode, value="mjpg").pack(side="left")
+
+        # Check box and ROI selection for the live tracking
+        self.live_tracking_frame = tk.Frame(window)
+        self.live_tracking_frame.pack()
+        tk.Checkbutton(self.live_tracking_frame, text="Live tracking", variable=self.live_tracking).pack(side="left")
+        tk.Button(self.live_tracking_frame, text="Select box and ROI", command=self.select_live_tracking_roi).pack(side="left", padx=5)
+
         # Button to start or stop recording
         self.record_button = tk.Button(window, text="Start recording", command=self.toggle_recording, bg="red", fg="white")
         self.record_button.pack(pady=10)
@@ -105,8 +251,26 @@ class DualCameraApp:
         self.recorded_files_label = tk.Label(window, text="", fg="blue")
         self.recorded_files_label.pack(pady=10)
 
-        #Initiate timestamps array
-        self.timestamps = []
+        # Label to display the writer queue depth, written and dropped frames while recording
+        self.writer_stats_label = tk.Label(window, text="")
+        self.writer_stats_label.pack()
+
+        # Label to display the live tracking position and velocity
+        self.live_tracking_label = tk.Label(window, text="")
+        self.live_tracking_label.pack()
+
+        # Label to display how much of the pre-trigger buffer is filled (time and memory)
+        self.pretrigger_label = tk.Label(window, text="")
+        self.pretrigger_label.pack()
+
+        # Label to display the state of the post-processing jobs
+        self.jobs_label = tk.Label(window, text="", justify="left")
+        self.jobs_label.pack(pady=(10, 0))
+
+        # Start the capture thread, it reads the camera and feeds the recorder and the preview
+        self._capture_running = True
+        self._capture_thread = threading.Thread(target=self._capture_loop, name="CaptureThread", daemon=True)
+        self._capture_thread.start()
 
         # Method to continuously update the frame (e.g., display live video feed)
         self.update_frame()
@@ -117,42 +281,174 @@ class DualCameraApp:
     def set_focus1(self, val):
         # Update the focus on camera1
         focus_value = float(val)
-        self.cap1.set(cv2.CAP_PROP_FOCUS, focus_value)
+        with self._cap_lock:
+            self.cap1.set(cv2.CAP_PROP_FOCUS, focus_value)
         if hasattr(self, 'focus_value_label1'):  # Ensure the label exists before updating
             # Update the label
             self.focus_value_label1.config(text=f"Focus Camera 1 Value: {focus_value:.2f}")
 
+    def toggle_undistort_preview(self):
+        # The remap tables are loaded (or computed) once, when the undistortion is turned on for the first time
+        if self.undistort_preview.get():
+            if not hasattr(self, "undistorter1"):
+                self.undistorter1 = load_undistorter((self.frame_width, self.frame_height), self.intrinsics_file)
+            self.preview1.set_undistorter(self.undistorter1)
+        else:
+            self.preview1.set_undistorter(None)
+
+    def select_live_tracking_roi(self):
+        with self._frame_lock:
+            frame = self._latest_frame
+        if frame is None:
+            print("[WARNING] No camera frame yet, cannot select the live tracking ROI")
+            return
+        if self._is_jpeg_payload(frame):
+            frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+
+        print("Select the FULL box/container used for world scale reference")
+        box = cv2.selectROI("Select the Box", frame, fromCenter=False, showCrosshair=True)
+        cv2.destroyWindow("Select the Box")
+        roi = cv2.selectROI("Select the ROI", frame, fromCenter=False, showCrosshair=True)
+        cv2.destroyWindow("Select the ROI")
+        if roi[2] == 0 or roi[3] == 0:
+            print("[WARNING] No ROI selected, live tracking is not possible")
+            return
+        self.live_box = tuple(int(v) for v in box) if box[2] and box[3] else None
+        self.live_roi = tuple(int(v) for v in roi)
+        self.live_tracking.set(True)
+        self.live_tracking_label.config(text=f"Live tracking ROI: {self.live_roi}")
+
     def set_recording_done_callback(self, callback):
         # needed to send to  main that the recording is done and the tracker should start
         self.recording_done_callback = callback
 
+    def _on_record_mode_change(self, *args):
+        # The pre-trigger buffer is only filled in passthrough mode, switching to XVID discards its frames
+        self._pretrigger_active = self.record_mode.get() == "mjpg"
+        if not self._pretrigger_active:
+            with self._record_lock:
+                self.pretrigger1.drain()
+
     def toggle_recording(self):
-        self.recording = not self.recording
         filename = self.filename_entry.get().strip() or "recording"
         output_dir = os.path.join(os.getcwd(), filename)
         os.makedirs(output_dir, exist_ok=True)
 
         cam1_filename = os.path.join(output_dir, f"{filename}_cam1.avi")
 
-        if self.recording:
-            # Create video writer
-            self.N_frames_cam1 = 0
-            self.record_start_time = time.time()
+        if not self.recording:
+            # Passthrough is only possible if the camera actually delivers JPEG payloads
+            record_mode = self.record_mode.get()
+            if record_mode == "mjpg":
+                with self._frame_lock:
+                    latest_frame = self._latest_frame
+                if latest_frame is None or not self._is_jpeg_payload(latest_frame):
+                    print("[WARNING] Camera does not deliver raw MJPG payloads, recording with XVID instead")
+                    record_mode = "xvid"
+            if record_mode != "mjpg" and self.pretrigger1.enabled:
+                print(f"[WARNING] The pre-trigger buffer needs MJPG passthrough mode, this recording starts when the button "
+                      f"is pressed (not {self.pretrigger1.seconds:g} s before)")
+
+            # Create video writer before the capture thread is allowed to use it
+            frame_size = (self.frame_width, self.frame_height)
+            if record_mode == "mjpg":
+                make_writer = lambda path: MjpgAviWriter(path, self.capture_fps, frame_size)
+            else:
+                make_writer = lambda path: cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'XVID'), self.capture_fps, frame_size)
+
+            if self.segment_seconds or self.segment_megabytes:
+                # The segmented writer is both the video writer and the frame log (one sidecar per segment)
+                out1 = SegmentedVideoWriter(output_dir, filename, make_writer, segment_seconds=self.segment_seconds,
+                                            segment_megabytes=self.segment_megabytes, nominal_fps=self.capture_fps)
+                frame_log1 = out1
+            else:
+                out1 = make_writer(cam1_filename)
+                frame_log1 = FrameLogWriter(frame_log_path(output_dir, filename), nominal_fps=self.capture_fps)
+
+            if record_mode == "mjpg":
+                writer1 = AsyncVideoWriter(out1, None, queue_size=self.writer_queue_size,
+                                           max_payload_bytes=self.frame_width * self.frame_height, frame_log=frame_log1,
+                                           profiler=self.profiler)
+            else:
+                writer1 = AsyncVideoWriter(out1, (self.frame_height, self.frame_width, 3), queue_size=self.writer_queue_size,
+                                           frame_log=frame_log1, profiler=self.profiler)
+            # The profile of a recording starts with the recording
+            if self.profiler.enabled:
+                self.profiler.reset()
+
+            with self._record_lock:
+                # Take the pre-trigger frames and switch to recording at once, so no frame is lost or written twice.
+                # They are only written in passthrough mode (not after the fallback to XVID).
+                pretrigger_entries = self.pretrigger1.drain()
+                if record_mode != "mjpg":
+                    pretrigger_entries = []
+                self.out1 = out1
+                self.writer1 = writer1
+                self._active_record_mode = record_mode
+                self.N_frames_cam1 = len(pretrigger_entries)
+                self._first_capture_ns = pretrigger_entries[0][1][1] if pretrigger_entries else None
+                self._last_capture_ns = pretrigger_entries[-1][1][1] if pretrigger_entries else None
+                self.record_start_time = time.time()
+                self.live_locations_file = None
+                self.live_tracker1 = None
+                if self.live_tracking.get():
+                    if self.live_roi is None:
+                        print("[WARNING] Live tracking needs a ROI (Select box and ROI), recording without live tracking")
+                    else:
+                        # Started before the capture thread pushes the first live frame, the pre-trigger frames come first.
+                        # Its queue also holds the live frames that arrive while the pre-trigger frames are tracked.
+                        self.live_tracker1 = LiveTracker(output_dir, f"{filename}_cam1", self.live_roi, box=self.live_box,
+                                                         table_format=self.table_format, queue_size=64 + len(pretrigger_entries),
+                                                         profiler=self.profiler)
+                        self.live_tracker1.start(prefill=pretrigger_entries, first_capture_ns=self._first_capture_ns)
+                self.recording = True
+
+            # The writer thread writes the pre-trigger payloads first (no encoding), then the queued live frames
+            writer1.start(prefill=pretrigger_entries)
+            if pretrigger_entries:
+                print(f"[INFO] Writing {len(pretrigger_entries)} pre-trigger frames")
             self.record_button.config(text="Stop recording", bg="gray")
             self.recorded_files_label.config(text="Recording in progress...")
-            print(f"Started recording: {cam1_filename}")
-            
-            self.out1 = cv2.VideoWriter(cam1_filename, cv2.VideoWriter_fourcc(*'XVID'), 30, (1920, 1080))
+            print(f"Started recording ({record_mode}): {cam1_filename}")
 
         else:
-            # Stop recording and calculate FPS
+            # Stop the capture thread from writing, after this the writer is only used here
+            with self._record_lock:
+                self.recording = False
+
+            # Stop recording and calculate FPS from the capture times of the first and the last recorded frame
             duration = time.time() - self.record_start_time
-            fps_value = self.N_frames_cam1 / duration if duration > 0 else 30.0
+            fps_value = float(self.capture_fps)
+            if self.N_frames_cam1 > 1 and self._last_capture_ns > self._first_capture_ns:
+                fps_value = (self.N_frames_cam1 - 1) / ((self._last_capture_ns - self._first_capture_ns) / 1e9)
             print(f"Duration: {duration:.2f}s — FPS: {fps_value:.2f}")
 
             # Adjust the FPS value of the video writers after recording
             self.out1.set(cv2.CAP_PROP_FPS, fps_value)
-            self.out1.release()
+
+            # Let the writer thread encode the frames that are still queued, then release the writer
+            self.writer1.close()
+            stats = self.writer1.stats()
+            print(f"Frames written: {stats['frames_written']} — dropped: {stats['frames_dropped']} — max queue depth: {stats['max_queue_depth']}/{stats['queue_size']}")
+            stats_filename = os.path.join(output_dir, f"{filename}_writer_stats.csv")
+            self.writer1.save_stats(stats_filename)
+            self.writer_stats_label.config(text=self._format_writer_stats(stats))
+            print(f"[INFO] Writer stats saved to {stats_filename}")
+
+            # Track the frames that are still queued and write the final locations table
+            if self.live_tracker1 is not None:
+                locations_file = self.live_tracker1.close()
+                # Frames the live tracker skipped have no row, then the recording has to be tracked again
+                if self.live_tracker1.frames_dropped == 0:
+                    self.live_locations_file = locations_file
+                else:
+                    print(f"[WARNING] Live tracking skipped {self.live_tracker1.frames_dropped} frames, "
+                          f"the live results are not used and the recording is tracked again")
+                self.live_tracking_label.config(text=self._format_live_tracking(self.live_tracker1.status()))
+
+            # For segmented recordings the manifest stands for the recorded video
+            if isinstance(self.out1, SegmentedVideoWriter):
+                cam1_filename = self.out1.manifest_path
 
             self.record_button.config(text="Start recording", bg="red")
             files_text = f"Recorded files:\n{cam1_filename}"
@@ -160,51 +456,139 @@ class DualCameraApp:
             print("Recording done and saved")
             self.recorded_file_names = (cam1_filename)  # Store filenames
 
-            # Save timestamps to CSV
-            timestamp_filename = os.path.join(output_dir, f"{filename}_timestamps.csv")
-            with open(timestamp_filename, "w", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(["Frame", "Timestamp (s)"])
-                for i, ts in enumerate(self.timestamps):
-                    writer.writerow([i, ts])
-            self.timestamps = []  # Clear timestamps after saving
+            # Export the timestamps from the frame log sidecar(s) to a table (for scripts that do not read the sidecar)
+            records = load_recording_frame_log(output_dir, filename)
+            timestamps = frame_log_timestamps(records) if records is not None else []
+            timestamp_filename = write_table(os.path.join(output_dir, f"{filename}_timestamps"),
+                                             {"Frame": np.arange(len(timestamps)), "Timestamp (s)": timestamps},
+                                             self.table_format)
+
+            print(f"[INFO] Timestamps exported to {timestamp_filename}")
 
-            print(f"[INFO] Timestamps saved to {timestamp_filename}")
+            # Time per stage during this recording
+            if self.profiler.enabled:
+                self.profiler.print_summary()
+                self.profiler.save(os.path.join(output_dir, filename), self.table_format)
 
             # Call the callback when recording is done and change the fps to the correct value, but only if files are recorded
             if hasattr(self, 'recording_done_callback') and self.recorded_file_names:
                 self.recording_done_callback()  # Notify that recording is done
 
+    def _capture_loop(self):
+        # Runs on the capture thread: read the camera as fast as it delivers frames
+        profiler = self.profiler
+        while self._capture_running:
+            frame_start = t = profiler.start()
+            with self._cap_lock:
+                ret1, frame1 = self.cap1.read()
+                # Capture time on the monotonic clock, taken directly after the frame arrived, and the backend timestamp
+                capture_ns = time.perf_counter_ns()
+                pos_msec = self.cap1.get(cv2.CAP_PROP_POS_MSEC) if ret1 else 0.0
+            t = profiler.lap("capture.read", t)
+
+            if not ret1:
+                # Camera not delivering (yet), avoid spinning at 100% CPU
+                time.sleep(0.005)
+                continue
+            self._capture_seq += 1
+
+            metadata = (self._capture_seq, capture_ns, pos_msec)
+            with self._record_lock:
+                if not self.recording:
+                    # Keep the last seconds of payloads for the start of the next recording (passthrough mode only)
+                    if self._pretrigger_active:
+                        self.pretrigger1.add(frame1, metadata)
+                        t = profiler.lap("capture.pretrigger", t)
+                else:
+                    # In passthrough mode the payload is stored as is, otherwise the writer needs a decoded frame
+                    record_frame = frame1
+                    if self._active_record_mode == "xvid" and self._is_jpeg_payload(frame1):
+                        record_frame = cv2.imdecode(frame1, cv2.IMREAD_COLOR)
+                        t = profiler.lap("capture.decode", t)
+
+                    # Queue the frame for the background writer, the metadata is logged once the frame is written
+                    pushed = record_frame is not None and self.writer1.push(record_frame, metadata)
+                    t = profiler.lap("capture.writer_push", t)
+                    if pushed:
+                        # The live tracker gets exactly the frames of the video, with their index in the video
+                        if self.live_tracker1 is not None:
+                            self.live_tracker1.push(record_frame, self.N_frames_cam1, capture_ns)
+                            t = profiler.lap("capture.live_push", t)
+                        self.N_frames_cam1 += 1
+                        if self._first_capture_ns is None:
+                            self._first_capture_ns = capture_ns
+                        self._last_capture_ns = capture_ns
+
+            # Hand the frame (or the undecoded payload) to the preview, the preview only ever shows the latest one
+            with self._frame_lock:
+                self._latest_frame = frame1
+                self._latest_frame_id += 1
+            profiler.stop("capture.frame", frame_start)
+
     def update_frame(self):
         # Check if the window is still open before updating
         if not self.window.winfo_exists():
             return  # Exit the function if the window is closed
-        
-         #Read the frames
-        ret1, frame1 = self.cap1.read()
-
-        if self.recording and ret1:
-            # Save frames
-            self.N_frames_cam1 += 1
-            self.out1.write(frame1)
 
-            # Only log timestamp if both frames were successfully saved
-            timestamp = time.time() - self.record_start_time
-            self.timestamps.append(timestamp)
+        # The recorded frames are never undistorted, the preview is undistorted by the PreviewPipeline if turned on
+        profiler = self.profiler
+        frame_start = t = profiler.start()
 
-        #Undistort the frames --> I UNDISTORT IN THE TRAJECTORY GENERATOR CLASS
-        #frame1 = cv2.undistort(frame1, self.camera_matrix1, self.dist_coeffs1)
-        #frame2 = cv2.undistort(frame2, self.camera_matrix2, self.dist_coeffs2)
+        # Only render at the preview rate, frames captured in between are not shown (but they are recorded)
+        if self.preview1.due(self.recording):
+            with self._frame_lock:
+                frame1 = self._latest_frame
+                frame_id = self._latest_frame_id
 
-        if ret1:
-            # Update the GUI with the frame --> first the frame is resized to fit in the GUI 
-            frame1_resized = cv2.resize(frame1, (1344, 756), interpolation=cv2.INTER_LINEAR)
-            frame_rgb1 = cv2.cvtColor(frame1_resized, cv2.COLOR_BGR2RGB)
-            img1 = ImageTk.PhotoImage(Image.fromarray(frame_rgb1))
-            self.video_label1.imgtk = img1
-            self.video_label1.config(image=img1)
+            if frame1 is not None and frame_id != self._shown_frame_id:
+                self._shown_frame_id = frame_id
+                # Decoding (for MJPG payloads), resizing and conversion happen in the preview's preallocated buffers
+                self.preview1.render(frame1)
+                t = profiler.lap("preview.render", t)
 
-        self._after_id = self.window.after(10, self.update_frame)
+        if self.recording:
+            self.writer_stats_label.config(text=self._format_writer_stats(self.writer1.stats()))
+            if self.live_tracker1 is not None:
+                self.live_tracking_label.config(text=self._format_live_tracking(self.live_tracker1.status()))
+        elif self.pretrigger1.enabled and not self._pretrigger_active:
+            self.pretrigger_label.config(
+                text=f"Pre-trigger buffer OFF in XVID mode: select MJPG passthrough to also record the "
+                     f"{self.pretrigger1.seconds:g} s before Start", fg="orange red")
+        elif self.pretrigger1.enabled:
+            self.pretrigger_label.config(
+                fg="black",
+                text=f"Pre-trigger buffer: {self.pretrigger1.duration_s:.1f}/{self.pretrigger1.seconds:.1f} s — "
+                     f"{self.pretrigger1.memory_bytes / 2**20:.1f}/{self.pretrigger1.max_bytes / 2**20:.0f} MB")
+        t = profiler.lap("gui.labels", t)
+
+        # State of the post-processing jobs, the label is only changed when the text changes
+        if self.post_processing.jobs:
+            self.post_processing.poll()
+            jobs_text = "Post-processing:\n" + "\n".join(self.post_processing.status_lines())
+            if jobs_text != self._jobs_text:
+                self._jobs_text = jobs_text
+                self.jobs_label.config(text=jobs_text)
+            profiler.stop("gui.jobs", t)
+
+        profiler.stop("gui.update_frame", frame_start)
+        self._after_id = self.window.after(self.preview1.period_ms(self.recording), self.update_frame)
+
+    @staticmethod
+    def _is_jpeg_payload(frame):
+        # Raw MJPG captures are delivered as a single row of bytes that starts with the JPEG SOI marker
+        return (frame.dtype == np.uint8 and (frame.ndim == 1 or frame.shape[0] == 1)
+                and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8)
+
+    def _format_writer_stats(self, stats):
+        return (f"Writer queue: {stats['queue_depth']}/{stats['queue_size']} — "
+                f"written: {stats['frames_written']} — dropped: {stats['frames_dropped']}")
+
+    def _format_live_tracking(self, status):
+        if status["frame"] is None:
+            return "Live tracking: waiting for frames"
+        position = f"X {status['x']:.1f}, Y {status['y']:.1f} px" if status["found"] else "UMR not found"
+        return (f"Live tracking frame {status['frame']}: {position} — speed {status['speed']:.0f} px/s — "
+                f"lost: {status['frames_lost']} — not tracked: {status['frames_dropped']}")
 
     def on_closing(self):
         # cancel the pending after() callback so it won't fire
@@ -212,11 +596,34 @@ class DualCameraApp:
             self.window.after_cancel(self._after_id)
             self._after_id = None
 
+        # Stop the capture thread before the camera is released
+        self._capture_running = False
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=2.0)
+            self._capture_thread = None
+
+        # Do not leave a half written video behind if the window is closed while recording
+        with self._record_lock:
+            if self.recording:
+                self.recording = False
+                self.writer1.close()
+                if self.live_tracker1 is not None:
+                    self.live_tracker1.close()
+
         self.cap1.release()
         self.window.destroy()
 
+        # The window is gone, the analysis of the last recordings is still finished
+        self.post_processing.shutdown(wait=True)
+
 # Used if the recorder class is called seperately
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Record videos of the UMR.")
+    parser.add_argument("--source", default="camera", help='"camera", "camera:<index>", "synthetic" or a recorded video to replay')
+    parser.add_argument("--fps", type=float, default=None, help="Frame rate of the camera or synthetic source, or the replay speed as a frame rate")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = DualCameraApp(root)
+    app = DualCameraApp(root, frame_source=open_frame_source(args.source, fps=args.fps))
     root.mainloop()
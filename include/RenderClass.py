@@ -0,0 +1,185 @@
+"""
+TrackingRenderer Class
+
+This class renders the annotated tracking video (_tracking.avi) as a separate, optional stage after tracking. The
+overlay is regenerated from the _locations table and the source video, so the tracking (measurement) run itself does
+not pay for any drawing or video encoding.
+
+Main Workflow:
+- The tracked positions are loaded from the locations file, grouped per frame number (Frame column). A long-format
+  table of the MultiObjectTracker (Object column) has a row per frame and object, every object is drawn with its ID.
+- The source video is read from start_frame to stop_frame; with step > 1 only every step-th frame is retrieved and
+  rendered. The other frames are skipped with grab(): they are not converted, annotated or written, but the codec
+  still has to decode them (inter-coded XVID frames depend on the frames before them).
+- If the locations were tracked on undistorted frames (the "undistorted" flag in <name>_locations_meta.json, written
+  by the VideoTracker with undistort=True), every rendered frame is undistorted first with the camera matrix and
+  distortion coefficients of that metadata, so the overlay is drawn in the coordinates it was measured in.
+- Every rendered frame gets the tracked centre, the orientation and the frame number drawn on it.
+- render_async() runs the rendering in its own worker process, so the caller can continue immediately.
+
+Methods:
+- __init__(video_path, locations_file): Loads the tracked positions for the given recording.
+- output_path(start_frame, stop_frame, step): Returns the file name of the rendered video.
+- render(start_frame, stop_frame, step): Renders the annotated video and returns its path.
+- render_async(start_frame, stop_frame, step): Starts render() in a separate process and returns the process.
+
+Functions:
+- check_multi_object_render(): Renders a small synthetic two-object table and verifies that both objects are drawn.
+
+Usage:
+    python -m include.RenderClass <video.avi> [--locations <name>_cam1_locations.npz] [--start 0] [--stop 1000] [--step 5]
+    python -m include.RenderClass --check   (renders a two-object table)
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+try:
+    from include.SegmentClass import SegmentedVideoCapture
+    from include.TableClass import read_table, read_table_metadata, write_table
+    from include.UndistortClass import Undistorter
+except ImportError:  # When this file is run directly from the include folder
+    from SegmentClass import SegmentedVideoCapture
+    from TableClass import read_table, read_table_metadata, write_table
+    from UndistortClass import Undistorter
+
+def _render_worker(video_path, locations_file, start_frame, stop_frame, step):
+    TrackingRenderer(video_path, locations_file).render(start_frame, stop_frame, step)
+
+class TrackingRenderer:
+    def __init__(self, video_path, locations_file=None):
+        self.video_path = video_path
+        self.output_dir = os.path.dirname(video_path)
+        self.base_name = os.path.basename(video_path).replace(".avi", "").replace("_manifest.json", "")
+        self.locations_file = locations_file or os.path.join(self.output_dir, f"{self.base_name}_locations")
+
+        # Tracked positions per frame number (the locations table in any format): a list of (object ID, X, Y, angle),
+        # the object ID is None for a single-object table
+        locations = read_table(self.locations_file)
+        object_ids = locations["Object"] if "Object" in locations else [None] * len(locations["Frame"])
+        self.locations = {}
+        for frame_number, object_id, center_x, center_y, angle in zip(locations["Frame"], object_ids, locations["X"],
+                                                                      locations["Y"], locations["angle (degrees)"]):
+            self.locations.setdefault(int(frame_number), []).append(
+                (None if object_id is None else int(object_id), float(center_x), float(center_y), float(angle)))
+
+        # Positions measured on undistorted frames are drawn on undistorted frames
+        self.metadata = read_table_metadata(self.locations_file)
+        self.undistorted = bool(self.metadata.get("undistorted"))
+
+    def output_path(self, start_frame=0, stop_frame=None, step=1):
+        if start_frame == 0 and stop_frame is None and step == 1:
+            return os.path.join(self.output_dir, f"{self.base_name}_tracking.avi")
+        stop_text = "end" if stop_frame is None else str(stop_frame)
+        return os.path.join(self.output_dir, f"{self.base_name}_tracking_{start_frame}-{stop_text}_step{step}.avi")
+
+    def render(self, start_frame=0, stop_frame=None, step=1):
+        if self.video_path.endswith("_manifest.json"):
+            cap = SegmentedVideoCapture(self.video_path)
+        else:
+            cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise IOError("Cannot open the video file.")
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        output_file = self.output_path(start_frame, stop_frame, step)
+        out_video = None
+        undistorter = None
+
+        frame_number = start_frame
+        while stop_frame is None or frame_number < stop_frame:
+            # Skipped frames are only grabbed (not converted or returned), the codec still decodes them
+            if (frame_number - start_frame) % step:
+                if not cap.grab():
+                    break
+                frame_number += 1
+                continue
+
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if out_video is None:
+                fourcc = cv2.VideoWriter_fourcc(*'XVID')
+                out_video = cv2.VideoWriter(output_file, fourcc, fps / step, (frame.shape[1], frame.shape[0]))
+                if self.undistorted:
+                    # The intrinsics that the tracker used, not the current calibration
+                    undistorter = Undistorter(self.metadata["camera_matrix"], self.metadata["dist_coeffs"],
+                                              (frame.shape[1], frame.shape[0]))
+                    print("[INFO] The locations are in undistorted coordinates, the frames are undistorted before drawing")
+            if undistorter is not None:
+                frame = undistorter.undistort(frame)
+
+            # Draw the tracked centre and orientation (frames without a location are written without overlay)
+            for object_id, center_x, center_y, angle in self.locations.get(frame_number, ()):
+                center = (int(round(center_x)), int(round(center_y)))
+                label = f"Orientation: {angle:.2f} deg" if object_id is None else f"UMR {object_id}: {angle:.2f} deg"
+                cv2.circle(frame, center, 5, (0, 0, 255), -1)
+                cv2.putText(frame, label, (center[0] - 60, center[1] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            cv2.putText(frame, f"Frame {frame_number}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+
+            out_video.write(frame)
+            frame_number += 1
+
+        cap.release()
+        if out_video is not None:
+            out_video.release()
+        print(f"Tracking video saved to {output_file}")
+        return output_file
+
+    def render_async(self, start_frame=0, stop_frame=None, step=1):
+        process = multiprocessing.Process(target=_render_worker, name="TrackingRenderer",
+                                          args=(self.video_path, self.locations_file, start_frame, stop_frame, step))
+        process.start()
+        return process
+
+def check_multi_object_render():
+    # Two objects in every frame of a small grey video: both centres have to be drawn in the rendered video
+    size = (320, 240)
+    positions = {0: (80.0, 120.0), 1: (240.0, 120.0)}
+    with tempfile.TemporaryDirectory() as directory:
+        video_path = os.path.join(directory, "check_cam1.avi")
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 30, size)
+        for _ in range(3):
+            writer.write(np.full((size[1], size[0], 3), 128, dtype=np.uint8))
+        writer.release()
+
+        rows = [(frame, object_id, frame / 30, x, y, 0.0, 100.0, 1.0)
+                for frame in range(3) for object_id, (x, y) in positions.items()]
+        columns = ["Frame", "Object", "Time (seconds)", "X", "Y", "angle (degrees)", "area (pixels)", "confidence"]
+        locations_file = write_table(os.path.join(directory, "check_cam1_locations"),
+                                     {name: [row[i] for row in rows] for i, name in enumerate(columns)})
+
+        cap = cv2.VideoCapture(TrackingRenderer(video_path, locations_file).render())
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            raise RuntimeError("The rendered check video cannot be read.")
+        for object_id, (x, y) in positions.items():
+            b, g, r = frame[int(y), int(x)].astype(int)
+            if not (r > 180 and g < 90 and b < 90):
+                raise RuntimeError(f"Object {object_id} was not drawn at ({x:.0f}, {y:.0f})")
+    print("[INFO] Both objects of the two-object table were rendered")
+
+# Used when this class is run seperately
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the annotated tracking video from the locations file.")
+    parser.add_argument("video", nargs="?", help="Recorded video (<name>_cam1.avi) or manifest of a segmented recording")
+    parser.add_argument("--locations", help="Locations table (default: <name>_cam1_locations next to the video, any format)")
+    parser.add_argument("--start", type=int, default=0, help="First frame to render")
+    parser.add_argument("--stop", type=int, default=None, help="Stop before this frame (default: end of the video)")
+    parser.add_argument("--step", type=int, default=1, help="Only render every step-th frame")
+    parser.add_argument("--check", action="store_true", help="Render a synthetic two-object table and verify it")
+    args = parser.parse_args()
+
+    if args.check:
+        check_multi_object_render()
+    elif args.video is None:
+        parser.error("the video is required (or use --check)")
+    else:
+        TrackingRenderer(args.video, args.locations).render(args.start, args.stop, args.step)
@@ -0,0 +1,239 @@
+"""
+Segmented recordings
+
+For long experiments the recorder can roll over to a new video file after a number of seconds or megabytes. Every
+segment gets its own frame log sidecar, and a manifest (<name>_cam1_manifest.json) lists the segments in order. The
+manifest is rewritten every time a segment is closed, so a crash loses at most the segment that was being written.
+
+Manifest layout:
+    {"version": 1, "base_name": ..., "complete": true/false, "total_frames": ...,
+     "segments": [{"video": ..., "frame_log": ..., "first_frame": ..., "n_frames": ...,
+                   "start_ns": ..., "end_ns": ..., "fps": ...}, ...]}
+File names in the manifest are relative to the folder of the manifest.
+
+Classes/functions:
+- SegmentedVideoWriter: Writer for the AsyncVideoWriter that rolls over to a new segment. It is also passed as the
+  frame log, so the metadata of every frame ends up in the sidecar of the segment the frame was written to.
+- SegmentedVideoCapture: Reads the segments of a manifest as one logical stream (read/set/get/isOpened/release like
+  cv2.VideoCapture), used by the VideoTracker.
+- manifest_path(output_dir, base_name): Returns the path of the manifest of a recording.
+- read_manifest(path): Loads a manifest.
+- load_recording_frame_log(output_dir, base_name): Returns the frame log records of a recording (single sidecar or
+  all segments of the manifest, with global frame indexes) or None if there is none.
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+try:
+    from include.FrameLogClass import FrameLogWriter, frame_log_path, read_frame_log
+except ImportError:  # When this file is run directly from the include folder
+    from FrameLogClass import FrameLogWriter, frame_log_path, read_frame_log
+
+MANIFEST_VERSION = 1
+
+def manifest_path(output_dir, base_name, camera="cam1"):
+    return os.path.join(output_dir, f"{base_name}_{camera}_manifest.json")
+
+def read_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise IOError(f"Unsupported manifest version in {path}")
+    return manifest
+
+def load_recording_frame_log(output_dir, base_name):
+    # Single file recording
+    single_log = frame_log_path(output_dir, base_name)
+    if os.path.exists(single_log):
+        return read_frame_log(single_log)
+
+    # Segmented recording: concatenate the sidecars of all segments
+    manifest_file = manifest_path(output_dir, base_name)
+    if not os.path.exists(manifest_file):
+        return None
+    manifest = read_manifest(manifest_file)
+    parts = []
+    for segment in manifest["segments"]:
+        records = read_frame_log(os.path.join(output_dir, segment["frame_log"]))
+        records = records.copy()
+        records["frame"] += segment["first_frame"]
+        parts.append(records)
+    if not parts:
+        return None
+    return np.concatenate(parts)
+
+class SegmentedVideoWriter:
+    def __init__(self, output_dir, base_name, make_writer, segment_seconds=None, segment_megabytes=None,
+                 nominal_fps=30, camera="cam1", extension=".avi"):
+        self.output_dir = output_dir
+        self.base_name = base_name
+        self.make_writer = make_writer  # Callable(video_path) -> cv2.VideoWriter/MjpgAviWriter
+        self.segment_ns = int(segment_seconds * 1e9) if segment_seconds else None
+        self.segment_bytes = int(segment_megabytes * 1024 * 1024) if segment_megabytes else None
+        self.nominal_fps = nominal_fps
+        self.camera = camera
+        self.extension = extension
+        self.manifest_path = manifest_path(output_dir, base_name, camera)
+
+        self.segments = []
+        self.total_frames = 0
+        self._writer = None
+        self._log = None
+        self._video_path = None
+        self._frames_since_size_check = 0
+        self._last_capture_seq = None
+        self._last_pos_msec = None
+
+        self._write_manifest(complete=False)
+
+    # === Writer interface (used by AsyncVideoWriter) ===
+    def write(self, frame):
+        # Segments are opened lazily, so a roll over right before the end never leaves an empty segment behind
+        if self._writer is None:
+            self._open_segment()
+        self._writer.write(frame)
+        self._frames_since_size_check += 1
+
+    def set(self, prop_id, value):
+        # The frame rate is measured and set per segment when it is closed
+        return False
+
+    def release(self):
+        if self._writer is not None:
+            self._close_segment()
+        self._write_manifest(complete=True)
+
+    # === Frame log interface (used by AsyncVideoWriter after every written frame) ===
+    def append(self, capture_seq, capture_ns, pos_msec):
+        self._log.append(capture_seq, capture_ns, pos_msec)
+        if self._segment_full(capture_ns):
+            self._close_segment()
+
+    def close(self):
+        # Everything is closed in release()
+        pass
+
+    # === Segment handling ===
+    def _segment_full(self, capture_ns):
+        if self.segment_ns and capture_ns - self._log.first_capture_ns >= self.segment_ns:
+            return True
+        # Checking the file size costs a system call, so only do it once in a while
+        if self.segment_bytes and self._frames_since_size_check >= 30:
+            self._frames_since_size_check = 0
+            return os.path.getsize(self._video_path) >= self.segment_bytes
+        return False
+
+    def _open_segment(self):
+        index = len(self.segments)
+        video_name = f"{self.base_name}_{self.camera}_seg{index:03d}{self.extension}"
+        self._video_path = os.path.join(self.output_dir, video_name)
+        self._writer = self.make_writer(self._video_path)
+        self._log = FrameLogWriter(frame_log_path(self.output_dir, f"{self.base_name}_seg{index:03d}"),
+                                   nominal_fps=self.nominal_fps, last_capture_seq=self._last_capture_seq,
+                                   last_pos_msec=self._last_pos_msec)
+        self._frames_since_size_check = 0
+        print(f"[INFO] Recording segment {index}: {self._video_path}")
+
+    def _close_segment(self):
+        index = len(self.segments)
+        fps = self._log.measured_fps() or self.nominal_fps
+        self._writer.set(cv2.CAP_PROP_FPS, fps)
+        self._writer.release()
+        self._log.close()
+
+        self.segments.append({
+            "video": os.path.basename(self._video_path),
+            "frame_log": os.path.basename(self._log.path),
+            "first_frame": self.total_frames,
+            "n_frames": self._log.frames,
+            "start_ns": self._log.first_capture_ns,
+            "end_ns": self._log.last_capture_ns,
+            "fps": fps,
+        })
+        self.total_frames += self._log.frames
+        self._last_capture_seq = self._log.last_capture_seq
+        self._last_pos_msec = self._log.last_pos_msec
+        self._writer = None
+        self._log = None
+        self._write_manifest(complete=False)
+        print(f"[INFO] Closed segment {index} ({self.segments[-1]['n_frames']} frames)")
+
+    def _write_manifest(self, complete):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "base_name": self.base_name,
+            "complete": complete,
+            "total_frames": self.total_frames,
+            "segments": self.segments,
+        }
+        # Write to a temporary file first, so a crash never leaves a half written manifest
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+class SegmentedVideoCapture:
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.output_dir = os.path.dirname(manifest_file)
+        self.segments = read_manifest(manifest_file)["segments"]
+        self.total_frames = sum(segment["n_frames"] for segment in self.segments)
+        self._cap = None
+        self._index = -1
+        self._position = 0
+        if self.segments:
+            self._open(0)
+
+    def _open(self, index):
+        if self._cap is not None:
+            self._cap.release()
+        self._index = index
+        self._cap = cv2.VideoCapture(os.path.join(self.output_dir, self.segments[index]["video"]))
+
+    def isOpened(self):
+        return self._cap is not None and self._cap.isOpened()
+
+    def read(self):
+        while self._cap is not None:
+            ret, frame = self._cap.read()
+            if ret:
+                self._position += 1
+                return ret, frame
+            if self._index + 1 >= len(self.segments):
+                return False, None
+            self._open(self._index + 1)
+        return False, None
+
+    def set(self, prop_id, value):
+        if prop_id != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        frame = int(value)
+        for index, segment in enumerate(self.segments):
+            if segment["first_frame"] <= frame < segment["first_frame"] + segment["n_frames"]:
+                if index != self._index:
+                    self._open(index)
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame - segment["first_frame"])
+                self._position = frame
+                return True
+        return False
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.total_frames)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position)
+        if prop_id == cv2.CAP_PROP_FPS:
+            # Average frame rate over all segments
+            if self.segments and self.total_frames > 1 and self.segments[-1]["end_ns"] > self.segments[0]["start_ns"]:
+                return (self.total_frames - 1) / ((self.segments[-1]["end_ns"] - self.segments[0]["start_ns"]) / 1e9)
+            return float(self.segments[0]["fps"]) if self.segments else 0.0
+        return self._cap.get(prop_id) if self._cap is not None else 0.0
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
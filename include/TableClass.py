@@ -0,0 +1,97 @@
+"""
+Table reader/writer
+
+Shared reader and writer for the tables the pipeline exchanges: <name>_timestamps, <name>_cam1_box,
+<name>_cam1_locations and <name>_Trajectory. The recorder, the trackers and the trajectory reconstruction all go
+through these functions, so every table can be stored in one of the formats:
+- csv: text, one row per line (the default, readable by Excel, MATLAB and pandas).
+- npz: uncompressed NumPy archive with one typed array per column, loads without any parsing.
+- parquet: columnar Apache Parquet through pandas (needs pyarrow or fastparquet, which are not in requirements.txt).
+
+The writer writes the table in one format. The reader takes a path with any of the extensions, or the path without
+extension, and then reads the most recently written format of the table, so later stages do not need to know which
+format an earlier stage wrote.
+
+Functions:
+- table_base(path): Returns the path without the table extension.
+- table_path(path, table_format): Returns the path of the table in the given format.
+- find_table(path): Returns the existing file of the table (the newest format if there are several), or None.
+- write_table(path, columns, table_format): Writes the columns ({name: values}, in order) of a table.
+- read_table(path): Reads a table, returns {name: numpy array} in the column order of the file.
+- table_metadata_path(path): Returns the path of the metadata file of a table (<name>_meta.json, same for all formats).
+- write_table_metadata(path, metadata): Writes a dict with information about a table (e.g. its coordinate system).
+- read_table_metadata(path): Reads the metadata of a table, returns {} if it has none.
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+TABLE_FORMATS = {"csv": ".csv", "npz": ".npz", "parquet": ".parquet"}
+
+def table_base(path):
+    root, extension = os.path.splitext(path)
+    return root if extension in TABLE_FORMATS.values() else path
+
+def table_path(path, table_format="csv"):
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format '{table_format}', use one of {list(TABLE_FORMATS)}")
+    return table_base(path) + TABLE_FORMATS[table_format]
+
+def find_table(path):
+    # The given file if it exists, otherwise the most recently written format of the table
+    if os.path.splitext(path)[1] in TABLE_FORMATS.values() and os.path.exists(path):
+        return path
+    candidates = [table_path(path, table_format) for table_format in TABLE_FORMATS]
+    candidates = [candidate for candidate in candidates if os.path.exists(candidate)]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+def write_table(path, columns, table_format="csv"):
+    output_file = table_path(path, table_format)
+    columns = {name: np.asarray(values) for name, values in columns.items()}
+    if table_format == "npz":
+        # np.savez adds .npz itself if it is missing, so the file object keeps the exact name
+        with open(output_file, "wb") as f:
+            np.savez(f, **columns)
+    elif table_format == "parquet":
+        pd.DataFrame(columns).to_parquet(output_file, index=False)
+    else:
+        # csv.writer on Python values is faster than DataFrame.to_csv and writes the same text as before
+        with open(output_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns.keys())
+            writer.writerows(zip(*[values.tolist() for values in columns.values()]))
+    return output_file
+
+def read_table(path):
+    input_file = find_table(path)
+    if input_file is None:
+        raise FileNotFoundError(f"No table found for {table_base(path)} ({', '.join(TABLE_FORMATS.values())})")
+
+    if input_file.endswith(".npz"):
+        with np.load(input_file, allow_pickle=False) as archive:
+            return {name: archive[name] for name in archive.files}
+    if input_file.endswith(".parquet"):
+        data = pd.read_parquet(input_file)
+    else:
+        data = pd.read_csv(input_file)
+    return {name: data[name].to_numpy() for name in data.columns}
+
+def table_metadata_path(path):
+    return table_base(path) + "_meta.json"
+
+def write_table_metadata(path, metadata):
+    metadata_file = table_metadata_path(path)
+    with open(metadata_file, "w") as f:
+        json.dump(metadata, f, indent=2)
+    return metadata_file
+
+def read_table_metadata(path):
+    metadata_file = table_metadata_path(path)
+    if not os.path.exists(metadata_file):
+        return {}
+    with open(metadata_file) as f:
+        return json.load(f)
@@ -7,20 +7,78 @@ and timestamp are recorded and saved to a CSV file. The user can manually select
 container) in the first frame, which is saved separately for later use in world scaling. The class supports 
 interactive ROI re-selection during tracking.
 
+In headless mode (headless=True) no windows are opened: the box and the ROI are passed in (from a JSON config file or
+the command line), the tracker runs at full decode speed and the progress is reported through a callback or printed.
+
+The lean tracking path (lean=True) only measures: it converts just the cropped ROI to grayscale into a reusable
+buffer, thresholds into a reusable buffer, finds the largest blob with connected components (no contour lists) and
+does not annotate, display or write the _tracking.avi. The throughput (frames per second) is reported for both paths.
+Note that the full frame is still decoded by cv2.VideoCapture, video codecs cannot decode only a region.
+
+With predict=True a constant-velocity Kalman filter (see MotionModelClass.py) predicts the position in the next frame
+and only a search window around the prediction is thresholded. The window is sized from the measured blob and the
+prediction uncertainty, so the initial ROI can be drawn large for fast motion without slowing down every frame, and it
+grows automatically while the target is lost. The search window is drawn on the annotated frames.
+
+With undistort=True the lens distortion is removed before thresholding, with the cached remap tables of
+UndistortClass.py: the lean path only remaps the ROI (a fraction of a millisecond), the annotated path and the box/ROI
+selection remap the whole frame. All positions, the box and the ROIs are then in undistorted pixel coordinates, which
+is recorded in the metadata of the locations table (<name>_locations_meta.json) so the TrajectoryReconstructor does
+not undistort the points a second time.
+
+With a StageProfiler (profiler=..., see ProfilerClass.py, --profile on the command line) the time of every stage of a
+frame is measured: tracker.read, tracker.undistort, tracker.cvtColor, tracker.threshold, tracker.components,
+tracker.findContours (annotated path), tracker.measure, tracker.annotate, tracker.imshow, tracker.video_write, tracker.checkpoint and the
+whole tracker.frame. By default the profiler is disabled and costs almost nothing.
+
 Main Workflow:
-- A video file is loaded, and the user first selects the physical box (for world scaling) and then the object ROI.
+- A video file is loaded (or the manifest of a segmented recording, which is read as one stream), and the user first selects the physical box (for world scaling) and then the object ROI.
 - A contour-based tracking method (using Otsu's thresholding) is used to track the selected object across the video frames.
-- The position (X, Y), orientation angle, and timestamp of the object are recorded and saved to a CSV file.
-- The selected physical box (X, Y, Width, Height) is saved separately in a CSV file for use in world scaling.
-- An annotated video showing the tracked object, its center, and orientation is saved as a new video file.
+- The frame index, timestamp, sub-pixel position (X, Y, centroid from the image moments of the blob), orientation
+  (major axis from the central moments, 0.5*atan2(2*mu11, mu20-mu02), in degrees), area (pixels) and confidence
+  (share of the thresholded pixels in the ROI that belong to the blob), with the same definition on every tracking path:
+  the moments of the pixels of the largest 8-connected blob are saved to the locations table (CSV by
+  default, or NPZ/Parquet with table_format, see TableClass.py) and to a typed, compact copy (<name>_locations.npy,
+  LOCATIONS_DTYPE). Frames in which the object is lost get the ROI centre, angle NaN and
+  confidence 0.
+  The timestamps are the capture times from the recorder's frame log sidecar (<name>_frames.bin), the older
+  <name>_timestamps table is only used if there is no sidecar.
+- The selected physical box (X, Y, Width, Height) is saved separately in a table (same format) for use in world scaling.
+- The box, the initial ROI and every checkpoint_interval frames a checkpoint (frame and ROI, with the rows tracked so
+  far) are stored next to the outputs (<name>_tracking_state.json and <name>_locations.partial, see
+  CheckpointClass.py). If a run crashes or is stopped with 'q', the next run with the same box, ROI and settings
+  seeks to the last checkpoint and appends, reusing the box and ROI without asking. A completed run, or resume=False
+  (--restart), asks for the box and ROI again.
+  Resuming is not possible while writing the annotated video (write_video=True), such a run starts at frame 0.
+- An annotated video showing the tracked object, its center, and orientation is only written during tracking if
+  write_video=True. Otherwise it can be rendered afterwards from the locations file (see RenderClass.py), so
+  measurement runs pay nothing for visualization.
 
 Methods:
-- __init__(video_path): Initializes the VideoTracker object with the path to the video file and sets up necessary attributes.
-- select_roi(): Lets the user select a region of interest (ROI) in the first frame for tracking.
-- select_and_save_box(): Allows manual selection of the full environment box in the first frame and saves its dimensions to CSV.
-- update_roi_center(frame, roi): Updates the position of the ROI based on the largest contour found in the thresholded region.
-- track_and_save(): Tracks the selected object, saves the tracking data to a CSV file, allows interactive ROI re-selection, 
-  and outputs an annotated video.
+- __init__(video_path, headless, progress_callback, progress_interval, lean, write_video, predict, table_format, undistort, intrinsics_file, checkpoint_interval, profiler): Initializes the VideoTracker object with the path to the video file and sets up necessary attributes.
+- read_frame(): Reads the next frame, undistorted unless only the ROIs are undistorted (lean path).
+- select_roi(roi): Lets the user select a region of interest (ROI) in the first frame for tracking (or uses the given ROI).
+- select_and_save_box(box): Allows manual selection of the full environment box in the first frame (or uses the given box) and saves its dimensions to the box table.
+- update_roi_center(frame, roi): Updates the position of the ROI based on the largest blob found in the thresholded region (and annotates the frame).
+- update_roi_center_lean(frame, roi): Like update_roi_center (connected components instead of contours), without annotation and with reusable ROI buffers.
+- update_roi_predicted(frame, roi): Searches the blob in the window predicted by the motion model and corrects the model with it.
+- roi_measurement(roi): Returns the (X, Y, angle, area, confidence) written to the locations file for a tracked frame.
+- detect_roi(frame, box, roi_size): Finds the UMR (largest dark blob) inside the box and returns a ROI centred on it.
+- track_range(start_frame, stop_frame, roi): Tracks a range of frames without writing any files (used by the ParallelVideoTracker).
+- save_locations(rows): Writes (frame, X, Y, angle, area, confidence) rows with their timestamps to the locations table and .npy.
+- write_locations(rows, columns, dtype): Writes complete rows to the locations table, its typed copy and its metadata.
+- track_and_save(box, roi, resume): Tracks the selected object, saves the tracking data to the locations table, allows interactive ROI re-selection,
+  and (with write_video=True) outputs an annotated video. Continues an interrupted run at its last checkpoint (resume=True).
+
+Functions:
+- blob_measurement(moments, offset_x, offset_y): Sub-pixel centroid, orientation and area from the moments of a blob.
+- load_tracking_config(path): Loads the box and ROI from a JSON file ({"box": [x, y, w, h], "roi": [x, y, w, h]}).
+
+Usage (headless):
+    python -m include.TrackerClassV3 <video.avi> --config tracking.json --headless
+    python -m include.TrackerClassV3 <video.avi> --box 100 50 1700 950 --roi 800 400 120 120 --headless
+    python -m include.TrackerClassV3 <video.avi> --config tracking.json --headless --workers 8   (ParallelVideoTracker)
+    python -m include.TrackerClassV3 <video.avi> --config tracking.json --headless --profile   (<name>_profile.csv, <name>_trace.json)
 
 Author: Stijn Kolkman (s.y.kolkman@student.utwente.nl)
 Date: April 2025
@@ -28,41 +86,113 @@ Date: April 2025
 
 import cv2
 import numpy as np
-import csv
 import os
 import re
+import json
+import time
+import argparse
+
+try:
+    from include.FrameLogClass import frame_log_timestamps
+    from include.SegmentClass import SegmentedVideoCapture, load_recording_frame_log
+    from include.MotionModelClass import KalmanSearchWindow
+    from include.TableClass import find_table, read_table, table_path, write_table, write_table_metadata
+    from include.UndistortClass import load_undistorter
+    from include.CheckpointClass import TrackingCheckpoint
+    from include.ProfilerClass import StageProfiler
+except ImportError:  # When this file is run directly from the include folder
+    from FrameLogClass import frame_log_timestamps
+    from SegmentClass import SegmentedVideoCapture, load_recording_frame_log
+    from MotionModelClass import KalmanSearchWindow
+    from TableClass import find_table, read_table, table_path, write_table, write_table_metadata
+    from UndistortClass import load_undistorter
+    from CheckpointClass import TrackingCheckpoint
+    from ProfilerClass import StageProfiler
+
+# Columns of the locations file and the dtype of its typed copy (<name>_locations.npy)
+LOCATION_COLUMNS = ["Frame", "Time (seconds)", "X", "Y", "angle (degrees)", "area (pixels)", "confidence"]
+LOCATIONS_DTYPE = np.dtype([("frame", "<u4"), ("time", "<f8"), ("x", "<f4"), ("y", "<f4"),
+                            ("angle", "<f4"), ("area", "<f4"), ("confidence", "<f4")])
+
+def blob_measurement(moments, offset_x=0, offset_y=0):
+    # Sub-pixel centroid, orientation of the major axis (degrees, -90..90, image coordinates) and area from image moments
+    area = moments["m00"]
+    center_x = moments["m10"] / area + offset_x
+    center_y = moments["m01"] / area + offset_y
+    angle = 0.5 * np.degrees(np.arctan2(2 * moments["mu11"], moments["mu20"] - moments["mu02"]))
+    return center_x, center_y, float(angle), float(area)
+
+def load_tracking_config(path):
+    # Box and initial ROI for headless tracking
+    with open(path) as f:
+        config = json.load(f)
+    box = tuple(int(v) for v in config["box"]) if config.get("box") is not None else None
+    roi = tuple(int(v) for v in config["roi"]) if config.get("roi") is not None else None
+    return box, roi
 
 class VideoTracker:
-    def __init__(self, video_path):
-        # Load the video using the video_path
+    def __init__(self, video_path, headless=False, progress_callback=None, progress_interval=100, lean=False, write_video=False,
+                 predict=False, table_format="csv", undistort=False, intrinsics_file=None, checkpoint_interval=500,
+                 profiler=None):
+        # Load the video using the video_path, a manifest of a segmented recording is read as one stream
         self.video_path = video_path
-        self.cap = cv2.VideoCapture(video_path)
+        if video_path.endswith("_manifest.json"):
+            self.cap = SegmentedVideoCapture(video_path)
+        else:
+            self.cap = cv2.VideoCapture(video_path)
         if not self.cap.isOpened():
             raise IOError("Cannot open the video file.")
         
         self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+
+        # Headless mode: no windows at all, progress through the callback (frame_number, total_frames, fps) or printed
+        self.headless = headless
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+
+        # The annotated video is optional, by default it is rendered afterwards by the TrackingRenderer
+        self.write_video = write_video
+
+        # track_and_save writes a checkpoint every checkpoint_interval frames (see CheckpointClass.py)
+        self.checkpoint_interval = checkpoint_interval
+
+        # Undistortion with cached remap tables: only the ROIs on the lean path, otherwise the whole frame
+        undistorter = None
+        if undistort:
+            frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            undistorter = load_undistorter(frame_size, intrinsics_file)
+        self._init_tracking_state(lean, predict, undistorter, profiler)
         #base_filename = os.path.splitext(os.path.basename(video_path))[0]
 
         # New: Folder and base name
         self.output_dir = os.path.dirname(video_path)
-        self.base_name = os.path.basename(video_path).replace(".avi", "").replace(".avi", "")
-        self.csv_filename = os.path.join(self.output_dir, f"{self.base_name}_locations.csv")
+        self.base_name = os.path.basename(video_path).replace(".avi", "").replace("_manifest.json", "")
+        self.table_format = table_format  # Format of the box and locations tables (csv, npz or parquet)
+        self.locations_filename = table_path(os.path.join(self.output_dir, f"{self.base_name}_locations"), table_format)
+        self.npy_filename = os.path.join(self.output_dir, f"{self.base_name}_locations.npy")
         self.output_video_filename = os.path.join(self.output_dir, f"{self.base_name}_tracking.avi")
         self.out_video = None  # This will be the VideoWriter object for saving the tracked video
 
-        # Load the timestamps
-        self.base_name_timestamp = re.sub(r'_cam\d\.avi$', '', os.path.basename(video_path))
-        timestamp_file = os.path.join(self.output_dir, f"{self.base_name_timestamp}_timestamps.csv")
+        # Load the timestamps: the capture times from the frame log sidecar, or the timestamps table of older recordings
+        self.base_name_timestamp = re.sub(r'_cam\d(\.avi|_manifest\.json)$', '', os.path.basename(video_path))
+        records = load_recording_frame_log(self.output_dir, self.base_name_timestamp)
+        timestamp_base = os.path.join(self.output_dir, f"{self.base_name_timestamp}_timestamps")
+        timestamp_file = find_table(timestamp_base)
         self.timestamps = []
-
-        if os.path.exists(timestamp_file):
-            with open(timestamp_file, newline='') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    self.timestamps.append(float(row["Timestamp (s)"]))
+        self.frame_gaps = None
+
+        if records is not None:
+            self.timestamps = frame_log_timestamps(records)
+            self.frame_gaps = records["gap"]
+            print(f"[INFO] Loaded {len(self.timestamps)} capture timestamps from the frame log of {self.base_name_timestamp}")
+            if self.frame_gaps.sum() > 0:
+                print(f"[WARNING] {int(self.frame_gaps.sum())} frames were dropped during recording, "
+                      f"in {int(np.count_nonzero(self.frame_gaps))} gaps")
+        elif timestamp_file is not None:
+            self.timestamps = read_table(timestamp_file)["Timestamp (s)"].astype(float).tolist()
             print(f"[INFO] Loaded {len(self.timestamps)} timestamps from {timestamp_file}")
         else:
-            print(f"[WARNING] Timestamp file not found: {timestamp_file}")
+            print(f"[WARNING] Timestamp file not found: {timestamp_base}.csv")
     """
     def preprocess_frame(self, frame):
         #Applies preprocessing to enhance contrast and reduce noise.
@@ -83,39 +213,97 @@ class VideoTracker:
         frame = cv2.GaussianBlur(frame, (5, 5), 0)
         return frame
     """
-    def select_roi(self):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Cannot read from the video.")
-            self.cap.release()
+    def _init_tracking_state(self, lean, predict, undistorter, profiler=None):
+        # Everything the tracking paths need besides the video, also used by the LiveTracker (which has no video file)
+
+        # Lean tracking path: reusable ROI buffers (allocated when the ROI size changes) and throughput bookkeeping
+        self.lean = lean
+        self._lean_shape = None
+        self._gray_roi = None
+        self._threshold_roi = None
+        self._labels_roi = None
+        self.frames_lost = 0
+        self.tracking_fps = None
+        self.measurement = None  # (X, Y, angle, area, confidence) of the blob found in the last frame
+        self._start_frame = 0  # First frame of the current run, for the throughput
+
+        # Motion model: a Kalman filter predicts a tight search window, created when tracking starts
+        self.predict = predict
+        self.motion_model = None
+
+        self.undistorter = undistorter
+        self._remap_rois = self.undistorter is not None and lean
+        self._undistorted_frame = None
+        self._undistorted_roi = None
+
+        # Time per stage of a frame, a disabled profiler only costs an attribute look-up per stage
+        self.profiler = profiler if profiler is not None else StageProfiler()
+
+    def _tracking_settings(self):
+        # A run is only resumed with the same settings, other settings would give different rows after the checkpoint
+        return {"lean": self.lean, "predict": self.predict, "undistort": self.undistorter is not None}
+
+    def _destroy_windows(self):
+        # Headless OpenCV builds have no GUI functions at all
+        if not self.headless:
             cv2.destroyAllWindows()
-            raise RuntimeError("Video reading error.")
-
-        roi = cv2.selectROI("Select the ROI", frame, fromCenter=False, showCrosshair=True)
-        cv2.destroyWindow("Select the ROI")
-        return frame, roi
 
-    def select_and_save_box(self):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Go to the first frame
+    def read_frame(self):
+        t = self.profiler.start()
         ret, frame = self.cap.read()
+        t = self.profiler.lap("tracker.read", t)
+        if not ret or self.undistorter is None or self._remap_rois:
+            return ret, frame
+        # The decoded frame is reused by the next read, the undistorted frame goes into its own reusable buffer
+        if self._undistorted_frame is None or self._undistorted_frame.shape != frame.shape:
+            self._undistorted_frame = np.empty_like(frame)
+        frame = self.undistorter.undistort(frame, dst=self._undistorted_frame)
+        self.profiler.stop("tracker.undistort", t)
+        return ret, frame
+
+    def select_roi(self, roi=None):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        ret, frame = self.cap.read()
+        if ret and self.undistorter is not None:
+            frame = self.undistorter.undistort(frame)  # The ROI is selected in undistorted coordinates
         if not ret:
             print("Cannot read from the video.")
             self.cap.release()
-            cv2.destroyAllWindows()
-            raise RuntimeError("Video reading error during box selection.")
-
-        print("Select the FULL box/container used for world scale reference")
-        box_roi = cv2.selectROI("Select the Box", frame, fromCenter=False, showCrosshair=True)
-        cv2.destroyWindow("Select the Box")
+            self._destroy_windows()
+            raise RuntimeError("Video reading error.")
 
-        box_csv_name = os.path.join(self.output_dir, f"{self.base_name}_box.csv")
-        with open(box_csv_name, mode='w', newline='') as box_file:
-            writer = csv.writer(box_file)
-            writer.writerow(["X", "Y", "Width", "Height"])
-            writer.writerow(box_roi)
+        if roi is None:
+            if self.headless:
+                raise ValueError("An initial ROI is required in headless mode.")
+            roi = cv2.selectROI("Select the ROI", frame, fromCenter=False, showCrosshair=True)
+            cv2.destroyWindow("Select the ROI")
+        return frame, tuple(int(v) for v in roi)
+
+    def select_and_save_box(self, box=None):
+        if box is None:
+            if self.headless:
+                raise ValueError("A box is required in headless mode.")
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Go to the first frame
+            ret, frame = self.cap.read()
+            if not ret:
+                print("Cannot read from the video.")
+                self.cap.release()
+                self._destroy_windows()
+                raise RuntimeError("Video reading error during box selection.")
+            if self.undistorter is not None:
+                frame = self.undistorter.undistort(frame)  # The box is measured in undistorted pixels
+
+            print("Select the FULL box/container used for world scale reference")
+            box_roi = cv2.selectROI("Select the Box", frame, fromCenter=False, showCrosshair=True)
+            cv2.destroyWindow("Select the Box")
+        else:
+            box_roi = tuple(int(v) for v in box)
 
-        print(f"Box region saved to: {box_csv_name}")
+        box_file = write_table(os.path.join(self.output_dir, f"{self.base_name}_box"),
+                               {name: [value] for name, value in zip(["X", "Y", "Width", "Height"], box_roi)},
+                               self.table_format)
+        print(f"Box region saved to: {box_file}")
+        return box_roi
 
     def update_roi_center(self, frame, roi):
             # Crop the ROI from the frame
@@ -131,122 +319,409 @@ class VideoTracker:
             roi_frame = frame[y:y+h, x:x+w]
 
             # Convert to grayscale and apply Otsu's thresholding
+            profiler = self.profiler
+            t = profiler.start()
             gray_roi = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+            t = profiler.lap("tracker.cvtColor", t)
             _, threshold = cv2.threshold(gray_roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+            t = profiler.lap("tracker.threshold", t)
 
             # Debug: Show the thresholded image
-            cv2.imshow("Thresholded Image", threshold)
+            if not self.headless:
+                cv2.imshow("Thresholded Image", threshold)
+                t = profiler.lap("tracker.imshow", t)
 
             # Add a short delay to give you time to inspect the thresholded image
             #time.sleep(3)  # Adjust the time as needed (0.5 sec for example)
 
-            # Find contours in the thresholded image
-            contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            if contours:
-                # Get the largest contour by area
-                largest_contour = max(contours, key=cv2.contourArea)
-
-                # Get the bounding box of the largest contour
-                #x_contour, y_contour, w_contour, h_contour = cv2.boundingRect(largest_contour)
-                rect = cv2.minAreaRect(largest_contour)
-                box = cv2.boxPoints(rect)
-                box = np.int32(box)
-
-                # Compute the object's center (account for ROI offset)
-                center_x_, center_y_ = rect[0]
-                center_x_ += x
-                center_y_ += y
-                center_x_, center_y_ = int(center_x_), int(center_y_)
-                angle = rect[2]
-
-                # Update the ROI center based on the object's new center
-                # Keep the original size (w, h) but adjust its position
-                new_x = center_x_ - w // 2
-                new_y = center_y_ - h // 2
-
-                # Ensure the new ROI is within the bounds of the frame
-                new_x = max(new_x, 0)
-                new_y = max(new_y, 0)
-
-                # Ensure the ROI does not go out of bounds
-                if new_x + w > width:
-                    new_x = width - w
-                if new_y + h > height:
-                    new_y = height - h
-
-                # Update the ROI
-                roi = (new_x, new_y, w, h)
-
-                # Draw the contour and center on the frame for debugging
-                cv2.circle(frame, (center_x_, center_y_), 5, (0, 0, 255), -1)
-                # Adjust drawn contours by the top-left ROI offset (x, y)
-                cv2.drawContours(frame, [box + (x, y)], 0, (0, 0, 255), 2)
-                cv2.putText(frame, f"Orientation: {angle:.2f} deg", (x, y - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            else:
+            # The measurement is the same as on the lean path: the moments of the largest blob of the thresholded ROI
+            blob = self._measure_largest_blob(threshold, x, y)
+            self.measurement = None if blob is None else blob[0]
+            if blob is None:
+                # Lost: the row gets the ROI centre and the ROI stays where it is
+                self.frames_lost += 1
                 print("No contours found.")
+                return frame, roi
+            bx, by = blob[1]
+
+            # Outline of the blob, for the ROI centre and the drawn orientation box
+            t = profiler.start()
+            contours, _ = cv2.findContours(blob[2], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            t = profiler.lap("tracker.findContours", t)
+            largest_contour = max(contours, key=cv2.contourArea) + (bx, by)
+
+            # Get the bounding box of the largest contour
+            #x_contour, y_contour, w_contour, h_contour = cv2.boundingRect(largest_contour)
+            rect = cv2.minAreaRect(largest_contour)
+            box = cv2.boxPoints(rect)
+            box = np.int32(box)
+
+            # Compute the object's center (account for ROI offset)
+            center_x_, center_y_ = rect[0]
+            center_x_ += x
+            center_y_ += y
+            center_x_, center_y_ = int(center_x_), int(center_y_)
+            angle = self.measurement[2]
+
+            # Update the ROI center based on the object's new center
+            # Keep the original size (w, h) but adjust its position
+            new_x = center_x_ - w // 2
+            new_y = center_y_ - h // 2
+
+            # Ensure the new ROI is within the bounds of the frame
+            new_x = max(new_x, 0)
+            new_y = max(new_y, 0)
+
+            # Ensure the ROI does not go out of bounds
+            if new_x + w > width:
+                new_x = width - w
+            if new_y + h > height:
+                new_y = height - h
+
+            # Update the ROI
+            roi = (new_x, new_y, w, h)
+
+            # Draw the contour and center on the frame for debugging
+            cv2.circle(frame, (center_x_, center_y_), 5, (0, 0, 255), -1)
+            # Adjust drawn contours by the top-left ROI offset (x, y)
+            cv2.drawContours(frame, [box + (x, y)], 0, (0, 0, 255), 2)
+            cv2.putText(frame, f"Orientation: {angle:.2f} deg", (x, y - 10),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            profiler.stop("tracker.annotate", t)
 
             return frame, roi
 
-    def track_and_save(self):
-            # Manually select box 
-            self.select_and_save_box()
+    def _report_progress(self, frame_number, start_time):
+        # The throughput counts the frames of this run only (a resumed run starts at its checkpoint)
+        elapsed = time.perf_counter() - start_time
+        fps = (frame_number - self._start_frame) / elapsed if elapsed > 0 else 0.0
+        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.tracking_fps = fps
+        if self.progress_callback is not None:
+            self.progress_callback(frame_number, total_frames, fps)
+        else:
+            print(f"[INFO] Tracked {frame_number}/{total_frames} frames ({fps:.1f} fps)")
+
+    def roi_measurement(self, roi):
+        # The blob measured in the last update, or the centre of the ROI (without orientation) if the target was lost
+        if self.measurement is not None:
+            return self.measurement
+        x, y, w, h = [int(v) for v in roi]
+        return x + w / 2, y + h / 2, float("nan"), 0.0, 0.0
+
+    def detect_roi(self, frame, box, roi_size):
+        # Keyframe detector: the UMR is the largest dark blob inside the (bright) box
+        bx, by, bw, bh = [int(v) for v in box]
+        gray_box = cv2.cvtColor(frame[by:by+bh, bx:bx+bw], cv2.COLOR_BGR2GRAY)
+        _, threshold = cv2.threshold(gray_box, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+
+        (center_x, center_y), _, _ = cv2.minAreaRect(max(contours, key=cv2.contourArea))
+        w, h = roi_size
+        height, width = frame.shape[:2]
+        new_x = min(max(int(center_x) + bx - w // 2, 0), width - w)
+        new_y = min(max(int(center_y) + by - h // 2, 0), height - h)
+        return (new_x, new_y, w, h)
+
+    def _largest_blob(self, frame, roi):
+        # Clip the ROI to the frame, like update_roi_center
+        x, y, w, h = [int(v) for v in roi]
+        height, width = frame.shape[:2]
+        w = min(w, width - x)
+        h = min(h, height - y)
+
+        # (Re)allocate the ROI buffers only when the ROI size changes
+        if self._lean_shape != (h, w):
+            self._lean_shape = (h, w)
+            self._gray_roi = np.empty((h, w), dtype=np.uint8)
+            self._threshold_roi = np.empty((h, w), dtype=np.uint8)
+
+        # Only the cropped region (a view, no copy) is converted and thresholded, into the reusable buffers
+        roi_frame = frame[y:y+h, x:x+w]
+        profiler = self.profiler
+        t = profiler.start()
+        if self._remap_rois:
+            # The undistorted ROI is remapped from the distorted frame, the rest of the frame is never undistorted
+            if self._undistorted_roi is None or self._undistorted_roi.shape[:2] != (h, w):
+                self._undistorted_roi = np.empty((h, w, 3), dtype=np.uint8)
+            roi_frame = self.undistorter.undistort_roi(frame, (x, y, w, h), dst=self._undistorted_roi)
+            t = profiler.lap("tracker.undistort", t)
+        cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY, dst=self._gray_roi)
+        t = profiler.lap("tracker.cvtColor", t)
+        cv2.threshold(self._gray_roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=self._threshold_roi)
+        profiler.stop("tracker.threshold", t)
+        blob = self._measure_largest_blob(self._threshold_roi, x, y)
+        if blob is None:
+            return None
+        return blob[0], blob[2].shape[::-1]
+
+    def _measure_largest_blob(self, threshold, x, y):
+        # The measurement of both tracking paths: the largest 8-connected blob of the thresholded ROI (x, y offset),
+        # its centroid, orientation and area (pixel count) from the moments of its pixels, the confidence is its share
+        # of all thresholded pixels. Returns (measurement, (bx, by) in the ROI, blob mask) or None.
+        h, w = threshold.shape
+        if self._labels_roi is None or self._labels_roi.shape != (h, w):
+            self._labels_roi = np.empty((h, w), dtype=np.int32)
+        profiler = self.profiler
+        t = profiler.start()
+        n_labels, _, stats, _ = cv2.connectedComponentsWithStats(threshold, self._labels_roi, connectivity=8,
+                                                                 ltype=cv2.CV_32S)
+        t = profiler.lap("tracker.components", t)
+        if n_labels < 2:
+            return None
+
+        # Largest blob (label 0 is the background), its moments are taken over its bounding box only
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        largest = 1 + int(np.argmax(areas))
+        bx, by, bw, bh = stats[largest, :4]
+        blob_mask = np.equal(self._labels_roi[by:by+bh, bx:bx+bw], largest).view(np.uint8)
+        center_x, center_y, angle, area = blob_measurement(cv2.moments(blob_mask, binaryImage=True), x + bx, y + by)
+        profiler.stop("tracker.measure", t)
+        return (center_x, center_y, angle, area, area / areas.sum()), (int(bx), int(by)), blob_mask
+
+    def update_roi_center_lean(self, frame, roi):
+        blob = self._largest_blob(frame, roi)
+        self.measurement = None if blob is None else blob[0]
+        if blob is None:
+            self.frames_lost += 1
+            return roi
+
+        # Re-centre the (clipped) ROI on the largest blob
+        x, y, w, h = [int(v) for v in roi]
+        height, width = frame.shape[:2]
+        w = min(w, width - x)
+        h = min(h, height - y)
+        new_x = min(max(int(self.measurement[0]) - w // 2, 0), width - w)
+        new_y = min(max(int(self.measurement[1]) - h // 2, 0), height - h)
+        return (new_x, new_y, w, h)
+
+    def update_roi_predicted(self, frame, roi):
+        # The motion model is created at the first frame, the given ROI is the initial (and largest) search window
+        if self.motion_model is None:
+            self.motion_model = KalmanSearchWindow(roi, frame.shape)
+
+        # Search only the predicted window, it grows by itself while the target is lost
+        t = self.profiler.start()
+        search_roi = self.motion_model.predict()
+        self.profiler.stop("tracker.predict", t)
+        blob = self._largest_blob(frame, search_roi)
+        t = self.profiler.start()
+        self.measurement = None if blob is None else blob[0]
+        if blob is None:
+            self.motion_model.lost()
+            self.frames_lost += 1
+            new_roi = search_roi  # Follow the prediction until the target is found again
+        else:
+            self.motion_model.correct(self.measurement[:2], blob[1])
+            x, y, w, h = search_roi
+            height, width = frame.shape[:2]
+            new_x = min(max(int(self.measurement[0]) - w // 2, 0), width - w)
+            new_y = min(max(int(self.measurement[1]) - h // 2, 0), height - h)
+            new_roi = (new_x, new_y, w, h)
+        t = self.profiler.lap("tracker.correct", t)
+
+        # Draw the search window and the centre for the annotated path
+        if not self.lean:
+            x, y, w, h = search_roi
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 1)
+            if blob is not None:
+                cv2.circle(frame, (int(self.measurement[0]), int(self.measurement[1])), 5, (0, 0, 255), -1)
+            self.profiler.stop("tracker.annotate", t)
+        return new_roi
+
+    def _update_roi(self, frame, roi):
+        # Dispatch to the predicted search window, the lean (measurement only) or the annotated tracking path
+        if self.predict:
+            return frame, self.update_roi_predicted(frame, roi)
+        if self.lean:
+            return frame, self.update_roi_center_lean(frame, roi)
+        return self.update_roi_center(frame, roi)
+
+    def track_range(self, start_frame, stop_frame, roi):
+        # Tracks the frames [start_frame, stop_frame), stop_frame=None tracks until the end of the video
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        self.motion_model = None
+        rows = []
+        frame_number = start_frame
+        while stop_frame is None or frame_number < stop_frame:
+            ret, frame = self.read_frame()
+            if not ret:
+                break
+            frame, roi = self._update_roi(frame, roi)
+            rows.append((frame_number,) + tuple(self.roi_measurement(roi)) + (tuple(int(v) for v in roi),))
+            frame_number += 1
+        return rows
+
+    def save_locations(self, rows):
+        # rows: (frame, X, Y, angle, area, confidence), the timestamp of the frame is added
+        written = []
+        for frame_number, *measurement in rows:
+            if frame_number >= len(self.timestamps):
+                raise IndexError(f"No timestamp for frame {frame_number}")
+            written.append((frame_number, self.timestamps[frame_number]) + tuple(measurement))
+        self.write_locations(written)
+        print(f"Tracking data saved to {self.locations_filename}")
+
+    def write_locations(self, rows, columns=LOCATION_COLUMNS, dtype=LOCATIONS_DTYPE):
+        # The locations table (in the chosen format) and its typed, compact copy (float32 measurements)
+        t = self.profiler.start()
+        write_table(self.locations_filename, {name: [row[i] for row in rows] for i, name in enumerate(columns)},
+                    self.table_format)
+        np.save(self.npy_filename, np.array(rows, dtype=dtype))
+
+        # The coordinate system of the positions, always written so an older metadata file is never stale
+        metadata = self.undistorter.metadata() if self.undistorter is not None else {"undistorted": False}
+        write_table_metadata(self.locations_filename, metadata)
+        self.profiler.stop("tracker.write_locations", t)
+
+    def track_and_save(self, box=None, roi=None, resume=True):
+            # The box and initial ROI of an interrupted run of this video are used if none are given (not when restarting)
+            checkpoint = TrackingCheckpoint(self.output_dir, self.base_name, os.path.basename(self.video_path),
+                                            self._tracking_settings(), len(LOCATION_COLUMNS))
+            saved_box, saved_roi = checkpoint.saved_selection() if resume else (None, None)
+            box = box if box is not None else saved_box
+            roi = roi if roi is not None else saved_roi
+
+            # Manually select box (or use the given box)
+            box = self.select_and_save_box(box)
 
             # Select ROI and initialize variables
-            frame, roi = self.select_roi()
-
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            self.out_video = cv2.VideoWriter(self.output_video_filename, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
-
-            with open(self.csv_filename, mode='w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["Time (seconds)", "X", "Y", "angle (degrees)"])
-
-                frame_number = 0
-                while True:
-                    ret, frame = self.cap.read()
-                    if not ret:
-                        break
-
-                    if frame_number < len(self.timestamps):
-                        time_seconds = self.timestamps[frame_number]
-                    else:
-                        raise IndexError(f"No timestamp for frame {frame_number}")
-
-                    # Update ROI based on object position
-                    frame, roi = self.update_roi_center(frame, roi)
-
-                    # Get center of the updated ROI
-                    x, y, w, h = [int(v) for v in roi]
-                    center_x = x + w // 2
-                    center_y = y + h // 2
-                    #print(center_x)
-                    #print(center_y)
-                    # Calculate the orientation (assuming square ROI, otherwise, use angle of bounding box)
-                    angle = 0  # We can skip angle computation for this simple case
-
-                    # Write data to CSV
-                    writer.writerow([time_seconds, center_x, center_y, angle])
-
-                    # Write the frame to the output video
+            frame, roi = self.select_roi(roi)
+            initial_roi = roi
+
+            # Continue an interrupted run at its last checkpoint (the annotated video cannot be continued)
+            written = []
+            start_frame = 0
+            resume_point = checkpoint.resume_point(box, roi) if resume and not self.write_video else None
+            if resume_point is not None:
+                start_frame, roi, written = resume_point
+                print(f"[INFO] Resuming the interrupted tracking run at frame {start_frame} ({len(written)} frames already tracked)")
+            checkpoint.begin(box, initial_roi, written)
+
+            # Start tracking at the first frame (the frame used for the selection is tracked as well) or the checkpoint
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            self.motion_model = None
+
+            # The annotated video is only written on request (never by the lean path)
+            if self.write_video and not self.lean:
+                fourcc = cv2.VideoWriter_fourcc(*'XVID')
+                self.out_video = cv2.VideoWriter(self.output_video_filename, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+
+            frame_number = start_frame
+            self._start_frame = start_frame
+            stopped = False
+            start_time = time.perf_counter()
+            profiler = self.profiler
+            while True:
+                frame_start = profiler.start()
+                ret, frame = self.read_frame()
+                if not ret:
+                    break
+
+                if frame_number < len(self.timestamps):
+                    time_seconds = self.timestamps[frame_number]
+                else:
+                    raise IndexError(f"No timestamp for frame {frame_number}")
+
+                # Update ROI based on object position
+                frame, roi = self._update_roi(frame, roi)
+
+                # Sub-pixel centroid, orientation, area and confidence of the tracked blob
+                center_x, center_y, angle, area, confidence = self.roi_measurement(roi)
+                row = (frame_number, time_seconds, center_x, center_y, angle, area, confidence)
+                written.append(row)
+                checkpoint.add(row)
+
+                # Write the frame to the output video
+                if self.out_video is not None:
+                    t = profiler.start()
                     self.out_video.write(frame)
+                    profiler.stop("tracker.video_write", t)
 
-                    # Display the frame
+                # Display the frame
+                if not self.headless and not self.lean:
+                    t = profiler.start()
                     cv2.imshow("Tracking", frame)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                    key = cv2.waitKey(1) & 0xFF
+                    profiler.stop("tracker.imshow", t)
+                    if key == ord('q'):
+                        stopped = True
+                        frame_number += 1
                         break
 
-                    frame_number += 1
-
+                frame_number += 1
+                if frame_number % self.progress_interval == 0:
+                    self._report_progress(frame_number, start_time)
+                if frame_number % self.checkpoint_interval == 0:
+                    t = profiler.start()
+                    checkpoint.save(frame_number, roi)
+                    profiler.stop("tracker.checkpoint", t)
+                profiler.stop("tracker.frame", frame_start)
+
+            # Write the locations table once, in the chosen format. A stopped run keeps its checkpoint for a rerun.
+            self.write_locations(written)
+            if stopped:
+                checkpoint.save(frame_number, roi)
+                checkpoint.close()
+                print(f"[INFO] Tracking stopped at frame {frame_number}, run the tracker again to continue from there")
+            else:
+                checkpoint.finish()
+            self._report_progress(frame_number, start_time)
+            print(f"Tracking throughput ({'lean' if self.lean else 'annotated'} path): {self.tracking_fps:.1f} fps")
+            if self.frames_lost:
+                print(f"[WARNING] No contours found in {self.frames_lost} frames")
             self.cap.release()
-            self.out_video.release()
-            cv2.destroyAllWindows()
-            print(f"Tracking data saved to {self.csv_filename}")
-            print(f"Tracking video saved to {self.output_video_filename}")
+            self._destroy_windows()
+            print(f"Tracking data saved to {self.locations_filename}")
+            if self.out_video is not None:
+                self.out_video.release()
+                print(f"Tracking video saved to {self.output_video_filename}")
 
 # Used when this class is run seperately 
 if __name__ == "__main__":
-    video_file = r'C:\Users\stijn\OneDrive - University of Twente\Afstuderen\script\Setup\Main\Coated_pitch1_0_4hz_v2\Coated_pitch1_0_4hz_v2_cam2.avi'
-    tracker = VideoTracker(video_file)
-    tracker.track_and_save()
+    parser = argparse.ArgumentParser(description="Track the UMR in a recorded video.")
+    parser.add_argument("video", help="Recorded video (<name>_cam1.avi) or manifest of a segmented recording")
+    parser.add_argument("--config", help="JSON file with the box and the initial ROI")
+    parser.add_argument("--box", type=int, nargs=4, metavar=("X", "Y", "W", "H"), help="Box used for world scaling")
+    parser.add_argument("--roi", type=int, nargs=4, metavar=("X", "Y", "W", "H"), help="Initial ROI of the UMR")
+    parser.add_argument("--headless", action="store_true", help="Do not open any window")
+    parser.add_argument("--workers", type=int, default=1, help="Track chunks of the video in this many processes")
+    parser.add_argument("--lean", action="store_true", help="Measurement only: no annotation, display or _tracking.avi")
+    parser.add_argument("--write-video", action="store_true", help="Write the annotated _tracking.avi while tracking")
+    parser.add_argument("--predict", action="store_true", help="Search a Kalman-predicted window instead of the fixed ROI")
+    parser.add_argument("--format", default="csv", choices=["csv", "npz", "parquet"], help="Format of the box and locations tables")
+    parser.add_argument("--undistort", action="store_true", help="Remove the lens distortion before thresholding")
+    parser.add_argument("--restart", action="store_true", help="Track from frame 0 and select the box and ROI again, even if an interrupted run can be resumed")
+    parser.add_argument("--intrinsics", default=None, help="Intrinsics file (default: cameraCalibration/cam1_intrinsics.json)")
+    parser.add_argument("--profile", action="store_true", help="Measure the time per stage, saves <name>_profile.csv and <name>_trace.json")
+    args = parser.parse_args()
+
+    box, roi = load_tracking_config(args.config) if args.config else (None, None)
+    box = tuple(args.box) if args.box else box
+    roi = tuple(args.roi) if args.roi else roi
+
+    profiler = StageProfiler(enabled=True, trace=True) if args.profile else None
+    if args.profile and args.workers > 1:
+        print("[WARNING] --profile measures the tracking in this process only, the workers are not profiled")
+        profiler = None
+    if args.workers > 1 and args.write_video:
+        parser.error("--write-video is not supported with --workers > 1 (render the video afterwards with the TrackingRenderer)")
+    if args.workers > 1 and args.restart:
+        print("[WARNING] --restart has no effect with --workers > 1, the parallel tracker always tracks the whole video")
+    if args.workers > 1:
+        from include.ParallelTrackerClass import ParallelVideoTracker
+        tracker = ParallelVideoTracker(args.video, n_workers=args.workers, headless=args.headless, table_format=args.format,
+                                       undistort=args.undistort, intrinsics_file=args.intrinsics, predict=args.predict)
+    else:
+        tracker = VideoTracker(args.video, headless=args.headless, lean=args.lean, write_video=args.write_video,
+                               predict=args.predict, table_format=args.format, undistort=args.undistort,
+                               intrinsics_file=args.intrinsics, profiler=profiler)
+    if args.workers > 1:
+        tracker.track_and_save(box=box, roi=roi)
+    else:
+        tracker.track_and_save(box=box, roi=roi, resume=not args.restart)
+    if profiler is not None:
+        profiler.print_summary()
+        profiler.save(os.path.join(tracker.output_dir, tracker.base_name), args.format)
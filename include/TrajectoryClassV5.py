@@ -14,26 +14,45 @@ Main Workflow:
 - Loads object tracking data from two CSV files:
   - Camera 1: provides 2D image coordinates (X, Y).
   - Camera 2: provides depth-related information derived from Y-coordinates.
+- Takes the timestamps of the tracked frames from the recorder's frame log sidecar (<name>_frames.bin, or the sidecars
+  of all segments of a segmented recording) if it exists, otherwise the times in the CSV file are used.
+- Loads the intrinsics of camera 1 from the intrinsics file of CalibrationClass.py (cameraCalibration/cam1_intrinsics.json
+  by default), or falls back to the built-in MATLAB calibration if there is no such file.
+- Undistorts the tracked points (cv2.undistortPoints), unless the metadata of the locations table says they were
+  tracked on undistorted frames (VideoTracker with undistort=True).
 - Computes real-world scaling factors (mm/pixel) using the box visible in each camera's field of view.
 - Reconstructs the 3D position of the tracked object at each timestamp by combining:
   - 2D position from Camera 1,
   - Estimated depth from Camera 2,
   - Intrinsic camera parameters (focal length, optical center),
   - Geometric assumptions based on the pinhole camera model.
-- Saves the full 3D trajectory, including timestamps, to a CSV file.
+- Saves the full 3D trajectory, including timestamps, to a table (CSV by default, NPZ or Parquet with table_format).
+- The locations and box tables are read in whatever format the tracker wrote them (see TableClass.py).
+- A long-format locations file of the MultiObjectTracker (with an Object column) is split: one object is
+  reconstructed per instance (object_id) and saved to <name>_object<id>_Trajectory.csv.
 - Visualizes the result using matplotlib:
   - 3D trajectory in world coordinates.
   - 2D projections from both camera views.
   - Object velocity over time, smoothed with a moving average filter.
+- With a StageProfiler (profiler=..., see ProfilerClass.py, --profile on the command line) the stages are measured:
+  reconstruct.load, reconstruct.timestamps, reconstruct.undistort, reconstruct.project, reconstruct.save and
+  reconstruct.plot (drawing and saving the figure, not the time the window is shown).
 
 Methods:
-- __init__(csv_file_cam1, csv_file_cam2): Initializes the class with the paths to the two CSV files containing tracking data.
+- __init__(csv_file_cam1, object_id, table_format, intrinsics_file, profiler): Initializes the class with the path to the locations table containing tracking data (and the object to reconstruct).
 - load_mm_per_pixel_from_box(csv_path, real_width_mm, real_height_mm): Calculates scaling factors from calibration box CSV.
 - camera_to_box_distance(L_real_mm, L_pixels, focal_length_px):Computes camera-to-object distance using pinhole camera geometry.
-- reconstruct(): Reconstructs the 3D trajectory by converting 2D points and depth into world coordinates, then saves the 3D points to a CSV file.
-- plot_trajectory(): Plots the 3D trajectory of the tracked object and visualizes the 2D projections from both cameras.
+- reconstruct(depth_m): Reconstructs the 3D trajectory by converting 2D points and depth into world coordinates, then saves the 3D points to a CSV file.
+- plot_trajectory(save_path, show): Plots the 3D trajectory of the tracked object and visualizes the 2D projections from both cameras (saved to save_path, e.g. a PNG, if given; shown unless show=False).
 - plot_velocity():Displays a smoothed velocity graph based on 3D displacement over time.
 
+The back-projection itself is the batched function pinhole_reconstruct(), which also takes per-frame depths and many
+stacked trajectories at once (see benchmarks/bench_reconstruct.py).
+
+Functions:
+- object_ids(csv_file_cam1): Returns the object IDs in a multi-object locations file.
+- pinhole_reconstruct(x_px, y_px, depth_m, camera_matrix): Batched back-projection of pixel coordinates to mm.
+
 Author: Stijn Kolkman (s.y.kolkman@student.utwente.nl)
 Date: April 2025
 """
@@ -46,35 +65,128 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import os
 
+try:
+    from include.FrameLogClass import frame_log_timestamps
+    from include.SegmentClass import load_recording_frame_log
+    from include.TableClass import find_table, read_table, read_table_metadata, table_base, write_table
+    from include.CalibrationClass import DEFAULT_INTRINSICS_FILE, load_intrinsics
+    from include.ProfilerClass import StageProfiler
+except ImportError:  # When this file is run directly from the include folder
+    from FrameLogClass import frame_log_timestamps
+    from SegmentClass import load_recording_frame_log
+    from TableClass import find_table, read_table, read_table_metadata, table_base, write_table
+    from CalibrationClass import DEFAULT_INTRINSICS_FILE, load_intrinsics
+    from ProfilerClass import StageProfiler
+
+def object_ids(csv_file_cam1):
+    # Object IDs in a long-format locations file of the MultiObjectTracker ([] for a single object file)
+    data = read_table(csv_file_cam1)
+    if 'Object' not in data:
+        return []
+    return sorted(int(v) for v in np.unique(data['Object']))
+
+def pinhole_reconstruct(x_px, y_px, depth_m, camera_matrix):
+    """
+    Batched pinhole back-projection of (undistorted) pixel coordinates.
+    x_px, y_px: arrays of shape (..., N), one or more stacked trajectories of N samples (pad shorter ones with NaN).
+    depth_m: camera-object distance in m, broadcastable to (..., N): a scalar, one value per trajectory (..., 1) or
+    one value per sample.
+    Returns an array of shape (..., 3, N) with X, Y and Z in mm relative to the first sample of every trajectory
+    (Z is the change in depth, zero for a constant depth).
+    """
+    x_px = np.asarray(x_px, dtype=np.float64)
+    y_px = np.asarray(y_px, dtype=np.float64)
+    depth_m = np.broadcast_to(np.asarray(depth_m, dtype=np.float64), x_px.shape)
+
+    points = np.empty(x_px.shape[:-1] + (3, x_px.shape[-1]), dtype=np.float64)
+    X_3d, Y_3d, Z_3d = points[..., 0, :], points[..., 1, :], points[..., 2, :]
+
+    # X = (x - cx) * Z / fx and Y = (y - cy) * Z / fy, computed in place in the output
+    np.subtract(x_px, camera_matrix[0, 2], out=X_3d)
+    X_3d *= depth_m
+    X_3d *= 1000 / camera_matrix[0, 0]
+    np.subtract(y_px, camera_matrix[1, 2], out=Y_3d)
+    Y_3d *= depth_m
+    Y_3d *= 1000 / camera_matrix[1, 1]
+    np.multiply(depth_m, 1000, out=Z_3d)
+
+    # Make the first position of every trajectory 0,0,0
+    points -= points[..., :1].copy()
+    return points
+
 class TrajectoryReconstructor:
-    def __init__(self, csv_file_cam1):
-        
-        # Load the CSV files using pandas.
+    def __init__(self, csv_file_cam1, object_id=None, table_format="csv", intrinsics_file=None, profiler=None):
+        # Time per stage, a disabled profiler costs almost nothing
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        t = self.profiler.start()
+
+        # Load the locations table (CSV, NPZ or Parquet, see TableClass.py) into pandas.
         self.csv_file_cam1 = csv_file_cam1
+        self.table_format = table_format  # Format of the _Trajectory table
         self.output_dir = os.path.dirname(csv_file_cam1)
-        base = os.path.basename(csv_file_cam1)
-        self.base_name = base.replace("_cam1_locations.csv", "")
-        self.data_cam1 = pd.read_csv(csv_file_cam1)
+        base = os.path.basename(table_base(csv_file_cam1))
+        self.base_name = base.replace("_cam1_locations", "")
+        self.data_cam1 = pd.DataFrame(read_table(csv_file_cam1))
+
+        # A long-format file of the MultiObjectTracker holds several objects, reconstruct one of them
+        self.object_id = object_id
+        if 'Object' in self.data_cam1.columns:
+            objects = sorted(int(v) for v in self.data_cam1['Object'].unique())
+            if object_id is None:
+                if len(objects) > 1:
+                    raise ValueError(f"{csv_file_cam1} contains objects {objects}, choose one with object_id")
+                self.object_id = objects[0]
+            self.data_cam1 = self.data_cam1[self.data_cam1['Object'] == self.object_id].reset_index(drop=True)
+            if self.data_cam1.empty:
+                raise ValueError(f"Object {self.object_id} not found in {csv_file_cam1}")
         
         # Extract X, Y coordinates
         self.x_cam1 = self.data_cam1['X'].to_numpy()
         self.y_cam1 = self.data_cam1['Y'].to_numpy() 
         self.timestamps = self.data_cam1['Time (seconds)'].to_numpy()  # Assuming timestamps are the same for both cameras
-
-        # Camera calibration parameters
-        self.camera_matrix1 = np.array([
-            [1397.9,   0, 953.6590],
-            [   0, 1403.0, 555.1515],
-            [   0,   0,   1]
-        ], dtype=np.float64)
-        self.dist_coeffs1 = np.array([0.1216, -0.1727, 0.00, 0.00, 0.0], dtype=np.float64)
-
-        #Compensate for the distortion
-        points_cam1 = np.column_stack((self.x_cam1, self.y_cam1)).astype(np.float32)
-        undistorted_cam1 = cv2.undistortPoints(points_cam1, self.camera_matrix1, self.dist_coeffs1, P=self.camera_matrix1)
-        undistorted_cam1 = undistorted_cam1.reshape(-1, 2)
-        self.x_cam1 = undistorted_cam1[:, 0]
-        self.y_cam1 = undistorted_cam1[:, 1]
+        t = self.profiler.lap("reconstruct.load", t)
+
+        # Use the capture times of the frame log sidecar for the tracked frames, if the recording has one
+        records = load_recording_frame_log(self.output_dir, self.base_name) if 'Frame' in self.data_cam1.columns else None
+        if records is not None:
+            capture_times = frame_log_timestamps(records)
+            frames = self.data_cam1['Frame'].to_numpy()
+            if len(frames) and frames.max() < len(capture_times):
+                self.timestamps = capture_times[frames]
+                print(f"[INFO] Using capture timestamps from the frame log of {self.base_name}")
+            else:
+                print(f"[WARNING] Frame log of {self.base_name} does not cover all tracked frames, using the CSV times")
+        t = self.profiler.lap("reconstruct.timestamps", t)
+
+        # Camera calibration parameters, from the intrinsics file of CalibrationClass.py if there is one
+        intrinsics_file = intrinsics_file or DEFAULT_INTRINSICS_FILE
+        if os.path.exists(intrinsics_file):
+            self.camera_matrix1, self.dist_coeffs1, _ = load_intrinsics(intrinsics_file)
+            print(f"[INFO] Using camera intrinsics from {intrinsics_file}")
+        else:
+            print(f"[WARNING] No intrinsics file {intrinsics_file}, using the built-in MATLAB calibration")
+            self.camera_matrix1 = np.array([
+                [1397.9,   0, 953.6590],
+                [   0, 1403.0, 555.1515],
+                [   0,   0,   1]
+            ], dtype=np.float64)
+            self.dist_coeffs1 = np.array([0.1216, -0.1727, 0.00, 0.00, 0.0], dtype=np.float64)
+
+        # Points tracked on undistorted frames (VideoTracker with undistort=True) are already undistorted, with the
+        # camera matrix that was used for the undistortion
+        metadata = read_table_metadata(csv_file_cam1)
+        if metadata.get("undistorted"):
+            self.camera_matrix1 = np.array(metadata["camera_matrix"], dtype=np.float64)
+            self.dist_coeffs1 = np.array(metadata["dist_coeffs"], dtype=np.float64)
+            print(f"[INFO] {self.base_name} was tracked on undistorted frames, the points are not undistorted again")
+        else:
+            #Compensate for the distortion
+            points_cam1 = np.column_stack((self.x_cam1, self.y_cam1)).astype(np.float32)
+            undistorted_cam1 = cv2.undistortPoints(points_cam1, self.camera_matrix1, self.dist_coeffs1, P=self.camera_matrix1)
+            undistorted_cam1 = undistorted_cam1.reshape(-1, 2)
+            self.x_cam1 = undistorted_cam1[:, 0]
+            self.y_cam1 = undistorted_cam1[:, 1]
+            self.profiler.stop("reconstruct.undistort", t)
 
         # Initialize 3D points to None
         self.points_3d = None
@@ -83,17 +195,17 @@ class TrajectoryReconstructor:
         self.real_box_width_cam1_mm = 108    # Width as seen from camera 1 (top/bottom view)
         self.real_box_height_cam1_mm = 56    # Height as seen from camera 1
 
-        # Load box CSVs and compute mm-per-pixel scales
-        box_file_cam1 = self.csv_file_cam1.replace("_locations.csv", "_box.csv")
+        # Load box tables and compute mm-per-pixel scales
+        box_file_cam1 = table_base(self.csv_file_cam1).replace("_locations", "_box")
         (self.box_x_cam1, self.box_y_cam1, self.width_px_cam1,self.height_px_cam1, self.mm_per_pixel_x_cam1,self.mm_per_pixel_y_cam1) = self.load_mm_per_pixel_from_box(box_file_cam1, self.real_box_width_cam1_mm, self.real_box_height_cam1_mm)
 
     def load_mm_per_pixel_from_box(self, csv_path, real_width_mm=None, real_height_mm=None):
         """
-        Loads a box file and calculates mm-per-pixel scaling based on real-world dimensions.
+        Loads a box table (any format) and calculates mm-per-pixel scaling based on real-world dimensions.
         Returns (mm_per_pixel_x, mm_per_pixel_y)
         """
-        if os.path.exists(csv_path):
-            box_data = pd.read_csv(csv_path)
+        if find_table(csv_path) is not None:
+            box_data = read_table(csv_path)
             width_px = float(box_data["Width"][0])
             height_px = float(box_data["Height"][0])
             x = float(box_data["X"][0])
@@ -110,47 +222,21 @@ class TrajectoryReconstructor:
         D_camera_box =(focal_length_px * L_real_m) / L_pixels
         return D_camera_box
     
-    def reconstruct(self):
-        """Reconstructs the 3D trajectory using mm-per-pixel scaling based on known box dimensions."""
-        # Get the focal lengths and the optical centers
-        fx_cam1 = self.camera_matrix1[0,0]
-        fy_cam1 = self.camera_matrix1[1,1]
-
-        cx_cam1 = self.camera_matrix1[0, 2]
-        cy_cam1 = self.camera_matrix1[1, 2]
-
-        # Initialize the distances and 3d location
-        Z1 = np.zeros_like(self.x_cam1, dtype=np.float64)
-        X_3d = np.zeros_like(self.x_cam1, dtype=np.float64)
-        Y_3d = np.zeros_like(self.x_cam1, dtype=np.float64)
-        Z_3d = np.zeros_like(self.x_cam1, dtype=np.float64)
-
+    def reconstruct(self, depth_m=None):
+        """Reconstructs the 3D trajectory using mm-per-pixel scaling based on known box dimensions.
+        depth_m: distance between camera 1 and the object (m), one value per frame. By default the distance between
+        camera 1 and the box is used for every frame."""
         # Calculate the initial distance between the camera and the box
-        cam1_to_box_distance = self.camera_to_box_distance(self.real_box_width_cam1_mm,self.width_px_cam1,fx_cam1)
-        #print(f"The initial distance from camera 1 to the object is: {cam1_to_box_distance}m")
-
-        # Calculate the initial distance between the object and the camera's
-        Z1[:] = cam1_to_box_distance # Distance between object and camera1 at time=0
-        print(f"The distance from camera 1 to the object is: {Z1[0]}m")
-
-        # Loop to calculate the 3d position and update the distances per timestep
-        for i, value in enumerate(self.x_cam1):
-            X_3d[i] = (self.x_cam1[i] - cx_cam1)*Z1[i]/fx_cam1
-            Y_3d[i] = (self.y_cam1[i] - cy_cam1)*Z1[i]/fy_cam1
-            Z_3d[i] = 0 #just make it zero, since it moves straight
-
-        # Make the first position 0,0,0
-        X_3d -= X_3d[0]
-        Y_3d -= Y_3d[0]
-        Z_3d -= Z_3d[0]
-
-        # Convert to millimeter
-        X_3d *= 1000
-        Z_3d *= 1000
-        Y_3d *= 1000
+        if depth_m is None:
+            cam1_to_box_distance = self.camera_to_box_distance(self.real_box_width_cam1_mm, self.width_px_cam1, self.camera_matrix1[0, 0])
+            print(f"The distance from camera 1 to the object is: {cam1_to_box_distance}m")
+            depth_m = cam1_to_box_distance
 
-        # Stack the coordinates into a 3D array (X, Y, Z)
-        self.points_3d = np.vstack((X_3d, Y_3d, Z_3d))
+        # Back-project all frames at once (X and Y in mm relative to the first position, Z is the change in depth)
+        t = self.profiler.start()
+        self.points_3d = pinhole_reconstruct(self.x_cam1, self.y_cam1, depth_m, self.camera_matrix1)
+        X_3d, Y_3d, Z_3d = self.points_3d
+        t = self.profiler.lap("reconstruct.project", t)
 
         # Save the 3D points with timestamps into a DataFrame
         self.points_with_timestamp = pd.DataFrame({
@@ -161,20 +247,25 @@ class TrajectoryReconstructor:
         })
 
         # Generate the output file name based on the input file name
-        output_file_name = os.path.basename(self.csv_file_cam1)
-        output_file_path = os.path.join(self.output_dir, f"{self.base_name}_Trajectory.csv")
+        if self.object_id is None:
+            output_file_path = os.path.join(self.output_dir, f"{self.base_name}_Trajectory")
+        else:
+            output_file_path = os.path.join(self.output_dir, f"{self.base_name}_object{self.object_id}_Trajectory")
 
-        # Save the DataFrame to CSV
-        self.points_with_timestamp.to_csv(output_file_path, index=False)
+        # Save the trajectory table (CSV by default)
+        self.output_file = write_table(output_file_path, {name: self.points_with_timestamp[name].to_numpy()
+                                                          for name in self.points_with_timestamp.columns}, self.table_format)
+        self.profiler.stop("reconstruct.save", t)
 
         return self.points_with_timestamp
 
-    def plot_trajectory(self):
+    def plot_trajectory(self, save_path=None, show=True):
         if self.points_3d is None:
             print("No 3D points to plot. Call 'reconstruct()' first.")
             return
 
         # Extract 3D coordinates
+        t = self.profiler.start()
         x_coords = self.points_3d[0, :]
         y_coords = self.points_3d[1, :]
         z_coords = self.points_3d[2, :]
@@ -227,12 +318,41 @@ class TrajectoryReconstructor:
         ax_cam1.set_ylim(cam_height, 0)
 
         plt.tight_layout()
-        plt.show()
+
+        # Save the figure (e.g. in a background job without a screen) and/or show it
+        if save_path is not None:
+            fig.savefig(save_path, dpi=150)
+            print(f"[INFO] Trajectory plot saved to {save_path}")
+        self.profiler.stop("reconstruct.plot", t)
+        if show:
+            plt.show()
+        else:
+            plt.close(fig)
 
 # # Used when this class is run seperately 
 if __name__ == "__main__":
-    # update names if needed
-    csv_file_cam1 = r"C:\Users\stijn\OneDrive - University of Twente\Afstuderen\script\Setup\Main\Coated_pitch1_0_4hz_v2\Coated_pitch1_0_4hz_v2_cam1_locations.csv"
-    traj_reconstructor = TrajectoryReconstructor(csv_file_cam1)
-    traj_reconstructor.reconstruct()
-    traj_reconstructor.plot_trajectory()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Reconstruct and plot the trajectory from a locations file.")
+    parser.add_argument("csv_file_cam1", help="Locations table of camera 1 (<name>_cam1_locations.csv, .npz or .parquet)")
+    parser.add_argument("--object", type=int, default=None, help="Object ID in a multi-object locations file (default: all)")
+    parser.add_argument("--format", default="csv", choices=["csv", "npz", "parquet"], help="Format of the _Trajectory table")
+    parser.add_argument("--intrinsics", default=None, help="Intrinsics file of camera 1 (default: cameraCalibration/cam1_intrinsics.json)")
+    parser.add_argument("--save-plot", action="store_true", help="Save the plot as <output>_Trajectory.png instead of showing it")
+    parser.add_argument("--profile", action="store_true", help="Measure the time per stage, saves <name>_reconstruct_profile.csv")
+    args = parser.parse_args()
+    profiler = StageProfiler(enabled=True) if args.profile else None
+
+    # Every object of a multi-object locations file is reconstructed separately
+    objects = [args.object] if args.object is not None else (object_ids(args.csv_file_cam1) or [None])
+    for object_id in objects:
+        traj_reconstructor = TrajectoryReconstructor(args.csv_file_cam1, object_id=object_id, table_format=args.format,
+                                                     intrinsics_file=args.intrinsics, profiler=profiler)
+        traj_reconstructor.reconstruct()
+        if args.save_plot:
+            plot_file = os.path.splitext(traj_reconstructor.output_file)[0] + ".png"
+            traj_reconstructor.plot_trajectory(save_path=plot_file, show=False)
+        else:
+            traj_reconstructor.plot_trajectory()
+    if profiler is not None:
+        profiler.print_summary()
+        profiler.save(os.path.join(traj_reconstructor.output_dir, f"{traj_reconstructor.base_name}_reconstruct"), args.format)
@@ -0,0 +1,112 @@
+"""
+Undistorter Class
+
+Removes the lens distortion from whole frames or from a region of interest with precomputed remap tables. The tables
+(cv2.initUndistortRectifyMap, fixed-point CV_16SC2 format for the fastest cv2.remap) are computed once per calibration
+and frame size and cached on disk, so the tracker processes share them. A full 1080p frame still costs a remap of
+every pixel (about as much as cv2.undistort), the gain comes from remapping only what is used: the ROI of the tracker
+(a fraction of a millisecond) or the resized preview of the recorder.
+
+The undistorted image uses the camera matrix of the calibration as its own camera matrix and has the same size as
+the frame, so pixel coordinates measured on undistorted frames can be used in the pinhole model directly (the
+TrajectoryReconstructor then skips its cv2.undistortPoints step, see the metadata written by the VideoTracker).
+
+Main Workflow:
+- The intrinsics are loaded from the intrinsics file of CalibrationClass.py (cameraCalibration/cam1_intrinsics.json).
+- The remap tables for the frame size are loaded from the map cache (cameraCalibration/undistort_cache), or computed
+  and saved there. The cache file name is a hash of the camera matrix, distortion coefficients and frame size, so a
+  new calibration never uses old tables.
+- undistort(frame) remaps the whole frame, undistort_roi(frame, roi) only computes the pixels of the ROI of the
+  undistorted frame (the tables are simply sliced, the source pixels are looked up in the full distorted frame).
+- scaled(size) returns an undistorter for a resized frame (the preview of the recorder), with a scaled camera matrix.
+
+Methods:
+- __init__(camera_matrix, dist_coeffs, frame_size, cache_dir): Loads or computes the remap tables for one frame size.
+- undistort(frame, dst): Undistorts a whole frame (into dst if given).
+- undistort_roi(frame, roi, dst): Undistorts only the ROI (x, y, w, h, in undistorted coordinates) of a frame.
+- scaled(size): Returns an undistorter for frames resized to size.
+- metadata(): Returns the description of the undistortion that is stored with the tracking results.
+
+Functions:
+- load_undistorter(frame_size, intrinsics_file): Creates an undistorter from an intrinsics file.
+"""
+
+import hashlib
+import os
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from include.CalibrationClass import CALIBRATION_DIR, DEFAULT_INTRINSICS_FILE, load_intrinsics
+except ImportError:  # When this file is run directly from the include folder
+    from CalibrationClass import CALIBRATION_DIR, DEFAULT_INTRINSICS_FILE, load_intrinsics
+
+DEFAULT_MAP_CACHE_DIR = os.path.join(CALIBRATION_DIR, "undistort_cache")
+
+def load_undistorter(frame_size, intrinsics_file=None):
+    intrinsics_file = intrinsics_file or DEFAULT_INTRINSICS_FILE
+    camera_matrix, dist_coeffs, _ = load_intrinsics(intrinsics_file)
+    undistorter = Undistorter(camera_matrix, dist_coeffs, frame_size)
+    undistorter.intrinsics_file = intrinsics_file
+    return undistorter
+
+class Undistorter:
+    def __init__(self, camera_matrix, dist_coeffs, frame_size, cache_dir=DEFAULT_MAP_CACHE_DIR):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).reshape(-1)
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))  # (width, height)
+        self.cache_dir = cache_dir
+        self.intrinsics_file = None
+        self.map1, self.map2 = self._load_maps()
+
+    def _cache_file(self):
+        # The tables depend on nothing else than the intrinsics and the frame size
+        key = hashlib.sha1(self.camera_matrix.tobytes() + self.dist_coeffs.tobytes()
+                           + np.array(self.frame_size, dtype=np.int64).tobytes()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"undistort_{self.frame_size[0]}x{self.frame_size[1]}_{key}.npz")
+
+    def _load_maps(self):
+        cache_file = self._cache_file() if self.cache_dir else None
+        if cache_file is not None and os.path.exists(cache_file):
+            with np.load(cache_file, allow_pickle=False) as archive:
+                return archive["map1"], archive["map2"]
+
+        start = time.perf_counter()
+        map1, map2 = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None, self.camera_matrix,
+                                                 self.frame_size, cv2.CV_16SC2)
+        print(f"[INFO] Undistortion maps for {self.frame_size[0]}x{self.frame_size[1]} computed in "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+        if cache_file is not None:
+            # Written to a temporary file first, a second process never reads a half written cache file
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(temporary_file, "wb") as f:
+                np.savez(f, map1=map1, map2=map2)
+            os.replace(temporary_file, cache_file)
+        return map1, map2
+
+    def undistort(self, frame, dst=None):
+        # Pixels outside the distorted frame repeat the edge, black corners would be found as dark blobs
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst, borderMode=cv2.BORDER_REPLICATE)
+
+    def undistort_roi(self, frame, roi, dst=None):
+        # The slices of the tables point to the source pixels of the ROI in the full (distorted) frame
+        x, y, w, h = [int(v) for v in roi]
+        return cv2.remap(frame, self.map1[y:y+h, x:x+w], self.map2[y:y+h, x:x+w], cv2.INTER_LINEAR, dst=dst,
+                         borderMode=cv2.BORDER_REPLICATE)
+
+    def scaled(self, size):
+        # Same lens for a resized frame: the focal lengths and the principal point scale with the frame
+        scale_x = size[0] / self.frame_size[0]
+        scale_y = size[1] / self.frame_size[1]
+        camera_matrix = self.camera_matrix.copy()
+        camera_matrix[0] *= scale_x
+        camera_matrix[1] *= scale_y
+        return Undistorter(camera_matrix, self.dist_coeffs, size, self.cache_dir)
+
+    def metadata(self):
+        return {"undistorted": True, "intrinsics_file": self.intrinsics_file,
+                "camera_matrix": self.camera_matrix.tolist(), "dist_coeffs": self.dist_coeffs.tolist()}
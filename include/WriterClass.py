@@ -0,0 +1,169 @@
+"""
+AsyncVideoWriter Class
+
+This class moves the encoding of recorded frames off the capture path. Frames are copied into a bounded pool of
+preallocated buffers and a background thread hands them to the cv2.VideoWriter. When the encoder cannot keep up
+and every buffer is in use, the new frame is dropped (and counted) instead of stalling the camera. Besides raw BGR
+frames, the writer can also queue variable sized payloads (e.g. the JPEG data of an MJPG camera) for a MjpgAviWriter.
+
+Main Workflow:
+- The recorder creates the cv2.VideoWriter as before and wraps it in an AsyncVideoWriter.
+- The capture thread calls push(frame) for every frame, this only copies the frame into a free buffer.
+- The writer thread encodes the queued frames in order and returns the buffers to the pool.
+- When a FrameLogWriter is given, the writer thread logs the metadata of every frame it wrote, so the sidecar
+  describes exactly the frames in the video file (in file order).
+- When the recording stops, close() writes the frames that are still queued and releases the writer.
+- The queue depth, the number of written frames and the number of dropped frames can be read with stats() and are
+  saved per recording with save_stats().
+- With an enabled StageProfiler (see ProfilerClass.py) the writer thread measures writer.write (the encoding) per frame.
+
+Methods:
+- __init__(writer, frame_shape, queue_size, max_payload_bytes, frame_log, profiler): Preallocates the frame buffers for the given
+  writer. Pass frame_shape=None and max_payload_bytes to queue variable sized payloads instead of fixed size frames.
+- start(prefill): Starts the background writer thread. The (frame, metadata) pairs of prefill (e.g. the frames of the
+  pre-trigger buffer) are written by the writer thread before the queued frames.
+- push(frame, metadata): Queues a copy of the frame, returns False if the frame was dropped because the queue was full.
+  metadata is a (capture_seq, capture_ns, pos_msec) tuple that is passed to the frame log once the frame is written.
+- stats(): Returns a dict with the current queue depth, the maximum queue depth, written and dropped frames.
+- close(): Writes the remaining frames, stops the writer thread and releases the writer (and closes the frame log).
+- save_stats(csv_path): Saves the stats of this recording to a CSV file.
+"""
+
+import csv
+import queue
+import threading
+import time
+
+import numpy as np
+
+try:
+    from include.ProfilerClass import StageProfiler
+except ImportError:  # When this file is run directly from the include folder
+    from ProfilerClass import StageProfiler
+
+class AsyncVideoWriter:
+    def __init__(self, writer, frame_shape, queue_size=32, dtype=np.uint8, max_payload_bytes=None, frame_log=None,
+                 profiler=None):
+        self.writer = writer
+        self.frame_log = frame_log
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        self.frame_shape = tuple(frame_shape) if frame_shape is not None else None
+        self.max_payload_bytes = max_payload_bytes
+        self.queue_size = queue_size
+        if self.frame_shape is None and not max_payload_bytes:
+            raise ValueError("Either frame_shape or max_payload_bytes has to be given.")
+
+        # Preallocate all frame buffers once, the capture thread only copies into them.
+        # In payload mode every buffer is a flat array of max_payload_bytes and the used length is kept per slot.
+        buffer_shape = self.frame_shape if self.frame_shape is not None else (max_payload_bytes,)
+        self._buffers = [np.empty(buffer_shape, dtype=dtype) for _ in range(queue_size)]
+        self._lengths = [0] * queue_size
+        self._metadata = [None] * queue_size
+        self._free_slots = queue.Queue()
+        for slot in range(queue_size):
+            self._free_slots.put(slot)
+        self._queued_slots = queue.Queue()
+
+        # Counters: frames_pushed/frames_dropped are only changed by the pushing thread,
+        # frames_written only by the writer thread
+        self.frames_pushed = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        self.start_time = None
+        self.stop_time = None
+
+        self._thread = None
+
+    def start(self, prefill=None):
+        self.start_time = time.time()
+        self._thread = threading.Thread(target=self._write_loop, args=(prefill,), name="WriterThread", daemon=True)
+        self._thread.start()
+
+    def push(self, frame, metadata=None):
+        # Drop frames that do not fit the writer, cv2.VideoWriter would silently skip them anyway
+        if self.frame_shape is None:
+            frame = frame.reshape(-1)
+            if frame.size > self.max_payload_bytes:
+                self.frames_dropped += 1
+                return False
+        elif frame.shape != self.frame_shape:
+            self.frames_dropped += 1
+            return False
+
+        try:
+            slot = self._free_slots.get_nowait()
+        except queue.Empty:
+            # The encoder is behind and all buffers are in use: drop this frame instead of blocking the camera
+            self.frames_dropped += 1
+            return False
+
+        if self.frame_shape is None:
+            self._buffers[slot][:frame.size] = frame
+            self._lengths[slot] = frame.size
+        else:
+            np.copyto(self._buffers[slot], frame)
+        self._metadata[slot] = metadata
+        self._queued_slots.put(slot)
+        self.frames_pushed += 1
+
+        depth = self._queued_slots.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def _write_loop(self, prefill):
+        # Frames that were captured before the recording started come first, the live frames wait in the queue
+        if prefill is not None:
+            for frame, metadata in prefill:
+                if frame is not None:
+                    self._write(frame, metadata)
+
+        while True:
+            slot = self._queued_slots.get()
+            if slot is None:
+                break
+            if self.frame_shape is None:
+                self._write(self._buffers[slot][:self._lengths[slot]], self._metadata[slot])
+            else:
+                self._write(self._buffers[slot], self._metadata[slot])
+            self._free_slots.put(slot)
+
+    def _write(self, frame, metadata):
+        t = self.profiler.start()
+        self.writer.write(frame)
+        self.profiler.stop("writer.write", t)
+        self.frames_written += 1
+        if self.frame_log is not None and metadata is not None:
+            self.frame_log.append(*metadata)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queued_slots.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_size": self.queue_size,
+            "frames_pushed": self.frames_pushed,
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+        }
+
+    def close(self):
+        # The sentinel is queued after the last frame, so every pushed frame is written before the thread stops
+        if self._thread is not None:
+            self._queued_slots.put(None)
+            self._thread.join()
+            self._thread = None
+        self.stop_time = time.time()
+        self.writer.release()
+        if self.frame_log is not None:
+            self.frame_log.close()
+
+    def save_stats(self, csv_path):
+        stats = self.stats()
+        duration = (self.stop_time or time.time()) - (self.start_time or time.time())
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Statistic", "Value"])
+            for key in ("frames_pushed", "frames_written", "frames_dropped", "max_queue_depth", "queue_size"):
+                writer.writerow([key, stats[key]])
+            writer.writerow(["duration_s", f"{duration:.3f}"])
@@ -10,14 +10,26 @@ This script is designed to automate the process of:
 
 Main Workflow:
 - After the recording is completed, the 'on_recording_done' function is triggered.
-- The recorded video files are passed to the VideoTracker to extract tracking data.
-- The tracking data is saved in CSV format, which is then fed into the TrajectoryReconstructor for 3D trajectory reconstruction.
-- Finally, the trajectory is plotted.
+- The box and the ROI selected in the recorder ("Select box and ROI") are used, or if there are none they are selected
+  in the first frame of the recording (after the recorder has handled the stop). Then the recording is submitted to the
+  post-processing queue of the recorder and the recorder is immediately ready for the next recording.
+- In a background process the recording is tracked with the VideoTracker (headless), unless it was already tracked
+  live (LiveTracker, "Live tracking" in the recorder), then its locations table is used directly. If the live tracker
+  skipped frames, the recording is tracked again with the box and ROI of the live tracking.
+- The tracking data (CSV, or the table format of the recorder, see TableClass.py) is fed into the
+  TrajectoryReconstructor for 3D trajectory reconstruction, the trajectory plot is saved as <name>_Trajectory.png and
+  the annotated tracking video is rendered by the TrackingRenderer.
+- The state of the jobs is shown in the recorder window.
+- With --profile the recorder measures the time of every stage (capture, writer, preview, live tracking) and saves
+  <name>_profile.csv and <name>_trace.json next to every recording (see ProfilerClass.py).
+- With --source synthetic (or a recorded video) and --fps the recorder runs without a camera, e.g. to load test the
+  pipeline at 60 or 120 fps (see FrameSourceClass.py).
 
 Dependencies:
 - DualCameraApp (from RecorderClass.py): Provides GUI for dual camera video recording.
 - VideoTracker (from TrackerClass.py): Tracks objects in video recordings.
 - TrajectoryReconstructor (from TrajectoryClassV2.py): Reconstructs and plots the trajectory from tracking data.
+- PostProcessingQueue (from PostProcessingClass.py): Runs the tracking and reconstruction in background processes.
 
 Author: Stijn Kolkman (s.y.kolkman@student.utwente.nl)
 Date: April 2025
@@ -25,30 +37,59 @@ Date: April 2025
 
 from include.RecorderClassV2 import DualCameraApp
 from include.TrackerClassV3 import VideoTracker
-from include.TrajectoryClassV5 import TrajectoryReconstructor
+from include.ProfilerClass import StageProfiler
+from include.FrameSourceClass import open_frame_source
+import argparse
 import tkinter as tk
 
-# Function to be called after the recording process is finished, to start the tracker and trajectory generator
+# Function to be called after the recording process is finished, it submits the analysis to the background queue
 def on_recording_done():
     if hasattr(app, "recorded_file_names") and app.recorded_file_names:
         #Get the names of the recorded files
         cam1_file = app.recorded_file_names
         print("Recorded file names:", cam1_file)
 
-        # Apply the tracker on the recordings
-        tracker_cam1 = VideoTracker(cam1_file)
-        tracker_cam1.track_and_save()
-        csv_file_cam1 = tracker_cam1.csv_filename
-        
-        # Apply the trajectory generator on the data from the tracker
-        traj_reconstructor = TrajectoryReconstructor(csv_file_cam1)
-        traj_reconstructor.reconstruct()
-        traj_reconstructor.plot_trajectory()
+        # A live tracked recording does not have to be tracked again
+        if app.live_locations_file:
+            print(f"[INFO] Using the live tracking results: {app.live_locations_file}")
+            app.post_processing.submit(cam1_file, locations_file=app.live_locations_file, table_format=app.table_format)
+            return
+
+        # The live tracker skipped frames: track the whole recording again, from the box and ROI of the live tracking
+        if app.live_tracker1 is not None and app.live_box is not None:
+            app.post_processing.submit(cam1_file, box=app.live_box, roi=app.live_roi, table_format=app.table_format)
+            return
+
+        # The box and ROI selected in the recorder ("Select box and ROI") are used if there are any
+        if app.live_box is not None:
+            print(f"[INFO] Using the box {app.live_box} and ROI {app.live_roi} selected in the recorder")
+            app.post_processing.submit(cam1_file, box=app.live_box, roi=app.live_roi, table_format=app.table_format)
+            return
+
+        # Otherwise they are selected in the first frame of the recording. The selection windows block the GUI, so they
+        # are opened after the recorder has finished handling the stop of the recording
+        app.window.after(100, select_and_submit, cam1_file)
     else:
         print("No recordings were generated.")
 
-# Start the recorder GUI
-root = tk.Tk()
-app = DualCameraApp(root)
-app.set_recording_done_callback(on_recording_done)
-root.mainloop()
\ No newline at end of file
+# Selects the box and ROI in the first frame of a recording (the worker has no windows) and submits its analysis
+def select_and_submit(cam1_file):
+    tracker_cam1 = VideoTracker(cam1_file, table_format=app.table_format)
+    box = tracker_cam1.select_and_save_box()
+    _, roi = tracker_cam1.select_roi()
+    tracker_cam1.cap.release()
+    app.post_processing.submit(cam1_file, box=box, roi=roi, table_format=app.table_format)
+
+# Start the recorder GUI (guarded, worker processes import this file on Windows)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record, track and reconstruct the trajectory of the UMR.")
+    parser.add_argument("--profile", action="store_true", help="Measure the time per stage of the recorder, saved with every recording")
+    parser.add_argument("--source", default="camera", help='"camera", "camera:<index>", "synthetic" or a recorded video to replay (no camera needed)')
+    parser.add_argument("--fps", type=float, default=None, help="Frame rate of the camera or synthetic source, or the replay speed as a frame rate")
+    args = parser.parse_args()
+
+    root = tk.Tk()
+    app = DualCameraApp(root, profiler=StageProfiler(enabled=True, trace=True) if args.profile else None,
+                        frame_source=open_frame_source(args.source, fps=args.fps))
+    app.set_recording_done_callback(on_recording_done)
+    root.mainloop()